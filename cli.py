@@ -0,0 +1,5 @@
+from scripts.batch import main
+
+
+if __name__ == "__main__":
+    main()
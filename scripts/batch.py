@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import time
+# Figures are only saved to files (no tkinter backend)
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from scripts.simulation import simulate, getValues, getPlot
+from scripts.sweep import BLOCKS, saveTable
+from scripts.wdm import simulateWDM, wdmValues
+from scripts.stage_cache import StageCache
+from scripts.my_models import transferFunctionCache
+from scripts.fft_backend import setWorkers
+
+# Plot types of getPlot with their titles
+PLOTS = {"electricalTx": "Modulation signal", "electricalRx": "Detected signal",
+         "opticalTx": "Modulated signal", "opticalRx": "Reciever signal", "opticalSc": "Carrier signal",
+         "spectrumTx": "Tx spectrum signal", "spectrumRx": "Rx spectrum signal", "spectrumSc": "Carrier spectrum",
+         "constellationTx": "Tx constellation diagram", "constellationRx": "Rx constellation diagram",
+         "eyeTx": "Tx eyediagram", "eyeRx": "Rx eyediagram"}
+# Default memory cap of the stage cache (part of available memory, at most 2 GB)
+CACHE_FRACTION = 0.25
+CACHE_SIZE = 2 * 1024**3
+
+
+def main(arguments: list | None = None):
+    """
+    Command line entry point. Runs simulation for every config file and writes values (and plots) to output directory.
+    """
+    parser = argparse.ArgumentParser(description="Headless simulation of optical communication chain.")
+    parser.add_argument("configs", nargs="+", help="JSON or YAML config files (one file can contain list of configs)")
+    parser.add_argument("-o", "--output", default="results", help="output directory (default: results)")
+    parser.add_argument("-p", "--plots", nargs="*", default=None, choices=list(PLOTS) + ["all"],
+                        help="plots to save for every config (overrides Plots from config)")
+    parser.add_argument("-w", "--fft-workers", type=int, default=None, help="number of FFT threads (default: all cores)")
+    parser.add_argument("-c", "--cache-size", type=float, default=None,
+                        help="memory cap of cached stage results [MB], 0 disables the cache (default: quarter of available memory, at most 2048)")
+    arguments = parser.parse_args(arguments)
+
+    setWorkers(arguments.fft_workers)
+
+    configs = []
+    for path in arguments.configs:
+        configs.extend(loadConfigs(path))
+
+    # Configs share upstream stages results (e.g. same source and modulation with different channel)
+    cacheSize = defaultCacheSize() if arguments.cache_size is None else int(arguments.cache_size * 1024**2)
+    cache = StageCache(cacheSize) if cacheSize > 0 else None
+    # Cached fiber responses are limited by the same cap
+    transferFunctionCache.maxBytes = min(transferFunctionCache.maxBytes, cacheSize)
+    table = []
+    for name, config in configs:
+        print(f"Simulating {name}")
+        row = runConfig(name, config, arguments.output, cache, arguments.plots)
+        print(f"    {row.get('Error') or 'BER: ' + str(row.get('BER'))}")
+        table.append(row)
+
+        # Values of finished configs are kept even if the batch is killed
+        saveTable(table, os.path.join(arguments.output, "values.csv"))
+
+
+def defaultCacheSize() -> int:
+    """
+    Memory cap of the stage cache from available memory (CACHE_FRACTION of it, at most CACHE_SIZE).
+
+    Returns
+    -----
+    cap [B] (CACHE_SIZE if available memory is unknown)
+    """
+    try:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return CACHE_SIZE
+
+    return int(min(CACHE_SIZE, CACHE_FRACTION * available))
+
+
+def loadConfigs(path: str) -> list[tuple[str, dict]]:
+    """
+    Reads configs from JSON or YAML file.
+
+    Returns
+    -----
+    list of (name, config)
+    """
+    with open(path, "r") as file:
+        if path.lower().endswith((".yaml", ".yml")):
+            # YAML is optional dependency
+            try:
+                import yaml
+            except ImportError:
+                raise Exception("YAML config needs PyYAML package (pip install pyyaml)")
+            content = yaml.safe_load(file)
+        else:
+            content = json.load(file)
+
+    fileName = os.path.splitext(os.path.basename(path))[0]
+
+    # Single config
+    if isinstance(content, dict):
+        return [(content.get("Name", fileName), content)]
+    # List of configs
+    elif isinstance(content, list):
+        return [(config.get("Name", f"{fileName}_{i}"), config) for i, config in enumerate(content)]
+    else:
+        raise Exception(f"Unknown config structure in {path}")
+
+
+def configParameters(config: dict) -> dict:
+    """
+    Parameters for simulate() from config. (Same parameter dictionaries as in GUI)
+
+    Parameters
+    -----
+    config: General, Source, Modulator, Channel, Reciever, Amplifier (parameter dictionaries), IncludeAmplifier (bool)
+
+    General parameters need Format, Order, Rs and optionally SpS (default is 8)
+
+    Returns
+    -----
+    parameters: General, Source, Modulator, Channel, Reciever, Amplifier, IncludeAmplifier
+    """
+    includeAmplifier = config.get("IncludeAmplifier", False)
+
+    for block in BLOCKS:
+        # Amplifier parameters are needed only if amplifier is included
+        if block == "Amplifier" and not includeAmplifier:
+            continue
+        if block not in config:
+            raise Exception(f"Missing {block} parameters")
+
+    parameters = {block: dict(config.get(block, {})) for block in BLOCKS}
+    parameters.update({"IncludeAmplifier": includeAmplifier})
+
+    general = parameters.get("General")
+    general.update({"Format": general.get("Format").lower()})
+    general.setdefault("SpS", 8)
+
+    # OOK is created as 2 order PAM
+    if general.get("Format") == "ook":
+        general.update({"Format": "pam", "Order": 2})
+
+    general.update({"Fs": general.get("SpS") * general.get("Rs")})
+    general.update({"Ts": 1 / general.get("Fs")})
+
+    # Fs must be at least twice of reciever bandwidth
+    bandwidth = parameters.get("Reciever").get("Bandwidth")
+    if bandwidth != "inf" and general.get("Fs") < 2 * bandwidth:
+        raise Exception("Reciever bandwidth is too high for the symbol rate")
+
+    return parameters
+
+
+def runConfig(name: str, config: dict, outputDirectory: str, cache: StageCache | None = None, plots: list | None = None) -> dict:
+    """
+    Simulates one config. Values are saved to values.json and plots to png files in outputDirectory/name.
+
+    Parameters
+    -----
+    plots: plots to save (keys of PLOTS or "all"), None means Plots from config
+
+    Returns
+    -----
+    row of the values table (Name + values + Time + Error)
+    """
+    row = {"Name": name}
+    directory = os.path.join(outputDirectory, name)
+    os.makedirs(directory, exist_ok=True)
+
+    if plots is None:
+        plots = config.get("Plots", [])
+    if "all" in plots:
+        plots = list(PLOTS)
+
+    # Failed config doesn't stop the batch
+    try:
+        parameters = configParameters(config)
+        # Plot names are checked before the simulation
+        for plot in plots:
+            if plot not in PLOTS:
+                raise Exception(f"Unknown plot type: {plot}")
+
+        arguments = [parameters.get(block) for block in BLOCKS] + [parameters.get("IncludeAmplifier")]
+
+        # WDM simulation (values of each channel, without plots)
+        if "WDM" in config:
+            return runWDM(row, directory, config, parameters, arguments)
+
+        return runSimulation(row, directory, config, parameters, arguments, cache, plots)
+
+    except Exception as e:
+        row.update({"Error": str(e)})
+        return row
+
+
+def runSimulation(row: dict, directory: str, config: dict, parameters: dict, arguments: list, cache: StageCache | None, plots: list) -> dict:
+    """
+    Simulates single channel config. Values are saved to values.json and plots to png files.
+
+    Returns
+    -----
+    row of the values table (values + Time + Error)
+    """
+    start = time.time()
+    simulationResults = simulate(*arguments, cache, seed=config.get("Seed", 123), precision=config.get("Precision", "double"))
+
+    # Signal power is too low for amplifier detection
+    if simulationResults.get("recieverSignal") is None:
+        row.update({"Error": "Signal power is too low to be detected by amplifier"})
+        return row
+
+    values = {key: float(value) for key, value in getValues(simulationResults, parameters.get("General"), config.get("BEREstimator", "counting")).items()}
+    row.update(values)
+    row.update({"Time": time.time() - start, "Error": ""})
+
+    with open(os.path.join(directory, "values.json"), "w") as file:
+        json.dump({"Parameters": {block: parameters.get(block) for block in BLOCKS}, "Values": values}, file, indent=4)
+
+    failed = []
+    for plot in plots:
+        # Failed plot doesn't stop the batch (values are already saved)
+        try:
+            figure = getPlot(plot, PLOTS.get(plot), simulationResults, parameters.get("General"), parameters.get("Source"))[0]
+            figure.savefig(os.path.join(directory, f"{plot}.png"))
+            plt.close(figure)
+        except Exception as e:
+            print(f"    Plot {plot} failed: {e}")
+            failed.append(f"Plot {plot} failed: {e}")
+
+    row.update({"Error": "; ".join(failed)})
+
+    return row
+
+
+def runWDM(row: dict, directory: str, config: dict, parameters: dict, arguments: list) -> dict:
+    """
+    Simulates WDM config. Values of all channels are saved to values.json.
+
+    Returns
+    -----
+    row of the values table (values of the worst channel + Channel + Time + Error)
+    """
+    start = time.time()
+    wdmResults = simulateWDM(*arguments, config.get("WDM"), seed=config.get("Seed", 123), precision=config.get("Precision", "double"))
+
+    # Signal power is too low for amplifier detection
+    if wdmResults.get("wdmRx") is None:
+        row.update({"Error": "Signal power is too low to be detected by amplifier"})
+        return row
+
+    channelValues = [{key: float(value) for key, value in values.items()} for values in wdmValues(wdmResults, parameters.get("General"), config.get("BEREstimator", "counting"))]
+
+    with open(os.path.join(directory, "values.json"), "w") as file:
+        json.dump({"Parameters": {block: parameters.get(block) for block in BLOCKS}, "WDM": config.get("WDM"), "Channels": channelValues}, file, indent=4)
+
+    # Worst channel in the table
+    worst = max(range(len(channelValues)), key=lambda k: channelValues[k].get("BER"))
+    row.update(channelValues[worst])
+    row.update({"Channel": worst, "Time": time.time() - start, "Error": ""})
+
+    return row
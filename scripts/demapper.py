@@ -0,0 +1,377 @@
+from functools import lru_cache
+import numpy as np
+from optic.comm.modulation import GrayMapping
+from optic.dsp.core import pnorm, signal_power
+from scipy.special import erfc
+
+
+def demodulateGray(symb, M: int, constType: str) -> np.ndarray:
+    """
+    Demodulate symbol sequence to bit sequence (w/ Gray mapping). Gives the same bits as demodulateGray from OpticommPY package.
+
+    Instead of distances to all constellation points only the neighbouring points of the decision region are checked
+    (I/Q slicing for PAM and square QAM, angle quantization for PSK).
+
+    Parameters
+    -----
+    symb: received symbols (on constellation scale)
+
+    M: modulation order
+
+    constType: "pam", "qam", "psk" or "ook"
+
+    Returns
+    -----
+    demodulated bits
+    """
+    if constType == "ook":
+        M = 2
+
+    indexes = decisionIndexes(symb, M, constType)
+
+    # Bits of symbol index (Gray mapped constellation is sorted by bit sequence)
+    bitMap = bitTable(M)
+
+    return bitMap[indexes].reshape(-1)
+
+
+def decisionIndexes(symb, M: int, constType: str) -> np.ndarray:
+    """
+    Indexes of the closest constellation points (minimum Euclidean distance).
+
+    Returns
+    -----
+    indexes to GrayMapping constellation
+    """
+    symb = np.asarray(symb).reshape(-1)
+    const, grid, step, start = decisionTable(M, constType)
+
+    if constType in ["pam", "ook"]:
+        # Two neighbouring levels
+        lower = sliceLevel(symb.real, start, step, len(grid))
+        candidates = np.stack((grid[lower], grid[lower + 1]), axis=1)
+
+    elif constType == "qam":
+        # Four neighbouring points (I and Q levels are independent)
+        lowerI = sliceLevel(symb.real, start, step, grid.shape[0])
+        lowerQ = sliceLevel(symb.imag, start, step, grid.shape[1])
+        candidates = np.stack((grid[lowerI, lowerQ], grid[lowerI + 1, lowerQ],
+                               grid[lowerI, lowerQ + 1], grid[lowerI + 1, lowerQ + 1]), axis=1)
+
+    elif constType == "psk":
+        # Two neighbouring phases
+        sector = np.floor(np.angle(symb) / step).astype(np.int64) % M
+        candidates = np.stack((grid[sector], grid[(sector + 1) % M]), axis=1)
+
+    else: raise Exception("Unexpected error")
+
+    # Same tie-breaking as the full search (first constellation point with minimal distance)
+    candidates = np.sort(candidates, axis=1)
+    distances = np.abs(symb[:, np.newaxis] - const[candidates])
+
+    return candidates[np.arange(len(symb)), np.argmin(distances, axis=1)]
+
+
+def sliceLevel(values, start: float, step: float, levels: int) -> np.ndarray:
+    """
+    Index of the lower of two levels surrounding each value (levels are start + n*step).
+    """
+    lower = np.floor((values - start) / step)
+
+    return np.clip(lower, 0, levels - 2).astype(np.int64)
+
+
+@lru_cache(maxsize=None)
+def decisionTable(M: int, constType: str) -> tuple:
+    """
+    Constellation and tables of its decision regions.
+
+    Returns
+    -----
+    tuple (const, grid, step, start)
+
+    const: GrayMapping constellation
+
+    grid: constellation indexes sorted by levels (PAM: by level, QAM: by I and Q level, PSK: by phase)
+
+    step: distance of levels (PSK: angle between phases)
+
+    start: lowest level
+    """
+    const = GrayMapping(M, constType)
+
+    if constType in ["pam", "ook"]:
+        levels = np.sort(const.real)
+        step = levels[1] - levels[0]
+        grid = np.argsort(const.real)
+        return const, grid, step, levels[0]
+
+    elif constType == "qam":
+        levels = np.unique(const.real)
+        step = levels[1] - levels[0]
+        # Level indexes of each point
+        levelI = np.rint((const.real - levels[0]) / step).astype(np.int64)
+        levelQ = np.rint((const.imag - levels[0]) / step).astype(np.int64)
+        grid = np.zeros((len(levels), len(levels)), dtype=np.int64)
+        grid[levelI, levelQ] = np.arange(M)
+        return const, grid, step, levels[0]
+
+    elif constType == "psk":
+        step = 2 * np.pi / M
+        # Phase index of each point
+        phase = np.rint(np.angle(const) / step).astype(np.int64) % M
+        grid = np.argsort(phase)
+        return const, grid, step, 0
+
+    else: raise Exception("Unexpected error")
+
+
+@lru_cache(maxsize=None)
+def bitTable(M: int) -> np.ndarray:
+    """
+    Bits of every symbol index (most significant bit first).
+    """
+    bitsSymbol = int(np.log2(M))
+    indexes = np.arange(M)
+
+    return ((indexes[:, np.newaxis] >> np.arange(bitsSymbol - 1, -1, -1)) & 1).astype(np.int64)
+
+
+def fastBERcalc(rx, tx, M: int, constType: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Monte Carlo BER/SER/SNR calculation. Same as fastBERcalc from OpticommPY package with faster demodulation.
+
+    Input arrays are not changed (phase correction and normalization of alignSymbols are done on copies).
+
+    Returns
+    -----
+    BER, SER, SNR (arrays with values for each mode)
+    """
+    if constType == "ook":
+        M = 2
+    # constellation parameters
+    constSymb = GrayMapping(M, constType)
+    Es = np.mean(np.abs(constSymb) ** 2)
+
+    rx, tx = alignSymbols(rx, tx, constType)
+    nModes = int(tx.shape[1])  # number of sinal modes
+    SNR = np.zeros(nModes)
+    BER = np.zeros(nModes)
+    SER = np.zeros(nModes)
+
+    for k in range(nModes):
+        # estimate SNR of the received constellation
+        SNR[k] = 10 * np.log10(
+            signal_power(tx[:, k]) / signal_power(rx[:, k] - tx[:, k])
+        )
+    for k in range(nModes):
+        brx = demodulateGray(np.sqrt(Es) * rx[:, k], M, constType)
+        btx = demodulateGray(np.sqrt(Es) * tx[:, k], M, constType)
+
+        err = np.logical_xor(brx, btx)
+        BER[k] = np.mean(err)
+        SER[k] = np.mean(np.sum(err.reshape(-1, int(np.log2(M))), axis=1) > 0)
+    return BER, SER, SNR
+
+
+def alignSymbols(rx, tx, constType: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Phase corrected and normalized copies of received and transmitted symbols (pre-processing of fastBERcalc).
+
+    Returns
+    -----
+    rx, tx (symbols x modes)
+    """
+    rx = np.array(rx)
+    tx = np.array(tx)
+
+    # We want all the signal sequences to be disposed in columns:
+    try:
+        if rx.shape[1] > rx.shape[0]:
+            rx = rx.T
+    except IndexError:
+        rx = rx.reshape(len(rx), 1)
+    try:
+        if tx.shape[1] > tx.shape[0]:
+            tx = tx.T
+    except IndexError:
+        tx = tx.reshape(len(tx), 1)
+
+    # pre-processing
+    for k in range(tx.shape[1]):
+        if constType in ["qam", "psk"]:
+            # correct (possible) phase ambiguity
+            rot = np.mean(tx[:, k] / rx[:, k])
+            rx[:, k] = rot * rx[:, k]
+        # symbol normalization
+        rx[:, k] = pnorm(rx[:, k])
+        tx[:, k] = pnorm(tx[:, k])
+
+    return rx, tx
+
+
+def semiAnalyticBER(rx, tx, M: int, constType: str) -> float:
+    """
+    Semi-analytic BER estimation. Received symbols of each constellation point are fitted by Gaussian distribution
+    (mean and variance of I and Q) and probability of each decision region is integrated in closed form (erfc).
+    Works for BER far below 1 / number of bits (no errors have to be counted).
+
+    PSK is integrated only to the neighbouring decision regions (noise across the boundary lines).
+
+    ! the distribution is assumed gaussian, tails of ISI and signal dependent noise (direct detection) are not modeled,
+    on ISI limited links the estimate is upper bound style (ISI has lighter tails than gaussian and BER is overestimated)
+
+    Parameters
+    -----
+    rx: received symbols (phase corrected and normalized, as after alignSymbols)
+
+    tx: transmitted symbols (unit power)
+
+    Returns
+    -----
+    BER
+    """
+    if constType == "ook":
+        M = 2
+        constType = "pam"
+
+    const, grid, step, start = decisionTable(M, constType)
+    Es = signal_power(const)
+    bitsSymbol = int(np.log2(M))
+    bitMap = bitTable(M)
+    # Hamming distances of all pairs of points
+    hamming = np.sum(bitMap[:, np.newaxis, :] != bitMap[np.newaxis, :, :], axis=2)
+
+    rx = np.sqrt(Es) * np.asarray(rx).reshape(-1)
+    indexes = decisionIndexes(np.sqrt(Es) * np.asarray(tx).reshape(-1), M, constType)
+
+    # Statistics of each transmitted point (points x 1)
+    counts = np.bincount(indexes, minlength=M)
+    used = counts > 0
+    counts = np.maximum(counts, 1)
+    mean = (np.bincount(indexes, rx.real, minlength=M) + 1j * np.bincount(indexes, rx.imag, minlength=M)) / counts
+    noise = rx - mean[indexes]
+
+    if constType in ["pam", "qam"]:
+        levels = start + step * np.arange(grid.shape[0])
+        sigmaI = np.sqrt(np.bincount(indexes, noise.real**2, minlength=M) / counts)
+        # Probabilities of I levels (points x levels)
+        probabilityI = levelProbabilities(mean.real, sigmaI, levels)
+
+        if constType == "pam":
+            # Point of each level
+            errors = np.sum(probabilityI * hamming[:, grid], axis=1)
+        else:
+            sigmaQ = np.sqrt(np.bincount(indexes, noise.imag**2, minlength=M) / counts)
+            probabilityQ = levelProbabilities(mean.imag, sigmaQ, levels)
+            # Probabilities of all regions (points x I levels x Q levels)
+            probability = probabilityI[:, :, np.newaxis] * probabilityQ[:, np.newaxis, :]
+            errors = np.sum(probability * hamming[:, grid], axis=(1, 2))
+
+    elif constType == "psk":
+        angle = np.angle(const)
+        errors = np.zeros(M)
+        # Boundaries to the previous and next phase (BPSK has only one boundary line)
+        for direction in ([1] if M == 2 else [1, -1]):
+            boundary = angle + direction * step / 2
+            # Normal of the boundary line (pointing away from the point)
+            normal = direction * 1j * np.exp(1j * boundary)
+            distance = np.abs(np.real(mean * np.conj(normal)))
+            sigma = np.sqrt(np.bincount(indexes, np.real(noise * np.conj(normal[indexes]))**2, minlength=M) / counts)
+            crossing = 0.5 * erfc(distance / (np.sqrt(2) * np.maximum(sigma, 1e-300)))
+            # Neighbouring point in the direction (points are sorted by phase in grid)
+            order = np.argsort(grid)
+            neighbour = grid[(order + direction) % M]
+            errors += crossing * hamming[np.arange(M), neighbour]
+
+    else: raise Exception("Unexpected error")
+
+    # Average over transmitted symbols
+    return float(np.sum((errors * counts)[used]) / (len(indexes) * bitsSymbol))
+
+
+def levelProbabilities(mean, sigma, levels) -> np.ndarray:
+    """
+    Probabilities of decision intervals of levels for gaussian variables (tails are computed with erfc, no cancellation).
+
+    Parameters
+    -----
+    mean, sigma: parameters of the gaussian distributions (points)
+
+    levels: decision levels (sorted, equally spaced)
+
+    Returns
+    -----
+    probabilities (points x levels)
+    """
+    # Decision boundaries (outer levels reach to infinity)
+    boundaries = (levels[1:] + levels[:-1]) / 2
+    lower = np.concatenate(([-np.inf], boundaries))
+    upper = np.concatenate((boundaries, [np.inf]))
+
+    mean = mean[:, np.newaxis]
+    scale = np.sqrt(2) * np.maximum(sigma, 1e-300)[:, np.newaxis]
+
+    # Interval above the mean, below the mean or containing it
+    above = 0.5 * (erfc((lower - mean) / scale) - erfc((upper - mean) / scale))
+    below = 0.5 * (erfc((mean - upper) / scale) - erfc((mean - lower) / scale))
+    inside = 1 - 0.5 * erfc((upper - mean) / scale) - 0.5 * erfc((mean - lower) / scale)
+
+    return np.where(lower >= mean, above, np.where(upper <= mean, below, inside))
+
+
+def importanceSamplingBER(rx, tx, noise, M: int, constType: str, bias: float) -> float:
+    """
+    BER of importance sampling simulation (amplitude of ASE and reciever noise was scaled by bias). Errors of each symbol
+    are weighted by likelihood ratio of unbiased and biased gaussian noise at the decision.
+
+    Noise of a symbol is the injected noise alone (difference of the biased and noise-free simulation thru the same reciever),
+    ISI, laser phase noise, RIN and clipping of the photodiode are the same in both simulations. Its variance is estimated
+    for each transmitted point (noise of direct detection depends on the signal).
+
+    Parameters
+    -----
+    rx: received symbols (symbolsRx of restoreInformation)
+
+    tx: transmitted symbols
+
+    noise: injected noise of received symbols (noiseRx of restoreInformation)
+
+    bias: amplitude scale of the noise (> 1)
+
+    Returns
+    -----
+    BER
+    """
+    if constType == "ook":
+        M = 2
+        constType = "pam"
+
+    const = GrayMapping(M, constType)
+    Es = signal_power(const)
+    bitsSymbol = int(np.log2(M))
+    bitMap = bitTable(M)
+
+    rx = np.asarray(rx).reshape(-1)
+    aligned, tx = [array.reshape(-1) for array in alignSymbols(rx, tx, constType)]
+    # Phase correction and normalization of the symbols (one complex scale) applies to the noise too
+    noise = np.asarray(noise).reshape(-1) * (np.sum(aligned * np.conj(rx)) / np.sum(np.abs(rx)**2))
+    if constType == "pam":
+        noise = noise.real
+
+    # Decisions are scaled by power of the symbols without the biased noise (as normalization of unbiased simulation)
+    scale = np.sqrt(Es / signal_power(aligned - noise))
+    indexes = decisionIndexes(np.sqrt(Es) * tx, M, constType)
+    errors = np.sum(bitMap[decisionIndexes(scale * aligned, M, constType)] != bitMap[indexes], axis=1)
+
+    # Real (PAM) or complex (2 dimensions) noise
+    dimensions = 1 if constType == "pam" else 2
+    noisePower = np.abs(noise)**2
+    counts = np.maximum(np.bincount(indexes, minlength=M), 1)
+    # Biased variance of one dimension of each point
+    variance = np.bincount(indexes, noisePower, minlength=M) / counts / dimensions
+
+    # Likelihood ratio of unbiased and biased noise density
+    weights = bias**dimensions * np.exp(-noisePower * (bias**2 - 1) / (2 * np.maximum(variance[indexes], 1e-300)))
+
+    return float(np.sum(weights * errors) / (len(indexes) * bitsSymbol))
@@ -0,0 +1,200 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from scripts.fft_backend import fft, ifft
+
+# Default equalizer parameters
+TAPS = 15
+STEP = 0.1
+BLOCK = 64
+TRAINING = 4096
+
+
+def mimoEqualizer(signal, SpS: int, constellation, training=None, algorithm: str = "lms", taps: int = TAPS, step: float = STEP,
+                  block: int = BLOCK) -> np.ndarray:
+    """
+    Fractionally spaced (2 samples per symbol) 2x2 MIMO equalizer of dual polarization signal. Separates polarizations
+    mixed in the fiber and equalizes the remaining linear distortion.
+
+    Taps are updated once per block of symbols with gradient averaged over the block (block LMS / CMA),
+    outputs and gradients of the whole block and both polarizations are computed at once.
+    Taps are first converged on the start of the signal (training sequence), then the whole signal is equalized.
+
+    Parameters
+    -----
+    signal: detected dual polarization signal (2 x N), symbols are at samples 0, SpS, 2*SpS, ...
+
+    SpS: samples per symbol (even number)
+
+    constellation: constellation points (unit average power), used for decisions and CMA radius
+
+    training: Optional. Known symbols at the start (2 x Ntraining), LMS uses them before switching to decisions
+
+    algorithm: "lms" (decision directed LMS) / "cma" (constant modulus algorithm, blind, phase stays ambiguous)
+
+    taps: number of taps (odd number)
+
+    step: adaptation step
+
+    block: number of symbols of one update
+
+    Returns
+    -----
+    equalized symbols (2 x symbols)
+    """
+    if SpS < 2 or SpS % 2:
+        raise Exception("MIMO equalizer needs even number of samples per symbol")
+
+    # 2 samples per symbol
+    x = signal[:, ::SpS // 2]
+    # Unit power of each polarization
+    x = x / np.sqrt(np.mean(np.abs(x)**2, axis=1, keepdims=True))
+    complexType = np.complex64 if x.dtype in [np.float32, np.complex64] else np.complex128
+    x = x.astype(complexType, copy=False)
+
+    # Symbol is in the middle tap
+    half = taps // 2
+    x = np.pad(x, ((0, 0), (half, half)))
+    # Window of each symbol (2 x symbols x taps)
+    windows = sliding_window_view(x, taps, axis=1)[:, ::2]
+    symbols = windows.shape[1]
+
+    # Taps of all input / output polarization pairs (output x input x taps), starts as identity
+    W = np.zeros((2, 2, taps), dtype=complexType)
+    W[0, 0, half] = 1
+    W[1, 1, half] = 1
+
+    constellation = np.asarray(constellation).astype(complexType, copy=False)
+    # CMA radius
+    radius = float(np.mean(np.abs(constellation)**4) / np.mean(np.abs(constellation)**2))
+    trained = 0 if training is None else training.shape[1]
+
+    # Convergence on the training sequence first (blind algorithm on the same number of symbols), its outputs are overwritten
+    starts = list(range(0, min(symbols, trained or TRAINING), block)) + list(range(0, symbols, block))
+
+    y = np.empty((2, symbols), dtype=complexType)
+    for start in starts:
+        X = windows[:, start:start + block]
+        Y = np.einsum("pqt,qbt->pb", W, X)
+        y[:, start:start + block] = Y
+
+        if algorithm == "cma":
+            error = Y * (radius - np.abs(Y)**2)
+        elif algorithm == "lms":
+            # Known symbols (whole block is in the training sequence)
+            if start + Y.shape[1] <= trained:
+                reference = training[:, start:start + Y.shape[1]]
+            # Nearest constellation points
+            else:
+                reference = constellation[np.argmin(np.abs(Y[:, :, np.newaxis] - constellation), axis=2)]
+            error = reference - Y
+        else: raise Exception("Unexpected error")
+
+        # Gradient averaged over the block (Python float keeps precision of the taps)
+        W += float(step / Y.shape[1]) * np.einsum("pb,qbt->pqt", error, X.conj())
+
+    return y
+
+
+def blockEqualizer(signal, SpS: int, constellation, training=None, algorithm: str = "lms", taps: int = TAPS, step: float = STEP,
+                   block: int = BLOCK) -> np.ndarray:
+    """
+    Fractionally spaced (2 samples per symbol) frequency domain block LMS / CMA equalizer of single polarization signal.
+
+    Samples in the middle and at the edge of symbols are two polyphase inputs of symbol spaced filters.
+    Filtering and gradient of each block are overlap-save correlations (FFT of 2 * block), spectra of all input blocks
+    are computed at once before adaptation. Taps are constrained to their length (gradient is cut in time domain).
+    Taps are first converged on the start of the signal (training sequence), then the whole signal is equalized.
+
+    Parameters
+    -----
+    signal: detected signal (1-D), symbols are at samples 0, SpS, 2*SpS, ...
+
+    SpS: samples per symbol (even number)
+
+    constellation: constellation points (unit average power), used for decisions and CMA radius
+
+    training: Optional. Known symbols at the start, LMS uses them before switching to decisions
+
+    algorithm: "lms" (decision directed LMS) / "cma" (constant modulus algorithm, blind, phase stays ambiguous)
+
+    taps: number of taps (fractionally spaced, odd number)
+
+    step: adaptation step
+
+    block: number of symbols of one update (at least number of taps of one phase)
+
+    Returns
+    -----
+    equalized symbols
+    """
+    if SpS < 2 or SpS % 2:
+        raise Exception("Block equalizer needs even number of samples per symbol")
+
+    # 2 samples per symbol
+    x = signal[::SpS // 2]
+    complexType = np.complex64 if x.dtype in [np.float32, np.complex64] else np.complex128
+    x = (x / np.sqrt(np.mean(np.abs(x)**2))).astype(complexType, copy=False)
+    symbols = len(x) // 2 + len(x) % 2
+
+    # Symbol spaced taps of both phases (symbol offsets -reach .. reach)
+    reach = (taps // 2 + 1) // 2
+    length = 2 * reach + 1
+    block = max(block, length)
+    Nfft = 2 * block
+
+    # Polyphase inputs (phases x symbols), input of the block starts reach symbols before its first symbol
+    phases = np.zeros((2, symbols), dtype=complexType)
+    phases[0] = x[0::2]
+    phases[1, :len(x) // 2] = x[1::2]
+    blocks = -(-symbols // block)
+    padded = np.zeros((2, blocks * block + Nfft), dtype=complexType)
+    padded[:, reach:reach + symbols] = phases
+    # Spectra of all input blocks (blocks x phases x Nfft)
+    spectra = fft(sliding_window_view(padded, Nfft, axis=1)[:, :blocks * block:block].transpose(1, 0, 2))
+
+    # Taps in time domain (phases x taps), starts as single tap in the middle of the symbol
+    h = np.zeros((2, length), dtype=complexType)
+    h[0, reach] = 1
+
+    constellation = np.asarray(constellation).astype(complexType, copy=False)
+    # CMA radius
+    radius = float(np.mean(np.abs(constellation)**4) / np.mean(np.abs(constellation)**2))
+    trained = 0 if training is None else len(training)
+
+    # Convergence on the training sequence first (blind algorithm on the same number of symbols), its outputs are overwritten
+    starts = list(range(0, min(symbols, trained or TRAINING), block)) + list(range(0, symbols, block))
+
+    y = np.empty(blocks * block, dtype=complexType)
+    # Reversed taps (circular) give correlation as product of spectra
+    tapsReversed = np.zeros((2, Nfft), dtype=complexType)
+    for start in starts:
+        S = spectra[start // block]
+        tapsReversed[:, 0] = h[:, 0]
+        tapsReversed[:, :Nfft - length:-1] = h[:, 1:]
+        Y = ifft(np.sum(S * fft(tapsReversed), axis=0))[:block]
+        y[start:start + block] = Y
+
+        if algorithm == "cma":
+            error = Y * (radius - np.abs(Y)**2)
+        elif algorithm == "lms":
+            # Known symbols (whole block is in the training sequence)
+            if start + block <= trained:
+                reference = training[start:start + block]
+            # Nearest constellation points
+            else:
+                reference = constellation[np.argmin(np.abs(Y[:, np.newaxis] - constellation), axis=1)]
+            error = reference - Y
+        else: raise Exception("Unexpected error")
+
+        # Symbols after the end of the signal don't adapt the taps
+        error[max(symbols - start, 0):] = 0
+
+        # Gradient (correlation of error with inputs), only taps of the filter length are kept
+        E = np.zeros(Nfft, dtype=complexType)
+        E[:block] = error
+        gradient = ifft(S * fft(E).conj())[:, :length].conj()
+        # Gradient averaged over the block (Python float keeps precision of the taps)
+        h += float(step / block) * gradient
+
+    return y[:symbols]
@@ -0,0 +1,423 @@
+from functools import lru_cache
+import numpy as np
+from optic.comm.modulation import GrayMapping
+
+from scripts.demapper import bitTable
+
+# BCH code (n = 2^m - 1, corrects t errors)
+BCH_M = 8
+BCH_T = 4
+# Regular LDPC code (length, variable and check node degrees)
+LDPC_LENGTH = 1296
+LDPC_DV = 3
+LDPC_DC = 6
+LDPC_ITERATIONS = 20
+# Normalized min-sum scaling
+LDPC_SCALING = 0.75
+# Symbols of one soft demapping chunk
+CHUNK = 2**16
+
+
+def fecParameters(code: str) -> tuple[int, int]:
+    """
+    Codeword length and number of information bits of the code.
+
+    Parameters
+    -----
+    code: "bch" / "ldpc"
+
+    Returns
+    -----
+    tuple (n, k)
+    """
+    if code == "bch":
+        table = bchCode(BCH_M, BCH_T)
+        return table.get("n"), table.get("k")
+    elif code == "ldpc":
+        table = ldpcCode(LDPC_LENGTH, LDPC_DV, LDPC_DC)
+        return LDPC_LENGTH, len(table.get("Free"))
+    else: raise Exception("Unexpected error")
+
+
+def fecEncode(bitsTx, code: str) -> dict:
+    """
+    Encodes start of the bit sequence into whole codewords. Information bits are taken from the sequence,
+    the rest of the sequence (shorter than codeword) stays uncoded.
+
+    Parameters
+    -----
+    bitsTx: bit sequence (1-D or 2-D, rows are joined)
+
+    code: "bch" / "ldpc"
+
+    Returns
+    -----
+    bitsInfo (information bits), bitsTx (coded bit sequence of the same shape)
+    """
+    n, k = fecParameters(code)
+    bits = np.array(bitsTx).reshape(-1)
+    codewords = len(bits) // n
+
+    # Information bits of all codewords (codewords x k)
+    bitsInfo = bits[:codewords * k].reshape(codewords, k).copy()
+
+    if code == "bch":
+        table = bchCode(BCH_M, BCH_T)
+        # Systematic code, parity bits are at the start of the codeword
+        parity = (bitsInfo.astype(np.float32) @ table.get("Parity")) % 2
+        encoded = np.concatenate((parity.astype(bits.dtype), bitsInfo), axis=1)
+    else:
+        table = ldpcCode(LDPC_LENGTH, LDPC_DV, LDPC_DC)
+        encoded = np.empty((codewords, n), dtype=bits.dtype)
+        encoded[:, table.get("Free")] = bitsInfo
+        encoded[:, table.get("Pivots")] = (bitsInfo.astype(np.float32) @ table.get("Parity")) % 2
+
+    bits[:codewords * n] = encoded.reshape(-1)
+
+    return {"bitsInfo":bitsInfo.reshape(-1), "bitsTx":bits.reshape(np.shape(bitsTx))}
+
+
+def fecDecode(bitsRx, symbolsRx, generalParameters: dict) -> dict:
+    """
+    Decodes received codewords. BCH decoder uses hard decisions (bitsRx), LDPC decoder uses bit LLRs of received symbols.
+
+    Parameters
+    -----
+    bitsRx: demodulated bits (1-D or 2-D, rows are joined)
+
+    symbolsRx: received symbols with unit power (same order as bits)
+
+    Returns
+    -----
+    bitsDecoded (information bits)
+    """
+    code = generalParameters.get("FEC")
+    n, k = fecParameters(code)
+    bits = np.asarray(bitsRx).reshape(-1)
+    codewords = len(bits) // n
+
+    if code == "bch":
+        decoded = bchDecode(bits[:codewords * n].reshape(codewords, n), bchCode(BCH_M, BCH_T))
+        return {"bitsDecoded":decoded[:, n - k:].reshape(-1)}
+
+    # OOK is 2 order PAM
+    modulationFormat = "pam" if generalParameters.get("Format") == "ook" else generalParameters.get("Format")
+    llr = bitLLR(symbolsRx, generalParameters.get("Order"), "qam" if modulationFormat == "ofdm" else modulationFormat)
+
+    table = ldpcCode(LDPC_LENGTH, LDPC_DV, LDPC_DC)
+    decoded = ldpcDecode(llr[:codewords * n].reshape(codewords, n), table)
+
+    return {"bitsDecoded":decoded[:, table.get("Free")].reshape(-1)}
+
+
+def bitLLR(symbolsRx, M: int, constType: str) -> np.ndarray:
+    """
+    Max-log LLRs of bits (positive means bit 0). Noise variance is estimated from distances to the closest points.
+
+    Parameters
+    -----
+    symbolsRx: received symbols with unit power
+    """
+    symbols = np.asarray(symbolsRx).reshape(-1)
+    const = GrayMapping(M, constType)
+    const = (const / np.sqrt(np.mean(np.abs(const)**2))).astype(np.complex64)
+    # Points with bit 0 / 1 at each bit position (bits x points)
+    ones = bitTable(M).T.astype(bool)
+
+    llr = np.empty((len(symbols), ones.shape[0]), dtype=np.float32)
+    nearest = np.empty(len(symbols), dtype=np.float32)
+
+    # Distances to all points in chunks (symbols x points)
+    for start in range(0, len(symbols), CHUNK):
+        distances = np.abs(symbols[start:start + CHUNK, np.newaxis].astype(np.complex64) - const)**2
+        nearest[start:start + CHUNK] = np.min(distances, axis=1)
+        for bit, mask in enumerate(ones):
+            llr[start:start + CHUNK, bit] = np.min(distances[:, mask], axis=1) - np.min(distances[:, ~mask], axis=1)
+
+    # Complex gaussian noise (variance of decisions to the closest point)
+    variance = max(float(np.mean(nearest)), 1e-12)
+
+    return (llr / variance).reshape(-1)
+
+
+@lru_cache(maxsize=None)
+def galoisField(m: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exponent and logarithm tables of GF(2^m) (primitive polynomials of Conway tables).
+
+    Returns
+    -----
+    tuple (exp, log), exp has double length (sum of two logarithms doesn't need modulo), log of zero is -1
+    """
+    primitive = {3: 0b1011, 4: 0b10011, 5: 0b100101, 6: 0b1000011, 7: 0b10001001, 8: 0b100011101, 9: 0b1000010001, 10: 0b10000001001}
+    if m not in primitive:
+        raise Exception("Unsupported BCH code")
+
+    n = 2**m - 1
+    exp = np.zeros(2 * n, dtype=np.int64)
+    log = np.full(n + 1, -1, dtype=np.int64)
+
+    value = 1
+    for i in range(n):
+        exp[i] = value
+        log[value] = i
+        value <<= 1
+        if value >> m:
+            value ^= primitive.get(m)
+    exp[n:] = exp[:n]
+
+    return exp, log
+
+
+def gfMultiply(a, b, m: int) -> np.ndarray:
+    """
+    Elementwise product in GF(2^m).
+    """
+    exp, log = galoisField(m)
+
+    return np.where((a == 0) | (b == 0), 0, exp[log[a] + log[b]])
+
+
+def gfInverse(a, m: int) -> np.ndarray:
+    """
+    Elementwise inverse in GF(2^m) (inverse of zero is zero).
+    """
+    exp, log = galoisField(m)
+    n = 2**m - 1
+
+    return np.where(a == 0, 0, exp[(n - log[a]) % n])
+
+
+@lru_cache(maxsize=None)
+def bchCode(m: int, t: int) -> dict:
+    """
+    Tables of narrow-sense binary BCH code. Codeword bit i is the coefficient of x^i.
+
+    Returns
+    -----
+    dictionary
+
+        - n, k, m, t
+        - Parity: parity bits of each information bit (k x n-k), float32 for matrix product
+        - Syndrome: bits of alpha^(j*i) for syndromes j = 1..2t (n x 2t*m)
+    """
+    exp, log = galoisField(m)
+    n = 2**m - 1
+
+    # Generator polynomial is product of minimal polynomials of alpha^1, alpha^3, ..., alpha^(2t-1)
+    generator = np.array([1], dtype=np.int64)
+    used = set()
+    for j in range(1, 2 * t, 2):
+        if j in used:
+            continue
+        # Cyclotomic coset of j
+        coset = []
+        power = j
+        while power not in coset:
+            coset.append(power)
+            power = (2 * power) % n
+        used.update(coset)
+
+        # Minimal polynomial (product of (x + alpha^c)), coefficients are in GF(2)
+        minimal = np.array([1], dtype=np.int64)
+        for c in coset:
+            shifted = np.concatenate(([0], minimal))
+            scaled = np.concatenate((gfMultiply(minimal, exp[c], m), [0]))
+            minimal = shifted ^ scaled
+        # Product of binary polynomials
+        product = np.zeros(len(generator) + len(minimal) - 1, dtype=np.int64)
+        for i, coefficient in enumerate(minimal):
+            if coefficient:
+                product[i:i + len(generator)] ^= generator
+        generator = product
+
+    parityBits = len(generator) - 1
+    k = n - parityBits
+
+    # Remainders of x^(n-k+l) mod g(x)
+    parity = np.zeros((k, parityBits), dtype=np.float32)
+    remainder = generator[:parityBits].copy()
+    for l in range(k):
+        parity[l] = remainder
+        # Multiply by x and reduce
+        carry = remainder[-1]
+        remainder = np.concatenate(([0], remainder[:-1]))
+        if carry:
+            remainder ^= generator[:parityBits]
+
+    # Bits of alpha^(j*i)
+    powers = exp[(np.arange(n)[:, np.newaxis] * np.arange(1, 2 * t + 1)[np.newaxis, :]) % n]
+    syndrome = ((powers[:, :, np.newaxis] >> np.arange(m)) & 1).reshape(n, 2 * t * m).astype(np.float32)
+
+    return {"n": n, "k": k, "m": m, "t": t, "Parity": parity, "Syndrome": syndrome}
+
+
+def bchDecode(codewords, table: dict) -> np.ndarray:
+    """
+    Hard decision BCH decoder of batch of codewords (Berlekamp-Massey algorithm + Chien search).
+    Only codewords with nonzero syndrome are decoded, all of them at once. Uncorrectable codewords stay as received.
+
+    Parameters
+    -----
+    codewords: received bits (codewords x n)
+
+    Returns
+    -----
+    corrected codewords
+    """
+    n, m, t = table.get("n"), table.get("m"), table.get("t")
+    exp, log = galoisField(m)
+    decoded = np.array(codewords, copy=True)
+
+    # Syndromes S_1 ... S_2t (elements of GF(2^m) from their bits)
+    syndromeBits = (codewords.astype(np.float32) @ table.get("Syndrome")).astype(np.int64) % 2
+    syndromes = (syndromeBits.reshape(-1, 2 * t, m) << np.arange(m)).sum(axis=2)
+
+    errors = np.nonzero(np.any(syndromes, axis=1))[0]
+    if len(errors) == 0:
+        return decoded
+    S = syndromes[errors]
+    batch = len(errors)
+
+    # Berlekamp-Massey, B is kept already multiplied by x^m
+    C = np.zeros((batch, 2 * t + 1), dtype=np.int64)
+    C[:, 0] = 1
+    B = np.zeros_like(C)
+    B[:, 1] = 1
+    L = np.zeros(batch, dtype=np.int64)
+    b = np.ones(batch, dtype=np.int64)
+
+    for r in range(2 * t):
+        # Discrepancy
+        d = S[:, r].copy()
+        for i in range(1, r + 1):
+            d ^= gfMultiply(C[:, i], S[:, r - i], m)
+
+        update = d != 0
+        change = update & (2 * L <= r)
+        Cnew = C ^ gfMultiply(gfMultiply(d, gfInverse(b, m), m)[:, np.newaxis], B, m)
+
+        B = np.where(change[:, np.newaxis], C, B)
+        B = np.concatenate((np.zeros((batch, 1), dtype=np.int64), B[:, :-1]), axis=1)
+        b = np.where(change, d, b)
+        L = np.where(change, r + 1 - L, L)
+        C = np.where(update[:, np.newaxis], Cnew, C)
+
+    # Chien search, roots alpha^(-i) of the error locator give error positions i (batch x n)
+    Lambda = C[:, :t + 1]
+    exponents = (log[Lambda][:, np.newaxis, :] - np.arange(n)[np.newaxis, :, np.newaxis] * np.arange(t + 1)) % n
+    terms = np.where(Lambda[:, np.newaxis, :] == 0, 0, exp[exponents])
+    roots = np.bitwise_xor.reduce(terms, axis=2) == 0
+
+    # Correctable codewords (number of roots is degree of the locator)
+    correctable = (L <= t) & (np.sum(roots, axis=1) == L)
+    rows, positions = np.nonzero(roots & correctable[:, np.newaxis])
+    decoded[errors[rows], positions] ^= 1
+
+    return decoded
+
+
+@lru_cache(maxsize=None)
+def ldpcCode(n: int, dv: int, dc: int) -> dict:
+    """
+    Regular LDPC code (Gallager construction, fixed seed) and its systematic encoder.
+
+    Returns
+    -----
+    dictionary
+
+        - Checks: variable nodes of each check (checks x dc)
+        - VarEdges: edges of each variable node (dv x n), edges are flattened transposed Checks (dc x checks)
+        - Pivots: positions of parity bits, Free: positions of information bits
+        - Parity: parity bits of each information bit (k x parity bits), float32 for matrix product
+    """
+    if n % dc:
+        raise Exception("LDPC length must be multiple of check node degree")
+
+    # Each band connects every variable node once (first band is not permuted)
+    generator = np.random.default_rng(0)
+    checks = np.concatenate([(generator.permutation(n) if band else np.arange(n)).reshape(n // dc, dc) for band in range(dv)])
+
+    H = np.zeros((len(checks), n), dtype=bool)
+    H[np.arange(len(checks))[:, np.newaxis], checks] = True
+
+    # Reduced row echelon form over GF(2)
+    pivots = []
+    row = 0
+    for column in range(n):
+        if row == len(H):
+            break
+        candidates = np.nonzero(H[row:, column])[0]
+        if len(candidates) == 0:
+            continue
+        pivot = row + candidates[0]
+        H[[row, pivot]] = H[[pivot, row]]
+        mask = H[:, column].copy()
+        mask[row] = False
+        H[mask] ^= H[row]
+        pivots.append(column)
+        row += 1
+
+    pivots = np.array(pivots)
+    free = np.setdiff1d(np.arange(n), pivots)
+
+    return {"Checks": checks, "VarEdges": np.argsort(checks.T.reshape(-1), kind="stable").reshape(n, dv).T,
+            "Pivots": pivots, "Free": free, "Parity": H[:row][:, free].T.astype(np.float32)}
+
+
+def ldpcDecode(llr, table: dict, iterations: int = LDPC_ITERATIONS) -> np.ndarray:
+    """
+    Normalized min-sum LDPC decoder of batch of codewords. Messages of all codewords are updated at once,
+    codewords with zero syndrome stop iterating.
+
+    Codewords are in the last axis of all messages, so reductions over node edges are elementwise operations of whole rows.
+
+    Parameters
+    -----
+    llr: channel LLRs (codewords x n), positive means bit 0
+
+    Returns
+    -----
+    decoded codewords (hard decisions)
+    """
+    checks = table.get("Checks").T
+    varEdges = table.get("VarEdges")
+    dc, nChecks = checks.shape
+
+    # Variable nodes x codewords
+    llr = np.ascontiguousarray(np.asarray(llr, dtype=np.float32).T)
+    decoded = llr < 0
+    active = np.arange(llr.shape[1])
+    # Check to variable messages of active codewords (dc x checks x codewords)
+    C2V = np.zeros((dc, nChecks, llr.shape[1]), dtype=np.float32)
+
+    for _ in range(iterations):
+        total = llr[:, active] + C2V.reshape(dc * nChecks, -1)[varEdges].sum(axis=0)
+        hard = total < 0
+        decoded[:, active] = hard
+
+        # Codewords with all checks satisfied are done
+        unsatisfied = np.any(np.logical_xor.reduce(hard[checks], axis=0), axis=0)
+        if not np.any(unsatisfied):
+            break
+        active, total, C2V = active[unsatisfied], total[:, unsatisfied], C2V[:, :, unsatisfied]
+
+        # Variable to check messages (extrinsic)
+        V2C = total[checks] - C2V
+
+        # Check to variable messages: product of other signs, minimum of other magnitudes
+        # (masks are applied arithmetically, masked assignments are much slower)
+        magnitudes = np.abs(V2C)
+        first = np.minimum.reduce(magnitudes, axis=0)
+        smallest = magnitudes == first
+        # Second minimum (equal to the first one if the minimum is not unique)
+        second = np.minimum.reduce(np.maximum(magnitudes, smallest * np.finfo(np.float32).max), axis=0)
+        second = np.where(np.sum(smallest, axis=0) > 1, first, second)
+        # Product of all signs (own sign is removed by multiplying with it again)
+        sign = 1 - 2 * np.logical_xor.reduce(V2C < 0, axis=0).astype(np.float32)
+
+        magnitudes = first + smallest * (second - first)
+        magnitudes *= np.float32(LDPC_SCALING) * sign
+        C2V = np.copysign(magnitudes, magnitudes * V2C)
+
+    return decoded.T.astype(np.int64)
@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import scipy.fft
+
+# Number of threads of FFT (all cores by default)
+fftWorkers = os.cpu_count() or 1
+
+
+def setWorkers(workers: int | None):
+    """
+    Sets number of threads used by all FFTs.
+
+    Parameters
+    -----
+    workers: number of threads, None or 0 means all cores
+    """
+    global fftWorkers
+
+    if not workers:
+        workers = os.cpu_count() or 1
+    elif workers < 0:
+        raise Exception("Number of FFT workers must be positive")
+
+    fftWorkers = int(workers)
+
+
+def getWorkers() -> int:
+    """
+    Number of threads used by FFTs.
+    """
+    return fftWorkers
+
+
+# scipy.fft keeps plans (twiddle factors) of used lengths in its own cache, repeated lengths are not planned again
+def fft(x, axis: int = -1, overwrite: bool = False) -> np.ndarray:
+    """
+    Forward FFT (scipy.fft, multi-threaded). Single precision input gives single precision output.
+
+    Parameters
+    -----
+    overwrite: input can be used as a working buffer (input is destroyed)
+    """
+    return scipy.fft.fft(x, axis=axis, overwrite_x=overwrite, workers=fftWorkers)
+
+
+def ifft(x, axis: int = -1, overwrite: bool = False) -> np.ndarray:
+    """
+    Inverse FFT (scipy.fft, multi-threaded). Single precision input gives single precision output.
+
+    Parameters
+    -----
+    overwrite: input can be used as a working buffer (input is destroyed)
+    """
+    return scipy.fft.ifft(x, axis=axis, overwrite_x=overwrite, workers=fftWorkers)
+
+
+def fftfreq(n: int, d: float = 1.0) -> np.ndarray:
+    """
+    Frequencies of FFT bins.
+    """
+    return scipy.fft.fftfreq(n, d)
+
+
+def fftshift(x, axes=None) -> np.ndarray:
+    """
+    Shifts zero frequency to the center of the spectrum.
+    """
+    return scipy.fft.fftshift(x, axes)
+
+
+def filterSpectrum(x, H, axis: int = -1) -> np.ndarray:
+    """
+    Filters signal with frequency response (circular convolution). ifft(fft(x) * H)
+
+    Spectrum buffer is reused for multiplication and inverse transform (no temporary arrays).
+
+    Parameters
+    -----
+    x: signal (1-D or 2-D batch of signals along axis)
+
+    H: frequency response (precision is converted to the precision of the signal)
+    """
+    spectrum = fft(x, axis=axis)
+
+    if np.isscalar(H):
+        # Python float keeps precision of the signal
+        spectrum *= float(H)
+    else:
+        spectrum *= np.asarray(H).astype(spectrum.dtype, copy=False)
+
+    return ifft(spectrum, axis=axis, overwrite=True)
+
+
+def convolveSame(x, h, axis: int = -1) -> np.ndarray:
+    """
+    Linear convolution of real signal with real FIR filter computed with FFT. Same as np.convolve(x, h, mode="same")
+    (output has length of the signal), but time doesn't grow with the number of filter taps.
+
+    Parameters
+    -----
+    x: real signal (1-D or 2-D batch of signals along axis)
+
+    h: filter coefficients (precision is converted to the precision of the signal)
+    """
+    x = np.asarray(x)
+    h = np.asarray(h).astype(x.dtype, copy=False)
+    N = x.shape[axis]
+    Nfft = scipy.fft.next_fast_len(N + len(h) - 1, real=True)
+
+    spectrum = scipy.fft.rfft(x, Nfft, axis=axis, workers=fftWorkers)
+    # Broadcast filter along the axis of the batch
+    shape = [1] * x.ndim
+    shape[axis] = -1
+    spectrum *= scipy.fft.rfft(h, Nfft, workers=fftWorkers).reshape(shape)
+
+    y = scipy.fft.irfft(spectrum, Nfft, axis=axis, overwrite_x=True, workers=fftWorkers)
+
+    # Middle part of the full convolution
+    start = (len(h) - 1) // 2
+
+    return np.take(y, np.arange(start, start + N), axis=axis)
+
+
+def convolveValid(x, h) -> np.ndarray:
+    """
+    Linear convolution computed with FFT. Same as np.convolve(x, h, mode="valid") (only samples where the filter
+    fully overlaps the signal, signal is at least as long as the filter minus one sample).
+
+    Parameters
+    -----
+    x: signal (real or complex, 1-D)
+
+    h: filter coefficients (precision is converted to the precision of the signal)
+    """
+    x = np.asarray(x)
+    h = np.asarray(h)
+    realType = np.float32 if x.dtype in [np.float32, np.complex64] else np.float64
+    Nfft = scipy.fft.next_fast_len(len(x) + len(h) - 1, real=True)
+
+    # Real signal and filter use real FFT
+    if not np.iscomplexobj(x) and not np.iscomplexobj(h):
+        spectrum = scipy.fft.rfft(x, Nfft, workers=fftWorkers)
+        spectrum *= scipy.fft.rfft(h.astype(realType, copy=False), Nfft, workers=fftWorkers)
+        y = scipy.fft.irfft(spectrum, Nfft, overwrite_x=True, workers=fftWorkers)
+    else:
+        complexType = np.complex64 if realType == np.float32 else np.complex128
+        spectrum = scipy.fft.fft(x.astype(complexType, copy=False), Nfft, workers=fftWorkers)
+        spectrum *= scipy.fft.fft(h.astype(complexType, copy=False), Nfft, workers=fftWorkers)
+        y = scipy.fft.ifft(spectrum, Nfft, overwrite_x=True, workers=fftWorkers)
+
+    return y[len(h) - 1:len(x)]
@@ -1,15 +1,21 @@
 
 import tkinter as tk
 from tkinter import messagebox
+import os
+import threading
+import queue
 import customtkinter as ctk
 import matplotlib.pyplot as plt
+import numpy as np
 
 from scripts.help_gui import Help
 from scripts.parameters_window import ParametersWindow
 from scripts.plots_window import PlotWindow
 from scripts.tooltip import ToolTip
-from scripts.simulation import simulate, getValues, getPlot
+from scripts.simulation import simulate, getValues, getPlot, SimulationCancelled
 from scripts.parameters_functions import convertNumber
+from scripts.stage_cache import StageCache
+from scripts.fft_backend import setWorkers
 
 class GUI(ctk.CTk):
     """
@@ -46,6 +52,12 @@ class GUI(ctk.CTk):
         # Simulation results variables
         self.plots = {}
         self.simulationResults = None
+        # Results of simulation stages (reused when only downstream parameters change)
+        self.stageCache = StageCache()
+        # Simulation running in background thread (messages are passed thru queue to the main thread)
+        self.simulationThread = None
+        self.simulationQueue = queue.Queue()
+        self.cancelEvent = threading.Event()
 
 
         ### GUI
@@ -106,6 +118,14 @@ class GUI(ctk.CTk):
         self.symbolRateEntry.grid(row=2, column=2, padx=5, pady=10)
         self.symbolRateCombobox.grid(row=2, column=3, padx=10, pady=10)
 
+        # Number of FFT threads
+        self.fftWorkersLabel = ctk.CTkLabel(generalHelpFrame, text="FFT threads", font=generalFont)
+        self.fftWorkersCombobox = ctk.CTkComboBox(generalHelpFrame, values=["All"] + [str(2**i) for i in range(int(np.log2(os.cpu_count() or 1)) + 1)],
+                                                  state="readonly", font=generalFont)
+        self.fftWorkersCombobox.set("All")
+        self.fftWorkersLabel.grid(row=1, column=4, padx=10, pady=10)
+        self.fftWorkersCombobox.grid(row=2, column=4, padx=10, pady=10)
+
         
         # Scheme frame
 
@@ -189,9 +209,20 @@ class GUI(ctk.CTk):
         self.simulateButton = ctk.CTkButton(otherFrame, text="Simulate", command=self.startSimulation, font=generalFont)
         self.simulateButton.grid(row=0, column=0, padx=10, pady=10)
 
+        # Cancel running simulation
+        self.cancelButton = ctk.CTkButton(otherFrame, text="Cancel", command=self.cancelSimulation, font=generalFont, state="disabled")
+        self.cancelButton.grid(row=0, column=1, padx=10, pady=10)
+
         # Quit
         self.optionsQuitButton = ctk.CTkButton(otherFrame, text="Quit", command=self.terminateApp, font=generalFont)
-        self.optionsQuitButton.grid(row=0, column=1, padx=10, pady=10)
+        self.optionsQuitButton.grid(row=0, column=2, padx=10, pady=10)
+
+        # Simulation progress
+        self.progressBar = ctk.CTkProgressBar(otherFrame)
+        self.progressBar.set(0)
+        self.progressBar.grid(row=1, column=0, columnspan=3, padx=10, pady=(0,5), sticky="ew")
+        self.progressLabel = ctk.CTkLabel(otherFrame, text="", font=generalFont)
+        self.progressLabel.grid(row=2, column=0, columnspan=3, padx=10, pady=(0,5))
 
 
         ### OUTPUTS TAB
@@ -241,10 +272,15 @@ class GUI(ctk.CTk):
         self.snrLabel = ctk.CTkLabel(valuesHelpFrame, text="Signal to noise ratio: -", font=generalFont)
         self.berLabel = ctk.CTkLabel(valuesHelpFrame, text="Bit error rate: -", font=generalFont)
         self.serLabel = ctk.CTkLabel(valuesHelpFrame, text="Symbol error rate: -", font=generalFont)
+        self.theoryLabel = ctk.CTkLabel(valuesHelpFrame, text="Gap to theory: -", font=generalFont)
         self.transSpeedLabel.grid(row=0, column=1, padx=20, pady=10)
         self.snrLabel.grid(row=1, column=1, padx=20, pady=10)
         self.berLabel.grid(row=2, column=1, padx=20, pady=10)
         self.serLabel.grid(row=3, column=1, padx=20, pady=10)
+        self.theoryLabel.grid(row=4, column=1, padx=20, pady=10)
+        theoryTooltip = ctk.CTkLabel(valuesHelpFrame, text="(?)", font=generalFont)
+        theoryTooltip.grid(row=4, column=0, padx=(10,3), pady=10, sticky="e")
+        ToolTip(theoryTooltip, "SNR penalty against theoretical BER curve (AWGN channel) and theoretical BER at measured SNR")
 
 
         # Plots Frame
@@ -308,6 +344,8 @@ class GUI(ctk.CTk):
         """
         Terminates the app. Closes main window and all other opened windows.
         """
+        # Stop running simulation
+        self.cancelEvent.set()
         # Toplevels windows (graphs)
         self.closeGraphsWindows()
         # Main window
@@ -327,28 +365,146 @@ class GUI(ctk.CTk):
         # Sampling frequency error
         if not self.checkSamplingFrequency(): return
         
+        # Simulation is already running
+        if self.simulationThread is not None and self.simulationThread.is_alive():
+            return
+
         # Clear plots for new simulation (othervise old graphs could be shown)
         self.plots.clear()
+        self.simulationResults = None
+
+        # Lock simulation start until the simulation ends
+        self.simulateButton.configure(state="disabled")
+        self.cancelButton.configure(state="normal")
+        self.progressBar.set(0)
+        self.progressLabel.configure(text="Starting simulation")
+
+        # FFT threads (All = all cores)
+        fftWorkers = self.fftWorkersCombobox.get()
+        setWorkers(None if fftWorkers == "All" else int(fftWorkers))
+
+        # Simulation (runs in background, parameters are copied so they can be changed during the simulation)
+        self.cancelEvent.clear()
+        arguments = (dict(self.generalParameters), dict(self.sourceParameters), dict(self.modulatorParameters), dict(self.channelParameters),
+                     dict(self.recieverParameters), dict(self.amplifierParameters), self.amplifierCheckVar.get())
+        self.simulationThread = threading.Thread(target=self.simulationWorker, args=arguments, daemon=True)
+        self.simulationThread.start()
+
+        # Check for messages from simulation
+        self.after(100, self.checkSimulationQueue)
+
+
+    def simulationWorker(self, generalParameters: dict, sourceParameters: dict, modulatorParameters: dict, channelParameters: dict,
+                         recieverParameters: dict, amplifierParameters: dict, includeAmplifier: bool):
+        """
+        Runs the simulation in background thread. Results are passed thru queue. (Doesn't touch any widget)
+        """
+        try:
+            simulationResults = simulate(generalParameters, sourceParameters, modulatorParameters, channelParameters, recieverParameters,
+                                         amplifierParameters, includeAmplifier, self.stageCache, self.simulationProgress)
+
+            # Signal power is too low for amplifier detection
+            if simulationResults.get("recieverSignal") is None:
+                self.simulationQueue.put(("detection", None))
+                return
+
+            self.simulationProgress("Calculating values", 1)
+            outputValues = getValues(simulationResults, generalParameters)
+
+            self.simulationQueue.put(("done", (simulationResults, outputValues)))
+
+        except SimulationCancelled:
+            self.simulationQueue.put(("cancelled", None))
+
+        except Exception as e:
+            self.simulationQueue.put(("error", e))
+
+
+    def simulationProgress(self, stage: str, fraction: float):
+        """
+        Progress function of the simulation (called from background thread).
+        Stops the simulation when it was cancelled.
+        """
+        if self.cancelEvent.is_set():
+            raise SimulationCancelled()
+
+        self.simulationQueue.put(("progress", (stage, fraction)))
+
+
+    def checkSimulationQueue(self):
+        """
+        Process messages from simulation thread. Repeats until the simulation ends.
+        """
+        while True:
+            try:
+                message, content = self.simulationQueue.get_nowait()
+            except queue.Empty:
+                break
+
+            if message == "progress":
+                stage, fraction = content
+                self.progressBar.set(fraction)
+                self.progressLabel.configure(text=stage)
+
+            else:
+                self.simulationEnded(message, content)
+                return
+
+        self.after(100, self.checkSimulationQueue)
+
+
+    def simulationEnded(self, message: str, content):
+        """
+        Shows result of the simulation.
+
+        Parameters
+        -----
+        message: "done" / "detection" / "cancelled" / "error"
+
+        content: (simulationResults, outputValues) for "done", exception for "error"
+        """
+        # Unlock simulation start
+        self.simulateButton.configure(state="normal")
+        self.cancelButton.configure(state="disabled")
 
-        # Simulation
-        self.simulationResults = simulate(self.generalParameters, self.sourceParameters, self.modulatorParameters,
-                                           self.channelParameters, self.recieverParameters, self.amplifierParameters, self.amplifierCheckVar.get())
-        
-        # Signal power is too low for amplifier detection
-        if self.simulationResults.get("recieverSignal") is None:
-            messagebox.showerror("Simulation error", "Signal power is too low to be detected by amplifier !")
-            # Clear simulation results
-            self.simulationResults = None
-            return
-        
         # Simulation was succesfull
-        else:
+        if message == "done":
+            self.simulationResults, outputValues = content
             # Show numeric values
-            outputValues = getValues(self.simulationResults, self.generalParameters)
             self.showValues(outputValues)
 
+            self.progressLabel.configure(text="Simulation completed")
             messagebox.showinfo("Simulation status", "Simulation succesfully completed")
 
+        # Signal power is too low for amplifier detection
+        elif message == "detection":
+            self.progressBar.set(0)
+            self.progressLabel.configure(text="")
+            messagebox.showerror("Simulation error", "Signal power is too low to be detected by amplifier !")
+            # Clear simulation results
+            self.simulationResults = None
+
+        elif message == "cancelled":
+            self.progressBar.set(0)
+            self.progressLabel.configure(text="Simulation cancelled")
+            self.simulationResults = None
+
+        elif message == "error":
+            self.progressBar.set(0)
+            self.progressLabel.configure(text="")
+            messagebox.showerror("Simulation error", f"Simulation failed: {content}")
+            self.simulationResults = None
+
+        else: raise Exception("Unexpected error")
+
+
+    def cancelSimulation(self):
+        """
+        Stops running simulation at the next stage boundary.
+        """
+        self.cancelEvent.set()
+        self.progressLabel.configure(text="Cancelling simulation")
+
 
     def amplifierCheckbuttonChange(self):
         """
@@ -659,6 +815,7 @@ class GUI(ctk.CTk):
         self.snrLabel.configure(text=f"Signal to noise ratio: {outputValues.get('SNR'):.3} dB")
         self.berLabel.configure(text=f"Bit error rate: {outputValues.get('BER'):.3}")
         self.serLabel.configure(text=f"Symbol error rate: {outputValues.get('SER'):.3}")
+        self.theoryLabel.configure(text=f"Gap to theory: {outputValues.get('SNRGap'):.3} dB (theoretical BER: {outputValues.get('BERTheory'):.3})")
 
 
     def showTransSpeed(self, transmissionSpeed: float):
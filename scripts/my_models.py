@@ -3,7 +3,16 @@ import numpy as np
 import scipy.constants as const
 
 from optic.utils import dBm2W
-from optic.dsp.core import gaussianComplexNoise
+from optic.dsp.core import gaussianComplexNoise, lowPassFIR
+
+from scripts.stage_cache import StageCache, stageKey
+from scripts.fft_backend import fftfreq, convolveSame
+
+# Cached fiber frequency responses (LRU, 512 MB)
+transferFunctionCache = StageCache(maxBytes=512 * 1024**2)
+# Samples of one chunk of laser model
+LASER_CHUNK = 2**18
+
 
 def edfa(Ei, ideal: bool, param=None) -> np.array:
     """
@@ -32,27 +41,52 @@ def edfa(Ei, ideal: bool, param=None) -> np.array:
     """
     # Input parameters
     G = getattr(param, "G")
-    NF = getattr(param, "NF")
-    Fc = getattr(param, "Fc")
-    Fs = getattr(param, "Fs")
 
     # Ideal amplifier
     if ideal:
         G_lin = 10 ** (G / 10)
 
-        return Ei * np.sqrt(G_lin)
+        # Python float keeps precision of the signal
+        return Ei * float(np.sqrt(G_lin))
     # Not ideal amplifier
     else:
-        NF_lin = 10 ** (NF / 10)
         G_lin = 10 ** (G / 10)
-        nsp = (G_lin * NF_lin - 1) / (2 * (G_lin - 1))
+        p_noise = edfaNoisePower(param)
 
-        N_ase = (G_lin - 1) * nsp * const.h * Fc
-        p_noise = N_ase * Fs
+        return Ei * float(np.sqrt(G_lin)) + complexNoise(Ei.shape, p_noise, Ei.dtype)
+
+
+def edfaNoisePower(param, biased: bool = True) -> float:
+    """
+    Power of ASE noise of EDFA in the simulation bandwidth (Fs).
+
+    Parameters
+    -----
+    param: parameters object (G [dB], NF [dB], Fc [Hz], Fs [Hz], bias (optional, importance sampling scale of noise amplitude))
+
+    biased: noise power is scaled by the importance sampling bias
+    """
+    NF_lin = 10 ** (param.NF / 10)
+    G_lin = 10 ** (param.G / 10)
+    nsp = (G_lin * NF_lin - 1) / (2 * (G_lin - 1))
 
-        noise = gaussianComplexNoise(Ei.shape, p_noise)
+    N_ase = (G_lin - 1) * nsp * const.h * param.Fc
 
-        return Ei * np.sqrt(G_lin) + noise
+    # Importance sampling (biased noise)
+    bias = getattr(param, "bias", 1) if biased else 1
+
+    return N_ase * param.Fs * bias**2
+
+
+def complexNoise(shape, variance: float, dtype=np.complex128) -> np.array:
+    """
+    Circular complex gaussian noise with the precision of the signal.
+    """
+    # Single precision noise for single precision signal
+    if dtype == np.complex64:
+        return gaussianNoise(shape, variance, np.complex64)
+    else:
+        return gaussianComplexNoise(shape, variance)
     
 
 def idealLaser(power: float, length: int) -> np.array:
@@ -69,6 +103,73 @@ def idealLaser(power: float, length: int) -> np.array:
     return np.sqrt(dBm2W(power)) * np.exp(2j * np.pi * samples)
 
 
+def laserModel(power: float, linewidth: float, rin: float, Fs: float, samples: int, dtype=np.complex128, state: dict = None) -> np.array:
+    """
+    Laser with random walk phase noise and RIN (same model as basicLaserModel from OptiCommPy).
+
+    Noise is generated by np.random.Generator (seeded from numpy global random state at the first block) in chunks
+    of LASER_CHUNK samples directly in given precision. Phase of the random walk is accumulated in double precision.
+    Phase noise and RIN have separate generators, so signal generated in blocks is the same as signal generated at once
+    (up to rounding of the accumulated phase).
+
+    Parameters
+    -----
+    power: laser power [dBm]
+
+    linewidth: laser linewidth [Hz]
+
+    rin: variance of RIN (absolute value)
+
+    Fs: sample frequency
+
+    samples: number of samples to be generated
+
+    dtype: complex64 / complex128
+
+    state: Optional. Random walk state carried between blocks (Generators, Phase), empty dictionary for the first block
+
+    Returns
+    -----
+    optical signal
+    """
+    state = {} if state is None else state
+    realType = np.float32 if dtype == np.complex64 else np.float64
+
+    # First sample of the whole signal starts at 0 phase
+    first = "Phase" not in state
+    if first:
+        seeds = np.random.SeedSequence(np.random.randint(2**31)).spawn(2)
+        state.update({"Generators": [np.random.default_rng(seed) for seed in seeds], "Phase": 0.0})
+    phaseGenerator, rinGenerator = state.get("Generators")
+
+    amplitude = np.sqrt(dBm2W(power))
+    deviation = np.sqrt(2 * np.pi * linewidth / Fs)
+
+    signal = np.empty(samples, dtype=dtype)
+    # Real and imaginary parts of the signal (samples x 2)
+    parts = signal.view(realType).reshape(-1, 2)
+
+    for start in range(0, samples, LASER_CHUNK):
+        chunk = parts[start:start + LASER_CHUNK]
+
+        # Random walk continues from the last phase
+        steps = phaseGenerator.standard_normal(len(chunk)) * deviation
+        if first and start == 0:
+            steps[0] = 0
+        phase = state.get("Phase") + np.cumsum(steps)
+        state.update({"Phase": phase[-1]})
+        phase = np.mod(phase, 2 * np.pi).astype(realType, copy=False)
+
+        # Relative intensity noise
+        rinGenerator.standard_normal(chunk.shape, dtype=realType, out=chunk)
+        chunk *= realType(np.sqrt(rin / 2))
+
+        chunk[:, 0] += amplitude * np.cos(phase)
+        chunk[:, 1] += amplitude * np.sin(phase)
+
+    return signal
+
+
 def attenuationChannel(signal, param) -> np.array:
     """
     Channel where only attenuation is aplied.
@@ -85,4 +186,265 @@ def attenuationChannel(signal, param) -> np.array:
     # Attenuation in W
     attenuation = 10**(-attenuation/10)
 
-    return signal * np.sqrt(attenuation)
\ No newline at end of file
+    # Python float keeps precision of the signal
+    return signal * float(np.sqrt(attenuation))
+
+
+def dispersionTransferFunction(param, Nfft: int) -> np.array:
+    """
+    Frequency response of the fiber (attenuation + chromatic dispersion).
+    Responses are cached (same fiber and signal length in next run / sweep point doesn't need to be computed again).
+
+    Parameters
+    -----
+    param: parameters object (L, alpha, D, Fc, Fs)
+
+    Nfft: number of frequency bins
+
+    Returns
+    -----
+    read-only array (shared by all callers with the same parameters)
+    """
+    key = stageKey("fiberResponse", {"L": param.L, "alpha": param.alpha, "D": param.D, "Fc": param.Fc, "Fs": param.Fs, "Nfft": Nfft})
+
+    H = transferFunctionCache.get(key)
+    if H is None:
+        H = fiberResponse(param, Nfft)
+        H.flags.writeable = False
+        transferFunctionCache.put(key, {"H": H})
+    else:
+        H = H.get("H")
+
+    return H
+
+
+def accumulatedDispersionResponse(dispersion: float, Fs: float, Nfft: int) -> np.array:
+    """
+    Frequency response of accumulated chromatic dispersion (all-pass). Responses are cached.
+
+    Parameters
+    -----
+    dispersion: accumulated dispersion, sum of beta2 * L over fibers [s^2]
+
+    Fs: sampling frequency [Hz]
+
+    Nfft: number of frequency bins
+
+    Returns
+    -----
+    read-only array (shared by all callers with the same parameters)
+    """
+    key = stageKey("dispersionResponse", {"Dispersion": dispersion, "Fs": Fs, "Nfft": Nfft})
+
+    H = transferFunctionCache.get(key)
+    if H is None:
+        omega = 2 * np.pi * Fs * fftfreq(Nfft)
+        H = np.exp(1j * (dispersion / 2) * (omega**2))
+        H.flags.writeable = False
+        transferFunctionCache.put(key, {"H": H})
+    else:
+        H = H.get("H")
+
+    return H
+
+
+def fiberBeta2(param) -> float:
+    """
+    Group velocity dispersion parameter beta2 [s^2/km].
+
+    Parameters
+    -----
+    param: parameters object (D [ps/nm/km], Fc [Hz])
+    """
+    c_kms = const.c / 1e3
+    wavelength = c_kms / param.Fc
+
+    return -(param.D * wavelength**2) / (2 * np.pi * c_kms)
+
+
+def fiberResponse(param, Nfft: int) -> np.array:
+    """
+    Computes frequency response of the fiber (attenuation + chromatic dispersion).
+    """
+    alpha = param.alpha / (10 * np.log10(np.exp(1)))
+    beta2 = fiberBeta2(param)
+
+    omega = 2 * np.pi * param.Fs * fftfreq(Nfft)
+
+    return np.exp(-alpha / 2 * param.L + 1j * (beta2 / 2) * (omega**2) * param.L)
+
+
+def photodiode(E, param=None) -> np.array:
+    """
+    Pin photodiode. Edited version from OpticommPY package. Output has the same precision as the input signal.
+
+    Parameters
+    -----
+    E: optical field (1-D or 2-D batch of signals in rows)
+
+    param : parameter object (struct)
+
+        - param.R: responsivity [A/W] (default 1)
+        - param.B: bandwidth [Hz]
+        - param.Fs: sampling frequency [Hz]
+        - param.ideal: without noise and bandwidth limitation (default True)
+        - param.bias: importance sampling scale of noise amplitude (default 1)
+
+    Returns
+    -----
+    photocurrent (real array)
+    """
+    ipd = photodiodeCurrent(E, param)
+
+    if not getattr(param, "ideal", True):
+        # Lowpass filtering (FFT convolution, filter has thousands of taps)
+        ipd = convolveSame(ipd, photodiodeTaps(param).astype(ipd.dtype))
+
+    return ipd
+
+
+def photodiodeCurrent(E, param=None) -> np.array:
+    """
+    Photocurrent of pin photodiode with saturation, shot and thermal noise before bandwidth limitation (photodiode without filter).
+    Output has the same precision as the input signal.
+
+    Parameters
+    -----
+    E: optical field (1-D or 2-D batch of signals in rows)
+
+    param : parameter object of photodiode (same as photodiode)
+
+    Returns
+    -----
+    photocurrent (real array)
+    """
+    kB = const.value("Boltzmann constant")
+    q = const.value("elementary charge")
+
+    R = getattr(param, "R", 1)
+    Tc = getattr(param, "Tc", 25)
+    Id = getattr(param, "Id", 5e-9)
+    RL = getattr(param, "RL", 50)
+    B = getattr(param, "B", 30e9)
+    Ipd_sat = getattr(param, "Ipd_sat", 5e-3)
+    ideal = getattr(param, "ideal", True)
+
+    # Ideal photocurrent
+    ipd = (R * E * np.conj(E)).real
+
+    if not ideal:
+        Fs = getattr(param, "Fs")
+
+        if Fs < 2 * B:
+            raise Exception("Sampling frequency must be at least twice of photodiode bandwidth")
+
+        # Saturation of the photocurrent
+        ipd[ipd > Ipd_sat] = Ipd_sat
+
+        ipd_mean = ipd.mean()
+
+        # Shot noise variance
+        varianceShot = 2 * q * (ipd_mean + Id) * B
+        # Thermal noise variance
+        T = Tc + 273.15
+        varianceThermal = 4 * kB * T * B / RL
+
+        # Importance sampling (biased noise)
+        bias = getattr(param, "bias", 1)
+        varianceShot *= bias**2
+        varianceThermal *= bias**2
+
+        # Noise sources
+        if ipd.dtype == np.float32:
+            Is = gaussianNoise(ipd.shape, Fs * (varianceShot / (2 * B)), np.float32)
+            It = gaussianNoise(ipd.shape, Fs * (varianceThermal / (2 * B)), np.float32)
+        else:
+            Is = np.random.normal(0, np.sqrt(Fs * (varianceShot / (2 * B))), ipd.shape)
+            It = np.random.normal(0, np.sqrt(Fs * (varianceThermal / (2 * B))), ipd.shape)
+
+        ipd += Is + It
+
+    return ipd
+
+
+def photodiodeTaps(param) -> np.array:
+    """
+    Taps of lowpass FIR filter of photodiode bandwidth.
+
+    Parameters
+    -----
+    param : parameter object of photodiode (B, Fs, N (default 8000), fType (default "rect"))
+    """
+    return lowPassFIR(getattr(param, "B", 30e9), getattr(param, "Fs"), getattr(param, "N", 8000), typeF=getattr(param, "fType", "rect"))
+
+
+def coherentReceiver(Es, Elo, param=None) -> np.array:
+    """
+    Single polarization coherent receiver (90° hybrid + balanced photodiodes). Edited version from OpticommPY package.
+    Output has the same precision as the input signal.
+
+    Parameters
+    -----
+    Es: signal optical field (1-D or 2-D, each row is detected with the same local oscilator)
+
+    Elo: local oscilator optical field
+
+    param: parameter object of photodiodes
+    """
+    # Optical 2 x 4 90° hybrid transfer matrix
+    T = np.array([[1 / 2, 1j / 2, 1j / 2, -1 / 2],
+                  [1j / 2, -1 / 2, 1 / 2, 1j / 2],
+                  [1j / 2, 1 / 2, -1j / 2, -1 / 2],
+                  [-1 / 2, 1j / 2, -1 / 2, 1j / 2]], dtype=Es.dtype)
+
+    zeros = np.zeros(Es.shape, dtype=Es.dtype)
+    Elo = np.broadcast_to(Elo.astype(Es.dtype, copy=False), Es.shape)
+    # Hybrid outputs (4 x shape of the signal)
+    Eo = np.tensordot(T, np.array([Es, zeros, zeros, Elo]), axes=1)
+
+    # Balanced photodetection
+    sI = photodiode(Eo[1, :], param) - photodiode(Eo[0, :], param)
+    sQ = photodiode(Eo[2, :], param) - photodiode(Eo[3, :], param)
+
+    return sI + 1j * sQ
+
+
+def polarizationRotation(Ei) -> np.array:
+    """
+    Random rotation of polarization state in the fiber (unitary Jones matrix, same for the whole signal).
+
+    Parameters
+    -----
+    Ei: dual polarization signal (2 x N)
+    """
+    theta = np.random.uniform(0, np.pi)
+    phi = np.random.uniform(0, 2 * np.pi)
+
+    jones = np.array([[np.cos(theta), -np.sin(theta) * np.exp(-1j * phi)],
+                      [np.sin(theta) * np.exp(1j * phi), np.cos(theta)]], dtype=Ei.dtype)
+
+    return jones @ Ei
+
+
+def gaussianNoise(shape, variance: float, dtype) -> np.array:
+    """
+    Gaussian noise generated directly in given precision.
+    Generator is seeded from numpy global random state (so seeding of the simulation applies).
+
+    Parameters
+    -----
+    shape: shape of the noise array
+
+    variance: noise variance (total variance for complex noise)
+
+    dtype: float32 / float64 / complex64 / complex128
+    """
+    dtype = np.dtype(dtype)
+    realType = np.float32 if dtype in [np.float32, np.complex64] else np.float64
+    generator = np.random.default_rng(np.random.randint(2**31))
+
+    if dtype.kind == "c":
+        noise = generator.standard_normal((2,) + tuple(shape), dtype=realType) * realType(np.sqrt(variance / 2))
+        return noise[0] + 1j * noise[1]
+    else:
+        return generator.standard_normal(shape, dtype=realType) * realType(np.sqrt(variance))
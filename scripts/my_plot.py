@@ -4,11 +4,12 @@ import numpy as np
 from scipy.interpolate import interp1d
 from scipy.ndimage.filters import gaussian_filter
 from optic.dsp.core import pnorm, signal_power
-from optic.models.amplification import get_spectrum
 from optic.plot import constHist
 import warnings
 from scipy.constants import c
 
+from scripts.fft_backend import fft, fftfreq, fftshift
+
 warnings.filterwarnings("ignore", r"All-NaN (slice|axis) encountered")
 
 def constellation(x, lim=True, R=1.25, pType="fancy", cmap="turbo", whiteb=True, title="") -> tuple[plt.Figure, plt.Axes]:
@@ -333,7 +334,7 @@ def opticalSpectrum(signal, Fs: int, Fc: float, title: str) -> tuple[plt.Figure,
 
     Fc: central frequency
     """
-    frequency, spectrum = get_spectrum(signal, Fs, Fc, xunits="Hz")
+    frequency, spectrum = getSpectrum(signal, Fs, Fc)
 
     # Wavelength
     wavelength = c / frequency
@@ -369,6 +370,33 @@ def opticalSpectrum(signal, Fs: int, Fc: float, title: str) -> tuple[plt.Figure,
     return fig, (ax1, ax2)
 
 
+def getSpectrum(signal, Fs: int, Fc: float) -> tuple[np.array, np.array]:
+    """
+    Two sided power spectrum of the signal. Same as get_spectrum from OpticommPY package (magnitude spectrum without window).
+
+    Parameters:
+    -----
+    Fs: sampling frequency
+
+    Fc: central frequency
+
+    Returns
+    -----
+    tuple (frequency [Hz], spectrum [dBm])
+    """
+    N = len(signal)
+    magnitude = np.abs(fftshift(fft(signal))) / N
+
+    frequency = fftshift(fftfreq(N, 1 / Fs)) + Fc
+
+    with warnings.catch_warnings():
+        # Zero bins
+        warnings.simplefilter("ignore", RuntimeWarning)
+        spectrum = 10*np.log10(1e3 * magnitude**2)
+
+    return frequency, spectrum
+
+
 def fixTimeUnits(interval: np.array,  Ts: int) -> tuple[np.array, str]:
     """
     Fixes time ax units.
@@ -0,0 +1,135 @@
+import numpy as np
+from optic.comm.modulation import modulateGray, GrayMapping
+from optic.dsp.core import pnorm, signal_power
+
+from scripts.fft_backend import fft, ifft
+from scripts.demapper import demodulateGray
+from scripts.fec import fecEncode
+
+# Default OFDM parameters
+SUBCARRIERS = 64
+CYCLIC_PREFIX = 8
+TRAINING = 4
+# RMS of the modulation signal (OFDM has high peak to average power ratio, lower drive limits clipping of modulator)
+DRIVE = 0.5
+
+
+def ofdmParameters(generalParameters: dict) -> tuple[int, int, int]:
+    """
+    OFDM parameters from general parameters.
+
+    Returns
+    -----
+    tuple (Subcarriers, CP, Training)
+
+    Subcarriers: number of subcarriers
+
+    CP: length of cyclic prefix [OFDM samples] (one OFDM sample is SpS simulation samples)
+
+    Training: number of known OFDM symbols at the start (channel estimation)
+    """
+    return (generalParameters.get("Subcarriers", SUBCARRIERS), generalParameters.get("CP", CYCLIC_PREFIX),
+            generalParameters.get("Training", TRAINING))
+
+
+def ofdmSignal(generalParameters: dict, bits: int, realType, complexType) -> dict:
+    """
+    Generate OFDM modulation signal. QAM symbols of subcarriers are in the rows of one 2-D array (OFDM symbol in each row),
+    whole signal is created with one batched IFFT.
+
+    Parameters
+    -----
+    bits: number of generated bits (rounded down to whole OFDM symbols)
+
+    Returns
+    -----
+        bitsTx, symbolsTx (data QAM symbols), modulationSignal (+ bitsInfo with FEC)
+    """
+    SpS = generalParameters.get("SpS")
+    modulationOrder = generalParameters.get("Order")
+    subcarriers, CP, training = ofdmParameters(generalParameters)
+
+    bitsSymbol = int(np.log2(modulationOrder))
+    blocks = bits // (bitsSymbol * subcarriers)
+
+    # Generate pseudo-random bit sequence
+    bitsTx = np.random.randint(2, size=blocks * subcarriers * bitsSymbol)
+    # Forward error correction (codewords replace the random bits)
+    fecResults = fecEncode(bitsTx, generalParameters.get("FEC")) if generalParameters.get("FEC") else {}
+    bitsTx = fecResults.get("bitsTx", bitsTx)
+
+    # QAM symbols of subcarriers
+    symbolsTx = pnorm(modulateGray(bitsTx, modulationOrder, "qam")).astype(complexType, copy=False)
+
+    # Known symbols at the start + data (OFDM symbols in rows)
+    grid = np.concatenate((trainingSymbols(subcarriers, training), symbolsTx.reshape(blocks, subcarriers))).astype(complexType, copy=False)
+
+    # Subcarriers in the middle of oversampled spectrum (signal is created directly with simulation sampling)
+    Nfft = subcarriers * SpS
+    spectrum = np.zeros((grid.shape[0], Nfft), dtype=complexType)
+    spectrum[:, subcarrierBins(subcarriers, Nfft)] = grid
+
+    # RMS of the signal is DRIVE
+    signal = ifft(spectrum, axis=1, overwrite=True) * float(DRIVE * Nfft / np.sqrt(subcarriers))
+
+    # Cyclic prefix
+    prefix = CP * SpS
+    signal = np.concatenate((signal[:, Nfft - prefix:], signal), axis=1)
+
+    return {**fecResults, "bitsTx":bitsTx, "symbolsTx":symbolsTx, "modulationSignal":signal.reshape(-1)}
+
+
+def ofdmInformation(detectedSignal, generalParameters: dict) -> dict:
+    """
+    Gets bits information from detected OFDM signal. All OFDM symbols are demodulated with one batched FFT,
+    each subcarrier is equalized with one tap estimated from training symbols.
+
+    Returns
+    -----
+    symbolsRx, bitsRx
+    """
+    SpS = generalParameters.get("SpS")
+    modulationOrder = generalParameters.get("Order")
+    subcarriers, CP, training = ofdmParameters(generalParameters)
+
+    Nfft = subcarriers * SpS
+    prefix = CP * SpS
+    blockLength = Nfft + prefix
+    blocks = len(detectedSignal) // blockLength
+
+    # OFDM symbols in rows, FFT window starts in the middle of cyclic prefix (tolerates delay spread on both sides)
+    signal = detectedSignal[:blocks * blockLength].reshape(blocks, blockLength)
+    start = prefix // 2
+    grid = fft(signal[:, start:start + Nfft], axis=1)[:, subcarrierBins(subcarriers, Nfft)]
+
+    # One tap equalizer of each subcarrier (window shift is a phase slope, also equalized)
+    channel = np.mean(grid[:training] / trainingSymbols(subcarriers, training), axis=0)
+    symbolsRx = (grid[training:] / channel).reshape(-1)
+
+    symbolsRx = pnorm(symbolsRx)
+
+    # Demodulate symbols to bits with minimum Euclidean distance (decision regions)
+    Es = signal_power(GrayMapping(modulationOrder, "qam"))
+    bitsRx = demodulateGray(np.sqrt(Es)*symbolsRx, modulationOrder, "qam")
+
+    return {"symbolsRx":symbolsRx, "bitsRx":bitsRx}
+
+
+def subcarrierBins(subcarriers: int, Nfft: int) -> np.ndarray:
+    """
+    FFT bins of subcarriers (symmetrical around zero frequency).
+    """
+    return np.arange(-subcarriers // 2, subcarriers - subcarriers // 2) % Nfft
+
+
+def trainingSymbols(subcarriers: int, training: int) -> np.ndarray:
+    """
+    Known QPSK training symbols (same at Tx and Rx, independent of the simulation random numbers).
+
+    Returns
+    -----
+    training x subcarriers array
+    """
+    phases = np.random.default_rng(0).integers(4, size=(training, subcarriers))
+
+    return np.exp(1j * (np.pi / 2 * phases + np.pi / 4))
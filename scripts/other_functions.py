@@ -1,3 +1,6 @@
+import numpy as np
+from numba import njit
+
 
 def calculateTransSpeed(symbolRate: int, modulationOrder: int) -> int:
     """
@@ -22,4 +25,38 @@ def calculateTransSpeed(symbolRate: int, modulationOrder: int) -> int:
         symbolBits = 8
     else: raise Exception("Unexpected error")
 
-    return symbolRate*symbolBits
\ No newline at end of file
+    return symbolRate*symbolBits
+
+def precisionTypes(precision: str) -> tuple:
+    """
+    Data types of signals for simulation precision.
+
+    Parameters
+    -----
+    precision: "double" / "single"
+
+    Returns
+    -----
+    tuple (real type, complex type)
+    """
+    if precision == "double":
+        return np.float64, np.complex128
+    elif precision == "single":
+        return np.float32, np.complex64
+    else: raise Exception("Unexpected error")
+
+
+@njit
+def seedNumba(seed: int):
+    """
+    Seeds random generator of numba compiled functions (optic noise models). It is independent of numpy generator.
+    """
+    np.random.seed(seed)
+
+
+def setSeed(seed: int):
+    """
+    Seeds numpy and numba random generators.
+    """
+    np.random.seed(seed)
+    seedNumba(seed)
@@ -0,0 +1,124 @@
+from functools import lru_cache
+import numpy as np
+from scipy.special import erf
+from optic.dsp.core import pulseShape, rcFilterTaps, rrcFilterTaps
+
+# Pulse shapes (general parameter "Pulse")
+PULSES = ["nrz", "rect", "rc", "rrc", "gaussian"]
+# Default roll-off of RC and RRC pulses
+ROLL_OFF = 0.1
+# Default bandwidth-time product of gaussian pulse
+BT = 0.5
+# Length of truncated pulses [symbols]
+SPAN = {"rc": 16, "rrc": 16, "gaussian": 4}
+
+
+def pulseShaping(symbolsTx, generalParameters: dict, realType=np.float64, complexType=np.complex128) -> np.ndarray:
+    """
+    Electrical modulation signal from symbols (upsampling and pulse shaping in one step).
+
+    Same signal as zero-stuffing upsampling followed by filtering (np.convolve with mode "same") but no multiplications
+    by the stuffed zeros are done. Output samples of phase p (n*SpS + p) are symbols filtered by polyphase taps of the phase,
+    products are summed in the same order (bit for bit the same signal). Rectangular pulse is repeated symbols.
+
+    Parameters
+    -----
+    symbolsTx: symbols (last axis, more channels can be in rows)
+
+    generalParameters: SpS, Pulse (default "nrz"), RollOff (RC/RRC), BT (gaussian)
+
+    Returns
+    -----
+    modulation signal (complexType, same number of rows as symbols)
+    """
+    SpS = generalParameters.get("SpS")
+    pulse = generalParameters.get("Pulse", "nrz")
+
+    symbolsTx = np.asarray(symbolsTx).astype(complexType, copy=False)
+
+    # Repeated symbols (pulse is aligned the same as filtered pulse)
+    if pulse == "rect":
+        center = (SpS - 1) // 2
+        signal = np.zeros(symbolsTx.shape[:-1] + (symbolsTx.shape[-1] * SpS,), dtype=complexType)
+        signal[..., :signal.shape[-1] - center] = np.repeat(symbolsTx, SpS, axis=-1)[..., center:]
+        return signal
+
+    taps = pulseTaps(pulse, SpS, generalParameters.get("RollOff", ROLL_OFF), generalParameters.get("BT", BT)).astype(realType, copy=False)
+
+    return polyphaseFilter(symbolsTx, taps, SpS)
+
+
+@lru_cache(maxsize=None)
+def pulseTaps(pulse: str, SpS: int, rollOff: float = ROLL_OFF, bt: float = BT) -> np.ndarray:
+    """
+    Impulse response of the pulse (odd length, symmetric, maximum is 1).
+
+    Parameters
+    -----
+    pulse: "nrz" (rectangle filtered by gaussian, as pulseShape from OptiCommPy), "rect", "rc", "rrc", "gaussian" (rectangle filtered by gaussian filter with bandwidth BT / Ts)
+
+    rollOff: roll-off of RC and RRC pulse
+
+    bt: bandwidth-time product of gaussian pulse
+
+    Returns
+    -----
+    taps (float64)
+    """
+    if pulse == "nrz":
+        taps = pulseShape("nrz", SpS)
+
+    elif pulse == "rect":
+        taps = np.ones(SpS)
+
+    elif pulse in ["rc", "rrc", "gaussian"]:
+        # Time of taps [symbols]
+        half = SPAN.get(pulse) * SpS // 2
+        t = np.arange(-half, half + 1) / SpS
+
+        if pulse == "rc":
+            taps = rcFilterTaps(t, rollOff, 1)
+        elif pulse == "rrc":
+            taps = rrcFilterTaps(t, rollOff, 1)
+        else:
+            scale = np.pi * bt * np.sqrt(2 / np.log(2))
+            taps = 0.5 * (erf(scale * (t + 0.5)) - erf(scale * (t - 0.5)))
+
+    else: raise Exception("Unexpected error")
+
+    taps = taps / max(abs(taps))
+    taps.flags.writeable = False
+
+    return taps
+
+
+def polyphaseFilter(symbols, taps, SpS: int) -> np.ndarray:
+    """
+    Upsampling by SpS and filtering with taps (np.convolve with mode "same" of zero-stuffed symbols) by polyphase components.
+
+    Returns
+    -----
+    filtered signal (same number of rows as symbols)
+    """
+    N = symbols.shape[-1]
+    center = (len(taps) - 1) // 2
+
+    # Delays (in symbols) of taps for all phases, taps out of the pulse are zero
+    first = -((center + SpS - 1) // SpS)
+    last = (len(taps) - 1 - center) // SpS
+    delays = np.arange(first, last + 1)
+    indexes = delays[np.newaxis, :] * SpS + np.arange(SpS)[:, np.newaxis] + center
+    valid = (indexes >= 0) & (indexes < len(taps))
+    # Polyphase taps (phases x delays)
+    phaseTaps = np.where(valid, taps[np.clip(indexes, 0, len(taps) - 1)], 0).astype(taps.dtype)
+
+    rows = symbols.reshape(-1, N)
+    # Phases of each row (rows x phases x symbols)
+    phases = np.empty((rows.shape[0], SpS, N), dtype=symbols.dtype)
+    # Each phase is filtered by its taps (products are summed in the same order as in filtering of upsampled signal)
+    for row, output in zip(rows, phases):
+        for phase in range(SpS):
+            output[phase] = np.convolve(row, phaseTaps[phase], mode="full")[-first:N - first]
+
+    # Interleaving of the phases
+    return phases.transpose(0, 2, 1).reshape(symbols.shape[:-1] + (N * SpS,))
@@ -0,0 +1,353 @@
+import numpy as np
+from numba import njit
+from optic.comm.modulation import GrayMapping
+
+from scripts.demapper import decisionTable
+from scripts.my_models import accumulatedDispersionResponse
+from scripts.pulse_shaping import pulseTaps, ROLL_OFF, BT
+from scripts.fft_backend import fft, filterSpectrum
+
+# Stages of reciever DSP (general parameter "DSP", list of stages in order)
+STAGES = ["cd", "matched", "timing", "equalizer", "cpr"]
+# Length of averaging window of carrier phase recovery [symbols]
+PHASE_WINDOW = 65
+# Number of test phases of blind phase search
+TEST_PHASES = 32
+# Symbols of one chunk of blind phase search (limits memory of test phases x symbols arrays)
+CHUNK = 2**15
+# Loop gains of Gardner timing recovery (proportional, integral)
+GARDNER_GAINS = (0.05, 0.0005)
+
+
+def recieverDSP(signal, generalParameters: dict, dispersion: float = 0.0) -> np.ndarray:
+    """
+    Filtering stages of reciever DSP ("cd" and "matched" of general parameter "DSP").
+
+    Both stages are linear filters, their frequency responses are multiplied and applied with one FFT pair.
+    Sampling phase ("timing"), adaptive equalizer ("equalizer") and carrier phase recovery ("cpr") are done in restoreInformation.
+
+    Parameters
+    -----
+    signal: detected signal (1-D or 2-D batch of signals in rows)
+
+    generalParameters: DSP, Fs, SpS, Pulse (+ RollOff, BT)
+
+    dispersion: accumulated dispersion of the link, sum of beta2 * L over fibers [s^2]
+
+    Returns
+    -----
+    filtered signal
+    """
+    stages = generalParameters.get("DSP", [])
+
+    for stage in stages:
+        if stage not in STAGES:
+            raise Exception(f"Unknown reciever DSP stage: {stage}")
+
+    N = signal.shape[-1]
+    H = None
+
+    if "cd" in stages:
+        if not np.iscomplexobj(signal):
+            raise Exception("Chromatic dispersion compensation needs coherent reciever")
+        H = cdCompensationResponse(dispersion, generalParameters.get("Fs"), N)
+
+    if "matched" in stages:
+        if generalParameters.get("Format") == "ofdm":
+            raise Exception("Matched filter is not available for OFDM")
+        matched = matchedFilterResponse(generalParameters, N)
+        H = matched if H is None else H * matched
+
+    if H is None:
+        return signal
+
+    filtered = filterSpectrum(signal, H)
+
+    # Real signal stays real (matched filter is real and symmetric)
+    return filtered if np.iscomplexobj(signal) else filtered.real
+
+
+def cdCompensationResponse(dispersion: float, Fs: float, N: int) -> np.ndarray:
+    """
+    Frequency response of chromatic dispersion compensation. Inverse of the all-pass response of the channel
+    (the same cached response as in the channel is used).
+
+    Parameters
+    -----
+    dispersion: accumulated dispersion [s^2]
+
+    Fs: sampling frequency [Hz]
+
+    N: number of samples
+    """
+    return accumulatedDispersionResponse(dispersion, Fs, N).conj()
+
+
+def matchedFilterResponse(generalParameters: dict, N: int) -> np.ndarray:
+    """
+    Frequency response of the filter matched to the transmitted pulse (circular, zero phase, unit gain at DC).
+
+    Parameters
+    -----
+    N: number of samples
+
+    Returns
+    -----
+    real frequency response
+    """
+    taps = pulseTaps(generalParameters.get("Pulse", "nrz"), generalParameters.get("SpS"),
+                     generalParameters.get("RollOff", ROLL_OFF), generalParameters.get("BT", BT))
+    # Pulse is symmetric (matched filter is the same pulse)
+    taps = taps / np.sum(taps)
+    center = (len(taps) - 1) // 2
+
+    # Taps around sample 0 (circular)
+    h = np.zeros(N)
+    h[:len(taps) - center] = taps[center:]
+    h[N - center:] = taps[:center]
+
+    return fft(h).real
+
+
+def carrierPhaseRecovery(symbols, modulationFormat: str, modulationOrder: int, training=None, window: int = PHASE_WINDOW,
+                         testPhases: int = TEST_PHASES) -> np.ndarray:
+    """
+    Carrier phase recovery (laser phase noise). Viterbi-Viterbi for PSK, blind phase search for QAM.
+
+    Estimated phase is unwrapped (its ambiguity is the symmetry of the constellation). Remaining ambiguity is
+    resolved with the training symbols.
+
+    Parameters
+    -----
+    symbols: received symbols (1-D or 2-D batch of signals in rows)
+
+    training: Optional. Known symbols at the start (same rows as symbols)
+
+    window: number of symbols of phase averaging (odd number)
+
+    testPhases: number of test phases of blind phase search
+
+    Returns
+    -----
+    symbols with removed phase
+    """
+    if modulationFormat == "psk":
+        period = 2 * np.pi / modulationOrder
+        phase = np.stack([viterbiViterbi(row, modulationOrder, window) for row in symbols.reshape(-1, symbols.shape[-1])])
+    elif modulationFormat == "qam":
+        period = np.pi / 2
+        phase = np.stack([blindPhaseSearch(row, modulationOrder, window, testPhases) for row in symbols.reshape(-1, symbols.shape[-1])])
+    else:
+        raise Exception("Carrier phase recovery is available only for PSK and QAM")
+
+    symbols = symbols * np.exp(-1j * phase.reshape(symbols.shape)).astype(symbols.dtype, copy=False)
+
+    # Rotation by multiple of the period (ambiguity of the estimation) to the training symbols
+    if training is not None:
+        length = training.shape[-1]
+        offset = np.angle(np.sum(symbols[..., :length] * np.conj(training), axis=-1, keepdims=True))
+        symbols = symbols * np.exp(-1j * period * np.round(offset / period)).astype(symbols.dtype, copy=False)
+
+    return symbols
+
+
+def viterbiViterbi(symbols, M: int, window: int = PHASE_WINDOW) -> np.ndarray:
+    """
+    Viterbi-Viterbi phase estimation of M-PSK (modulation is removed by M-th power, averaged over the window).
+
+    Returns
+    -----
+    unwrapped phase of each symbol
+    """
+    # Phase of points of the constellation after M-th power
+    reference = M * np.angle(GrayMapping(M, "psk")[0])
+
+    sums = windowSum(symbols.astype(np.complex128)**M, window)
+    # Unwrapped before division (ambiguity of the phase is 2*pi / M)
+    return np.unwrap(np.angle(sums) - reference) / M
+
+
+def blindPhaseSearch(symbols, M: int, window: int = PHASE_WINDOW, testPhases: int = TEST_PHASES) -> np.ndarray:
+    """
+    Blind phase search of square QAM. Symbols are rotated by all test phases at once, the phase with minimal sum
+    of squared distances to the nearest points (over the window) is chosen.
+
+    Returns
+    -----
+    unwrapped phase of each symbol
+    """
+    const, grid, step, start = decisionTable(M, "qam")
+    levels = grid.shape[0]
+    # Symbols on the constellation scale
+    symbols = symbols * np.sqrt(np.mean(np.abs(const)**2) / np.mean(np.abs(symbols)**2))
+
+    # Test phases in one quadrant (QAM has pi/2 symmetry), symbols are rotated back by the test phase
+    phases = (np.arange(testPhases) / testPhases - 0.5) * np.pi / 2
+    rotations = np.exp(-1j * phases)[:, np.newaxis]
+
+    N = len(symbols)
+    half = window // 2
+    best = np.empty(N, dtype=np.int64)
+
+    for first in range(0, N, CHUNK):
+        last = min(first + CHUNK, N)
+        # Chunk with symbols of the windows at its edges
+        extended = symbols[max(first - half, 0):last + half]
+        rotated = rotations * extended
+
+        # Distance to the nearest point (I and Q levels are independent)
+        nearestI = np.clip(np.rint((rotated.real - start) / step), 0, levels - 1) * step + start
+        nearestQ = np.clip(np.rint((rotated.imag - start) / step), 0, levels - 1) * step + start
+        distances = (rotated.real - nearestI)**2 + (rotated.imag - nearestQ)**2
+
+        # Sums over the windows of the chunk symbols (test phases x chunk)
+        sums = windowSum(distances, window)
+        offset = first - max(first - half, 0)
+        best[first:last] = np.argmin(sums[:, offset:offset + last - first], axis=0)
+
+    # Ambiguity of the phase is pi/2
+    return np.unwrap(phases[best], period=np.pi / 2)
+
+
+def windowSum(x, window: int) -> np.ndarray:
+    """
+    Sums over centered windows along the last axis (cumulative sum, windows at the edges are shorter).
+    """
+    half = window // 2
+    padding = [(0, 0)] * (x.ndim - 1) + [(half + 1, half)]
+    cumulative = np.cumsum(np.pad(x, padding), axis=-1)
+
+    return cumulative[..., window:] - cumulative[..., :-window]
+
+
+def timingOffset(signal, SpS: int, criterion: str = "variance", constellation=None, training=None) -> int:
+    """
+    Best sampling offset of symbols. All SpS offsets are evaluated at once on a (symbols x SpS) view of the signal,
+    column j has samples k*SpS + j - SpS/2 (symbol k is at sample k*SpS without timing error).
+
+    Parameters
+    -----
+    signal: detected signal (1-D or 2-D batch of signals in rows, offset is common)
+
+    criterion: "variance" (maximal variance of samples, blind) / "eye" (maximal eye opening on the training symbols)
+
+    constellation: constellation points (unit average power), "eye" criterion
+
+    training: known symbols at the start, "eye" criterion
+
+    Returns
+    -----
+    offset of symbols [samples] (-SpS/2 .. SpS/2 - 1), symbol k is at sample k*SpS + offset
+    """
+    symbols = signal.shape[-1] // SpS
+    # Samples around the symbols (rows x symbols x SpS)
+    view = shiftSamples(signal, -(SpS // 2))[..., :symbols * SpS].reshape(-1, symbols, SpS)
+
+    if criterion == "variance":
+        score = np.sum(np.var(view, axis=1), axis=0)
+
+    elif criterion == "eye":
+        if training is None or view.shape[0] != 1:
+            raise Exception("Eye opening criterion needs training symbols of single polarization signal")
+        length = min(len(training), symbols)
+        # DC level (direct detection) is removed, training symbols have unit power
+        samples = view[0, :length] - np.mean(view[0, :length], axis=0)
+        reference = np.asarray(training[:length])[:, np.newaxis]
+        reference = reference - np.mean(reference)
+        reference = reference / np.sqrt(np.mean(np.abs(reference)**2))
+
+        # Gain (and rotation) of each offset fitted to the training symbols
+        gain = np.sum(np.conj(reference) * samples, axis=0) / np.sum(np.abs(reference)**2)
+        # Worst deviation from the symbols (scale of the constellation)
+        deviation = np.max(np.abs(samples - reference * gain), axis=0) / np.maximum(np.abs(gain), 1e-300)
+
+        constellation = np.asarray(constellation)
+        distances = np.abs(constellation[:, np.newaxis] - constellation[np.newaxis, :])
+        # Eye opening (half of the minimal distance of points minus the worst deviation)
+        score = np.min(distances[distances > 0]) / 2 - deviation
+
+    else: raise Exception("Unexpected error")
+
+    return int(np.argmax(score)) - SpS // 2
+
+
+def shiftSamples(signal, offset: int) -> np.ndarray:
+    """
+    Moves signal by offset samples (sample at offset is moved to 0), length of the signal stays the same.
+    Samples missing at the edge are copies of the edge sample (symbol at the edge is sampled at the nearest existing sample).
+
+    Parameters
+    -----
+    signal: signal (1-D or 2-D batch of signals in rows)
+
+    offset: offset of symbols [samples] (timingOffset)
+    """
+    N = signal.shape[-1]
+    start = max(offset, 0)
+    padding = [(0, 0)] * (signal.ndim - 1) + [(max(-offset, 0), start)]
+
+    return np.pad(signal, padding, mode="edge")[..., start:start + N]
+
+
+def gardnerRecovery(samples, SpS: int, symbols: int, state: dict) -> np.ndarray:
+    """
+    Gardner timing recovery of block of samples (streaming). Symbols are interpolated at times k*SpS + tau,
+    timing offset tau is updated by loop filter (PI) from Gardner detector Re[(y[k] - y[k-1]) * conj(y[k - 1/2])]
+    (positive error means late sampling).
+
+    Loop state (timing offset, integrator, previous symbol and samples before the block) is carried to the next block.
+
+    Parameters
+    -----
+    samples: samples of the block, symbol k is around sample k*SpS (at least symbols*SpS + SpS/2 + 2 samples)
+
+    symbols: number of symbols to recover
+
+    state: loop state (empty dictionary for the first block)
+
+    Returns
+    -----
+    recovered symbols
+    """
+    samples = np.asarray(samples).astype(np.complex128)
+    history = state.get("History", np.zeros(SpS, dtype=np.complex128))
+    # Samples before the block (middle samples of the first symbol)
+    extended = np.concatenate((history, samples))
+
+    loop = np.array([state.get("Tau", 0.0), state.get("Integral", 0.0)])
+    previous = np.array([state.get("Previous", 0j)])
+    y = gardnerLoop(extended, SpS, len(history), symbols, loop, previous, *GARDNER_GAINS)
+
+    state.update({"Tau": loop[0], "Integral": loop[1], "Previous": previous[0],
+                  "History": extended[len(history) + symbols * SpS - SpS:len(history) + symbols * SpS]})
+
+    return y
+
+
+@njit
+def gardnerLoop(x, SpS, start, symbols, loop, previous, kp, ki):
+    """
+    Loop of Gardner timing recovery (compiled). Loop state (tau, integral) and previous symbol are updated in place.
+    """
+    y = np.empty(symbols, dtype=np.complex128)
+    limit = SpS / 2 - 1
+
+    for k in range(symbols):
+        # Symbol and middle sample (linear interpolation)
+        time = start + k * SpS + loop[0]
+        index = int(np.floor(time))
+        fraction = time - index
+        y[k] = x[index] + fraction * (x[index + 1] - x[index])
+
+        time = time - SpS / 2
+        index = int(np.floor(time))
+        fraction = time - index
+        middle = x[index] + fraction * (x[index + 1] - x[index])
+
+        # Timing error and PI loop filter (offset stays inside the symbol)
+        error = ((y[k] - previous[0]) * np.conj(middle)).real
+        loop[1] -= ki * error
+        loop[0] = min(max(loop[0] - kp * error + loop[1], -limit), limit)
+        previous[0] = y[k]
+
+    return y
@@ -1,96 +1,296 @@
 
+import copy
 import numpy as np
 from optic.utils import parameters
 import matplotlib.pyplot as plt
-from commpy.utilities  import upsample
-from optic.models.devices import mzm, photodiode, basicLaserModel, iqm, coherentReceiver, pm
-from optic.models.channels import linearFiberChannel
-from optic.comm.modulation import modulateGray, GrayMapping, demodulateGray
-from optic.dsp.core import pulseShape, pnorm, signal_power
-from optic.comm.metrics import fastBERcalc
-try:
-    from optic.dsp.coreGPU import firFilter    
-except ImportError:
-    from optic.dsp.core import firFilter
-
-from scripts.my_models import edfa, idealLaser
-from scripts.my_plot import eyediagram, constellation, opticalSpectrum, electricalInTime, opticalInTime
-from scripts.other_functions import calculateTransSpeed
-from scripts.my_models import attenuationChannel
+from optic.models.devices import mzm, iqm, pm
+from optic.comm.modulation import modulateGray, GrayMapping
+from optic.dsp.core import pnorm, signal_power
 
-def simulate(generalParameters: dict, sourceParameters: dict, modulatorParameters: dict, channelParameters: dict, recieverParameters: dict, amplifierParameters: dict, includeAmplifier: bool) -> dict:
+from scripts.my_models import (idealLaser, photodiode, coherentReceiver, accumulatedDispersionResponse, fiberBeta2, edfaNoisePower, complexNoise,
+                               polarizationRotation, laserModel)
+from scripts.my_plot import eyediagram, constellation, opticalSpectrum, electricalInTime, opticalInTime
+from scripts.other_functions import calculateTransSpeed, setSeed, precisionTypes
+from scripts.stage_cache import StageCache, stageKey, stageSeed
+from scripts.demapper import demodulateGray, fastBERcalc, alignSymbols, semiAnalyticBER, importanceSamplingBER
+from scripts.theory import theoryValues
+from scripts.fft_backend import fft, ifft
+from scripts.ssfm import ssfmChannel
+from scripts.ofdm import ofdmSignal, ofdmInformation, ofdmParameters
+from scripts.equalizer import mimoEqualizer, blockEqualizer, TRAINING
+from scripts.fec import fecEncode, fecDecode, fecParameters
+from scripts.pulse_shaping import pulseShaping
+from scripts.reciever_dsp import recieverDSP, carrierPhaseRecovery, timingOffset, shiftSamples
+
+def simulate(generalParameters: dict, sourceParameters: dict, modulatorParameters: dict, channelParameters: dict, recieverParameters: dict, amplifierParameters: dict, includeAmplifier: bool, cache: StageCache | None = None, progress=None, seed: int = 123,
+             precision: str = "double") -> dict:
     """
     Simulate communication.
 
+    Parameters
+    -----
+    cache: Optional. Results of stages whose parameters (and upstream stages) didn't change are reused from the cache.
+
+    progress: Optional. Function progress(stage, fraction) called before each stage. It can stop the simulation by raising SimulationCancelled.
+
+    seed: seed of random numbers (stages are seeded from it and their parameters)
+
+    precision: "double" (float64 / complex128) or "single" (float32 / complex64) signals thru the whole chain
+
+    Polarizations (general parameters, optional): 2 gives dual polarization simulation, signals (except carrier) are 2 x N arrays
+
+    FEC (general parameters, optional): "bch" / "ldpc" forward error correction of the transmitted bits
+
+    ImportanceSampling (general parameters, optional): amplitude scale of ASE and reciever noise (> 1), noise-free reference
+    of the channel and detection is simulated with the same random numbers, getValues estimates BER of the unbiased noise
+    from the injected noise at the decision (single polarization without OFDM and adaptive equalizer)
+
     Returns
     -----
     simulationResults: bitsTx, symbolsTx, modulationSignal, carrierSignal, modulatedSignal, recieverSignal, detectedSignal, symbolsRx, bitsRx
+    (+ bitsInfo, bitsDecoded with FEC, detectedReference and noiseRx with importance sampling)
 
     ! error with detection of amplifier and signal power => recieverSignal is None
     """
 
     # Each time random numbers
-    np.random.seed(seed=123)
+    setSeed(seed)
 
     Fs = generalParameters.get("Fs")
     # Correct units (THz -> Hz)
     frequency = sourceParameters.get("Frequency")*10**12
 
+    SpS = generalParameters.get("SpS")
+    modulationFormat = generalParameters.get("Format")
+    modulationOrder = generalParameters.get("Order")
+    polarizations = generalParameters.get("Polarizations", 1)
+
+    # Stage keys (parameters of the stage + keys of upstream stages)
+    modulationStage = {"SpS": SpS, "Format": modulationFormat, "Order": modulationOrder, "Seed": seed}
+    # Dual polarization
+    if polarizations != 1:
+        modulationStage.update({"Polarizations": polarizations})
+    # Forward error correction
+    if generalParameters.get("FEC"):
+        modulationStage.update({"FEC": generalParameters.get("FEC")})
+    # Pulse shape (NRZ keeps the original keys)
+    if generalParameters.get("Pulse", "nrz") != "nrz":
+        modulationStage.update({key: generalParameters.get(key) for key in ["Pulse", "RollOff", "BT"] if key in generalParameters})
+    # OFDM parameters
+    if modulationFormat == "ofdm":
+        modulationStage.update(dict(zip(["Subcarriers", "CP", "Training"], ofdmParameters(generalParameters))))
+    # Double precision keeps its original keys (and so the same random numbers)
+    if precision != "double":
+        modulationStage.update({"Precision": precision})
+    modulationKey = stageKey("modulationSignal", modulationStage)
+    carrierKey = stageKey("carrierSignal", {**sourceParameters, "Fs": Fs}, [modulationKey])
+    modulateKey = stageKey("modulate", {**modulatorParameters, "Format": modulationFormat, "Order": modulationOrder}, [modulationKey, carrierKey])
+    fiberStage = {"Channel": sorted(channelParameters.items()), "Amplifier": sorted(amplifierParameters.items()) if includeAmplifier else None,
+                  "Fs": Fs, "Frequency": frequency}
+    detectionStage = {**recieverParameters, "Fs": Fs}
+    # Biased noise (importance sampling)
+    noiseBias = generalParameters.get("ImportanceSampling", 1)
+    if noiseBias != 1:
+        if polarizations != 1 or modulationFormat == "ofdm" or "equalizer" in generalParameters.get("DSP", []):
+            raise Exception("Importance sampling needs single polarization signal without OFDM and adaptive equalizer")
+        fiberStage.update({"Bias": noiseBias})
+        detectionStage.update({"Bias": noiseBias})
+    fiberKey = stageKey("fiberTransmition", fiberStage, [modulateKey])
+    detectionKey = stageKey("detection", detectionStage, [fiberKey, carrierKey])
+
     # Output dictionary
     simulationResults = {}
  
     # Adds bitsTx, symbolsTx, modulationSignal
-    simulationResults.update(modulationSignal(generalParameters))
+    reportProgress(progress, "Modulation signal", 0/6)
+    simulationResults.update(runStage(cache, modulationKey, lambda: modulationSignal(generalParameters, precision)))
     # Adds carrierSignal
-    simulationResults.update(carrierSignal(sourceParameters, Fs, simulationResults.get("modulationSignal")))
+    reportProgress(progress, "Carrier signal", 1/6)
+    # One laser for both polarizations
+    carrierReference = simulationResults.get("modulationSignal") if polarizations == 1 else simulationResults.get("modulationSignal")[0]
+    simulationResults.update(runStage(cache, carrierKey, lambda: carrierSignal(sourceParameters, Fs, carrierReference)))
     # Adds modulatedSignal
-    simulationResults.update(modulate(modulatorParameters, simulationResults.get("modulationSignal"), simulationResults.get("carrierSignal"), generalParameters))
+    reportProgress(progress, "Modulation", 2/6)
+    simulationResults.update(runStage(cache, modulateKey, lambda: modulate(modulatorParameters, simulationResults.get("modulationSignal"), simulationResults.get("carrierSignal"), generalParameters)))
     # Adds recieverSignal
-    simulationResults.update(fiberTransmition(channelParameters, amplifierParameters, simulationResults.get("modulatedSignal"), Fs, frequency, includeAmplifier))
+    reportProgress(progress, "Fiber transmition", 3/6)
+    simulationResults.update(runStage(cache, fiberKey, lambda: fiberTransmition(channelParameters, amplifierParameters, simulationResults.get("modulatedSignal"), Fs, frequency, includeAmplifier, noiseBias)))
     
     # Error with amplifier detection (signal is too low)
     if simulationResults.get("recieverSignal") is None:
         return simulationResults
     
     # Adds detectedSignal
-    simulationResults.update(detection(recieverParameters, simulationResults.get("recieverSignal"), simulationResults.get("carrierSignal"), generalParameters))
-    # Adds symbolsRx, bitsRx
-    simulationResults.update(restoreInformation(simulationResults.get("detectedSignal"), generalParameters))
+    reportProgress(progress, "Detection", 4/6)
+    simulationResults.update(runStage(cache, detectionKey, lambda: detection(recieverParameters, simulationResults.get("recieverSignal"), simulationResults.get("carrierSignal"), generalParameters)))
+    # Adds detectedReference (noise-free signal of importance sampling)
+    if noiseBias != 1:
+        referenceKey = stageKey("noiseReference", {}, [fiberKey, detectionKey])
+        simulationResults.update(runStage(cache, referenceKey, lambda: noiseReference(channelParameters, amplifierParameters, recieverParameters, simulationResults.get("modulatedSignal"),
+                                                                                      simulationResults.get("carrierSignal"), generalParameters, frequency, includeAmplifier,
+                                                                                      [stageSeed(fiberKey), stageSeed(detectionKey)])))
+    # Adds symbolsRx, bitsRx (not cached, getValues changes symbols in place)
+    reportProgress(progress, "Restoring information", 5/6)
+    # Accumulated dispersion of the link (dispersion compensation)
+    dispersion = linkDispersion(channelElements(channelParameters, amplifierParameters, Fs, frequency, includeAmplifier))
+    simulationResults.update(restoreInformation(simulationResults.get("detectedSignal"), generalParameters, simulationResults.get("symbolsTx"), dispersion,
+                                                simulationResults.get("detectedReference")))
+    # Adds bitsDecoded
+    if generalParameters.get("FEC"):
+        reportProgress(progress, "FEC decoding", 5.5/6)
+        simulationResults.update(fecDecode(simulationResults.get("bitsRx"), simulationResults.get("symbolsRx"), generalParameters))
+    reportProgress(progress, "Done", 1)
 
     return simulationResults
 
 
-def modulationSignal(generalParameters: dict) -> dict:
+class SimulationCancelled(Exception):
+    """
+    Raised by progress function to stop the simulation at the next stage (or block) boundary.
+    """
+
+
+def reportProgress(progress, stage: str, fraction: float):
+    """
+    Reports simulation progress.
+
+    Parameters
+    -----
+    progress: function progress(stage, fraction) or None
+
+    stage: name of the stage which is starting
+
+    fraction: done part of the simulation (0 - 1)
+    """
+    if progress is not None:
+        progress(stage, fraction)
+
+
+def runStage(cache: StageCache | None, key: str, stage) -> dict:
+    """
+    Get stage results from the cache or compute them.
+
+    Parameters
+    -----
+    cache: StageCache object or None (no caching)
+
+    key: content key of the stage
+
+    stage: function without arguments returning stage results
+
+    Returns
+    -----
+    stage results
+    """
+    if cache is not None:
+        results = cache.get(key)
+        if results is not None:
+            return results
+
+    # Random numbers of the stage depends only on its key
+    setSeed(stageSeed(key))
+    results = stage()
+
+    if cache is not None:
+        cache.put(key, results)
+
+    return results
+
+
+def modulationSignal(generalParameters: dict, precision: str = "double", channels: int = 1, symbols: int = 10**6) -> dict:
     """
     Generate electrical modulation signal (voltage).
 
+    Parameters
+    -----
+    precision: "double" / "single" precision of the signal
+
+    channels: number of channels, more than 1 gives batch of signals (channels x samples arrays)
+
+    symbols: number of symbols of each channel
+
     Returns
     -----
-        bitsTx, symbolsTx, modulationSignal
+        bitsTx, symbolsTx, modulationSignal (+ bitsInfo with FEC)
     """
-    SpS = generalParameters.get("SpS")
     modulationOrder = generalParameters.get("Order")
     modulationFormat = generalParameters.get("Format")
+    polarizations = generalParameters.get("Polarizations", 1)
+    code = generalParameters.get("FEC")
+
+    if code and channels > 1:
+        raise Exception("FEC is not supported in WDM simulation")
+
+    # Dual polarization (polarizations are generated as batch 2 x length)
+    if polarizations == 2:
+        if channels > 1 or modulationFormat == "ofdm":
+            raise Exception("Dual polarization is supported only for single channel simulation without OFDM")
+        return modulationBatch(generalParameters, precision, 2, symbols)
+    elif polarizations != 1: raise Exception("Unexpected error")
+
+    # Batch of channels
+    if channels > 1:
+        return modulationBatch(generalParameters, precision, channels, symbols)
+
+    # OFDM (QAM subcarriers)
+    if modulationFormat == "ofdm":
+        return ofdmSignal(generalParameters, int(np.log2(modulationOrder)*symbols), *precisionTypes(precision))
     
     # Generate pseudo-random bit sequence
-    bitsTx = np.random.randint(2, size=int(np.log2(modulationOrder)*1e6))
+    bitsTx = np.random.randint(2, size=int(np.log2(modulationOrder)*symbols))
+    # Forward error correction (codewords replace the random bits)
+    fecResults = fecEncode(bitsTx, code) if code else {}
+    bitsTx = fecResults.get("bitsTx", bitsTx)
 
     # Generate modulated symbol sequence
     symbolsTx = modulateGray(bitsTx, modulationOrder, modulationFormat)
     # Power normalization
     symbolsTx = pnorm(symbolsTx)
 
-    # Upsampling
-    symbolsUp = upsample(symbolsTx, SpS)
+    realType, complexType = precisionTypes(precision)
+    symbolsTx = symbolsTx.astype(complexType if np.iscomplexobj(symbolsTx) else realType, copy=False)
+
+    # Upsampling and pulse shaping (NRZ pulse by default)
+    signalTx = pulseShaping(symbolsTx, generalParameters, realType, complexType)
+
+    return {**fecResults, "bitsTx":bitsTx, "symbolsTx":symbolsTx, "modulationSignal":signalTx}
+
+
+def modulationBatch(generalParameters: dict, precision: str, channels: int, symbols: int) -> dict:
+    """
+    Generate electrical modulation signals of more channels at once.
+
+    Returns
+    -----
+        bitsTx, symbolsTx, modulationSignal (arrays channels x length) (+ bitsInfo with FEC, codewords continue thru rows)
+    """
+    modulationOrder = generalParameters.get("Order")
+    modulationFormat = generalParameters.get("Format")
+
+    # OFDM channels are generated one by one
+    if modulationFormat == "ofdm":
+        signals = [ofdmSignal(generalParameters, int(np.log2(modulationOrder)*symbols), *precisionTypes(precision)) for _ in range(channels)]
+        return {key: np.stack([signal.get(key) for signal in signals]) for key in signals[0]}
 
-    # Typical NRZ pulse
-    pulse = pulseShape("nrz", SpS)
-    pulse = pulse/max(abs(pulse))
+    # Generate pseudo-random bit sequences
+    bitsTx = np.random.randint(2, size=(channels, int(np.log2(modulationOrder)*symbols)))
+    # Forward error correction (codewords replace the random bits)
+    code = generalParameters.get("FEC")
+    fecResults = fecEncode(bitsTx, code) if code else {}
+    bitsTx = fecResults.get("bitsTx", bitsTx)
 
-    # Pulse shaping
-    signalTx = firFilter(pulse, symbolsUp)
+    # Generate modulated symbol sequences (all channels at once)
+    symbolsTx = modulateGray(bitsTx.reshape(-1), modulationOrder, modulationFormat).reshape(channels, -1)
+    # Power normalization
+    symbolsTx = pnorm(symbolsTx)
+
+    realType, complexType = precisionTypes(precision)
+    symbolsTx = symbolsTx.astype(complexType if np.iscomplexobj(symbolsTx) else realType, copy=False)
+
+    # Upsampling and pulse shaping (rows are channels)
+    signalTx = pulseShaping(symbolsTx, generalParameters, realType, complexType)
 
-    return {"bitsTx":bitsTx, "symbolsTx":symbolsTx, "modulationSignal":signalTx}
+    return {**fecResults, "bitsTx":bitsTx, "symbolsTx":symbolsTx, "modulationSignal":signalTx}
 
 
 def carrierSignal(sourceParameters: dict, Fs: int, modulationSignal) -> dict:
@@ -101,45 +301,54 @@ def carrierSignal(sourceParameters: dict, Fs: int, modulationSignal) -> dict:
     -----
     Fs: sample frequency
 
-    modulationSignal: to match both signals lengths
+    modulationSignal: to match both signals lengths (and precision)
 
     Returns
     -----
     carrierSignal
     """
+    # Same precision as modulation signal
+    complexType = np.complex64 if modulationSignal.dtype in [np.float32, np.complex64] else np.complex128
+
+    # Batch of channels (one laser for each channel)
+    if modulationSignal.ndim == 2:
+        carriers = [carrierSignal(sourceParameters, Fs, channel).get("carrierSignal") for channel in modulationSignal]
+        return {"carrierSignal":np.stack(carriers)}
+
     # Ideal source
     if sourceParameters.get("Ideal"):
         power = sourceParameters.get("Power")
         samples = len(modulationSignal)
         
-        return{"carrierSignal":idealLaser(power, samples)}
+        return{"carrierSignal":idealLaser(power, samples).astype(complexType, copy=False)}
     
     else:
         # Converts rin (dB/Hz to absolute value)
         rin = 10**(sourceParameters.get("RIN") / 10)
 
-        # Laser parameters
-        paramLaser = parameters()
-        paramLaser.P = sourceParameters.get("Power")   # laser power [dBm]
-        paramLaser.lw = sourceParameters.get("Linewidth")    # laser linewidth [Hz]
-        paramLaser.Fs = Fs  # sampling rate [symbols/s]
-        paramLaser.Ns = len(modulationSignal)   # number of signal samples
-        paramLaser.RIN_var = rin # RIN
+        # Phase noise and RIN generated directly in the precision of the signal
+        carrier = laserModel(sourceParameters.get("Power"), sourceParameters.get("Linewidth"), rin, Fs, len(modulationSignal), complexType)
 
-        return {"carrierSignal":basicLaserModel(paramLaser)}
+        return {"carrierSignal":carrier}
 
 
 def modulate(modulatorParameters: dict, modulationSignal, carrierSignal, generalParameters: dict) -> dict:
     """
     Modulates carrier signal.
 
+    Dual polarization modulation signal (2 x N) with one carrier splits the carrier into both polarizations.
+
     Returns
     -----
     modulatedSignal
     """
+    # Polarization beam splitter (half of the power in each polarization)
+    if modulationSignal.ndim == 2 and carrierSignal.ndim == 1:
+        carrierSignal = np.broadcast_to(carrierSignal * float(1 / np.sqrt(2)), modulationSignal.shape)
+
 
     if modulatorParameters.get("Type") == "PM":
-        return {"modulatedSignal":pm(carrierSignal, modulationSignal, 2)}
+        modulatedSignal = pm(carrierSignal, modulationSignal, 2)
     
     elif modulatorParameters.get("Type") == "MZM":
         # MZM parameters
@@ -149,10 +358,10 @@ def modulate(modulatorParameters: dict, modulationSignal, carrierSignal, general
 
         # 4 PAM 
         if generalParameters.get("Format") == "pam" and generalParameters.get("Order") == 4:
-            return {"modulatedSignal":mzm(carrierSignal, modulationSignal*0.7, paramMZM)}
+            modulatedSignal = mzm(carrierSignal, modulationSignal*0.7, paramMZM)
         # Everything else
         else:
-            return {"modulatedSignal":mzm(carrierSignal, modulationSignal, paramMZM)}
+            modulatedSignal = mzm(carrierSignal, modulationSignal, paramMZM)
     
     elif modulatorParameters.get("Type") == "IQM":
         # IQM parameters
@@ -162,11 +371,14 @@ def modulate(modulatorParameters: dict, modulationSignal, carrierSignal, general
         paramIQM.VbQ = -2
         paramIQM.Vphi = 1
 
-        return {"modulatedSignal":iqm(carrierSignal*np.sqrt(2), modulationSignal, paramIQM)}
+        modulatedSignal = iqm(carrierSignal*np.sqrt(2), modulationSignal, paramIQM)
     else: raise Exception("Unexpected error")
 
+    # Same precision as carrier signal
+    return {"modulatedSignal":modulatedSignal.astype(carrierSignal.dtype, copy=False)}
 
-def fiberTransmition(fiberParameters: dict, amplifierParameters: dict, modulatedSignal, Fs: int, frequency: float, includeAmplifier: bool) -> dict:
+
+def fiberTransmition(fiberParameters: dict, amplifierParameters: dict, modulatedSignal, Fs: int, frequency: float, includeAmplifier: bool, noiseBias: float = 1) -> dict:
     """
     Simulates signal thru optical fiber.
 
@@ -176,184 +388,271 @@ def fiberTransmition(fiberParameters: dict, amplifierParameters: dict, modulated
 
     frequency: central frequency of optical signal [Hz]
 
+    modulatedSignal: 1-D signal or dual polarization signal (2 x N), polarization of non ideal fiber is randomly rotated
+
+    noiseBias: amplitude scale of ASE noise (importance sampling)
+
     Returns
     -----
     recieverSignal: signal at reciever
+
+    None: in case there was a error with detection limit of amplifier and signal power
     """
-    dispersion = fiberParameters.get("Dispersion")
+    elements = channelElements(fiberParameters, amplifierParameters, Fs, frequency, includeAmplifier, noiseBias)
+
+    # Rotation of polarization (fiber birefringence)
+    if modulatedSignal.ndim == 2 and any(element.get("Type") == "fiber" for element in elements):
+        modulatedSignal = polarizationRotation(modulatedSignal)
+
+    return {"recieverSignal":channelTransmition(modulatedSignal, elements)}
+
+
+def channelElements(fiberParameters: dict, amplifierParameters: dict, Fs: int, frequency: float, includeAmplifier: bool, noiseBias: float = 1) -> list:
+    """
+    Describes the channel as a sequence of elements (fiber segments and amplifier).
+
+    Parameters
+    -----
+    Fs: sampling frequency
+
+    frequency: central frequency of optical signal [Hz]
+
+    fiberParameters: channel parameters, optionally with Spans (list of spans, each with its fiber and amplifier parameters)
+
+    noiseBias: amplitude scale of ASE noise of amplifiers (importance sampling)
+
+    Returns
+    -----
+    elements: list of dictionaries (Type, Param, State, ...)
+    """
+    # Multi-span link (amplifiers are part of the spans)
+    if "Spans" in fiberParameters:
+        # Ideal channel
+        if fiberParameters.get("Ideal"):
+            return []
+        return spanElements(fiberParameters.get("Spans"), Fs, frequency, noiseBias)
 
     paramCh = parameters()
     paramCh.L = fiberParameters.get("Length")         # total link distance
     paramCh.alpha = fiberParameters.get("Attenuation")        # fiber loss parameter [dB/km]
-    paramCh.D = dispersion         # fiber dispersion parameter [ps/nm/km]
+    paramCh.D = fiberParameters.get("Dispersion")         # fiber dispersion parameter [ps/nm/km]
     paramCh.Fc = frequency # central optical frequency [Hz]
     paramCh.Fs = Fs        # simulation sampling frequency [samples/second]
+    paramCh.gamma = fiberParameters.get("Nonlinearity", 0)        # fiber nonlinear coefficient [1/W/km] (0 = linear fiber)
+
+    fiber = {"Type": "fiber", "Param": paramCh, "State": {}}
 
-    # Channel has amplifier
-    if includeAmplifier:
-        recieverSignal = amplifierTransmition(paramCh, amplifierParameters, fiberParameters.get("Ideal"), modulatedSignal, Fs, frequency)
-    
     # Channel without amplifier
-    else:
-        # Directly pass modulated signal without changes (Ideal channel)
+    if not includeAmplifier:
+        # Ideal channel
         if fiberParameters.get("Ideal"):
-            recieverSignal = modulatedSignal
+            return []
         else:
-            # Channel with only attenuation
-            if dispersion == 0:
-                recieverSignal = attenuationChannel(modulatedSignal, paramCh)
-            else:
-                recieverSignal = linearFiberChannel(modulatedSignal, paramCh)
-            
-    return {"recieverSignal":recieverSignal}
+            return [fiber]
+
+    # Amplifier parameters
+    paramEDFA = parameters()
+    paramEDFA.G = amplifierParameters.get("Gain")    # edfa gain
+    paramEDFA.NF = amplifierParameters.get("Noise")   # edfa noise figure
+    paramEDFA.Fc = frequency
+    paramEDFA.Fs = Fs
+    paramEDFA.bias = noiseBias
+
+    # Ideal amplifier doesn't check signal power
+    if amplifierParameters.get("Ideal"):
+        detectionLimit = None
+    else:
+        detectionLimit = amplifierParameters.get("Detection")
+
+    amplifier = {"Type": "amplifier", "Param": paramEDFA, "Ideal": amplifierParameters.get("Ideal"), "Detection": detectionLimit}
+
+    # Ideal channel (= position of amplifier doesn't matter)
+    if fiberParameters.get("Ideal"):
+        return [amplifier]
 
+    amplifierPosition = amplifierParameters.get("Position")
+
+    if amplifierPosition == "start":
+        return [amplifier, fiber]
+
+    elif amplifierPosition == "middle":
+        # Lenght needs to be halfed (copy, parameters of the whole fiber stay the same)
+        paramHalf = copy.copy(paramCh)
+        paramHalf.L = paramCh.L / 2
+        return [{"Type": "fiber", "Param": paramHalf, "State": {}}, amplifier, {"Type": "fiber", "Param": paramHalf, "State": {}}]
+
+    elif amplifierPosition == "end":
+        return [fiber, amplifier]
 
-def amplifierTransmition(fiberParameters, amplifierParameters: dict, idealChannel: bool, modulatedSignal, Fs: int, frequency: float) -> np.ndarray | None:
+    else: raise Exception("Unexpected error")
+
+
+def spanElements(spans: list, Fs: int, frequency: float, noiseBias: float = 1) -> list:
     """
-    Simulates signal thru fiber with amplifier.
+    Describes multi-span link as a sequence of elements (fiber of the span and amplifier after it).
 
     Parameters
     -----
-    fiberParameters: parameters() object
+    spans: list of span dictionaries
+
+        - Length, Attenuation, Dispersion, Nonlinearity (optional): fiber of the span (same as channel parameters)
+        - Amplifier (optional): Gain, Noise, Detection, Ideal (same as amplifier parameters), amplifier at the end of the span
 
     Fs: sampling frequency
 
     frequency: central frequency of optical signal [Hz]
 
+    noiseBias: amplitude scale of ASE noise of amplifiers (importance sampling)
+
     Returns
     -----
-    recieverSignal: signal at reciever (array)
-
-    None: in case there was a error with detection limit of amplifier and signal power
+    elements: list of dictionaries (Type, Param, State, ...)
     """
-    dispersion = fiberParameters.D
+    elements = []
+
+    for span in spans:
+        paramCh = parameters()
+        paramCh.L = span.get("Length")
+        paramCh.alpha = span.get("Attenuation")
+        paramCh.D = span.get("Dispersion")
+        paramCh.Fc = frequency
+        paramCh.Fs = Fs
+        paramCh.gamma = span.get("Nonlinearity", 0)
+        elements.append({"Type": "fiber", "Param": paramCh, "State": {}})
+
+        amplifierParameters = span.get("Amplifier")
+        # Span without amplifier
+        if amplifierParameters is None:
+            continue
+
+        paramEDFA = parameters()
+        paramEDFA.G = amplifierParameters.get("Gain")
+        paramEDFA.NF = amplifierParameters.get("Noise")
+        paramEDFA.Fc = frequency
+        paramEDFA.Fs = Fs
+        paramEDFA.bias = noiseBias
+
+        # Ideal amplifier doesn't check signal power
+        if amplifierParameters.get("Ideal"):
+            detectionLimit = None
+        else:
+            detectionLimit = amplifierParameters.get("Detection")
 
-    # Amplifier parameters
-    paramEDFA = parameters()
-    paramEDFA.G = amplifierParameters.get("Gain")    # edfa gain
-    paramEDFA.NF = amplifierParameters.get("Noise")   # edfa noise figure 
-    paramEDFA.Fc = frequency
-    paramEDFA.Fs = Fs
+        elements.append({"Type": "amplifier", "Param": paramEDFA, "Ideal": amplifierParameters.get("Ideal"), "Detection": detectionLimit})
 
-    detectionLimit = amplifierParameters.get("Detection")
-    amplifierPosition = amplifierParameters.get("Position")
+    return elements
 
-    # Ideal channel (= position of amplifier doesn't matter)
-    if idealChannel:
-        # Ideal amplifier
-        if amplifierParameters.get("Ideal"):
-            recieverSignal = edfa(modulatedSignal, amplifierParameters.get("Ideal"), paramEDFA)
-        else:
-            # Power of signal is too low
-            if not(checkPower(modulatedSignal, detectionLimit)):
-                return
-            
-            recieverSignal = edfa(modulatedSignal, amplifierParameters.get("Ideal"), paramEDFA)
-    
-    # Ideal amplifier with real channel
-    elif amplifierParameters.get("Ideal") and not(idealChannel):
-        # Amplifier at the start of the channel
-        if amplifierPosition == "start":
-            modulatedSignal = edfa(modulatedSignal, amplifierParameters.get("Ideal"), paramEDFA)
-
-            # Channel with only attenuation
-            if dispersion == 0:
-                recieverSignal = attenuationChannel(modulatedSignal, fiberParameters)
-            else:
-                recieverSignal = linearFiberChannel(modulatedSignal, fiberParameters)
 
-        # Amplifier in the middle of the channel
-        elif amplifierPosition == "middle":
-            # Lenght needs to be halfed
-            fiberParameters.L = fiberParameters.L / 2
+def linkDispersion(elements: list) -> float:
+    """
+    Accumulated dispersion of channel elements, sum of beta2 * L over fibers [s^2].
+    """
+    return sum(fiberBeta2(element.get("Param")) * element.get("Param").L for element in elements if element.get("Type") == "fiber")
 
-            # First half
-            # Channel with only attenuation
-            if dispersion == 0:
-                modulatedSignal = attenuationChannel(modulatedSignal, fiberParameters)
-            else:
-                modulatedSignal = linearFiberChannel(modulatedSignal, fiberParameters)
 
-            # Amplifier
-            modulatedSignal = edfa(modulatedSignal, amplifierParameters.get("Ideal"), paramEDFA)
+def channelTransmition(signal, elements: list) -> np.ndarray | None:
+    """
+    Simulates signal thru channel elements.
 
-            # Second half
-            # Channel with only attenuation
-            if dispersion == 0:
-                recieverSignal = attenuationChannel(modulatedSignal, fiberParameters)
-            else:
-                recieverSignal = linearFiberChannel(modulatedSignal, fiberParameters)
+    Linear parts (fiber segments, gain of amplifiers) are only accumulated (gain and dispersion) and applied at once,
+    so linear channel with any number of spans needs one FFT pair. ASE noise of all amplifiers is generated at once
+    (dispersion doesn't change statistics of white noise, attenuation and gain after the amplifier scale its power).
+    Nonlinear fiber (gamma > 0) is simulated with split-step Fourier method.
 
-        # Amplifier at the end of channel
-        elif amplifierPosition == "end":
-            # Channel with only attenuation
-            if dispersion == 0:
-                modulatedSignal = attenuationChannel(modulatedSignal, fiberParameters)
+    Dual polarization signal (2 x N) has noise in both polarizations and detection limits use total power.
+
+    Returns
+    -----
+    recieverSignal: signal at reciever
+
+    None: in case there was a error with detection limit of amplifier and signal power
+    """
+    # Not yet applied to the signal: amplitude gain, accumulated dispersion [s^2], ASE noise power [W]
+    pending = {"Gain": 1.0, "Dispersion": 0.0, "Noise": 0.0}
+    # ASE noise power without importance sampling bias [W] (detection limits)
+    unbiased = 0.0
+    signalPower = None
+    polarizations = signal.shape[0] if signal.ndim == 2 else 1
+
+    for element in elements:
+        param = element.get("Param")
+
+        if element.get("Type") == "fiber":
+            # Nonlinear fiber (split-step Fourier method needs signal with everything before the fiber applied)
+            if param.gamma > 0:
+                signal = applyPending(signal, pending, param.Fs)
+                signal = ssfmChannel(signal, param, polarizationAxis=0 if polarizations == 2 else None)
+                signalPower = None
+                unbiased = 0.0
             else:
-                modulatedSignal = linearFiberChannel(modulatedSignal, fiberParameters)
+                attenuation = 10**(-param.alpha * param.L / 10)
+                pending.update({"Gain": pending.get("Gain") * np.sqrt(attenuation), "Noise": pending.get("Noise") * attenuation,
+                                "Dispersion": pending.get("Dispersion") + fiberBeta2(param) * param.L})
+                unbiased *= attenuation
+
+        elif element.get("Type") == "amplifier":
+            # Signal power at the amplifier (dispersion doesn't change power)
+            if element.get("Detection") is not None:
+                if signalPower is None:
+                    # signal_power sums power of columns
+                    signalPower = signal_power(signal.T)
+                # Power of unbiased noise (importance sampling doesn't change the detection)
+                power = signalPower * pending.get("Gain")**2 + unbiased * polarizations
+
+                # Power of signal is too low
+                if 10*np.log10(power / 1e-3) < element.get("Detection"):
+                    return
+
+            gain = 10**(param.G / 10)
+            pending.update({"Gain": pending.get("Gain") * np.sqrt(gain), "Noise": pending.get("Noise") * gain})
+            unbiased *= gain
+
+            # Noise of the amplifier
+            if not element.get("Ideal"):
+                pending.update({"Noise": pending.get("Noise") + edfaNoisePower(param)})
+                unbiased += edfaNoisePower(param, biased=False)
 
-            recieverSignal = edfa(modulatedSignal, amplifierParameters.get("Ideal"), paramEDFA)
         else: raise Exception("Unexpected error")
 
-    # Real amplifier with real channel
-    elif not(amplifierParameters.get("Ideal")) and not(idealChannel):
-        # Amplifier at the start of the channel
-        if amplifierPosition == "start":
-            # Signal power is too low
-            if not(checkPower(modulatedSignal, detectionLimit)):
-                return
-            
-            modulatedSignal = edfa(modulatedSignal, amplifierParameters.get("Ideal"), paramEDFA)
-
-            # Channel with only attenuation
-            if dispersion == 0:
-                recieverSignal = attenuationChannel(modulatedSignal, fiberParameters)
-            else:
-                recieverSignal = linearFiberChannel(modulatedSignal, fiberParameters)
-
-        # Amplifier i the middle of the channel
-        elif amplifierPosition == "middle":
-            # Lenght needs to be halfed
-            fiberParameters.L = fiberParameters.L / 2
-            
-            # First half
-            # Channel with only attenuation
-            if dispersion == 0:
-                modulatedSignal = attenuationChannel(modulatedSignal, fiberParameters)
-            else:
-                modulatedSignal = linearFiberChannel(modulatedSignal, fiberParameters)
-            
-            # Signal power is too low
-            if not(checkPower(modulatedSignal, detectionLimit)):
-                return
-
-            # Amplifier
-            modulatedSignal = edfa(modulatedSignal, amplifierParameters.get("Ideal"), paramEDFA)
-
-            # Second half
-            # Channel with only attenuation
-            if dispersion == 0:
-                recieverSignal = attenuationChannel(modulatedSignal, fiberParameters)
-            else:
-                recieverSignal = linearFiberChannel(modulatedSignal, fiberParameters)
+    if len(elements) == 0:
+        return signal
 
-        # Amplifier at the end of the channel
-        elif amplifierPosition == "end":
-            # Channel with only attenuation
-            if dispersion == 0:
-                modulatedSignal = attenuationChannel(modulatedSignal, fiberParameters)
-            else:
-                modulatedSignal = linearFiberChannel(modulatedSignal, fiberParameters)
+    return applyPending(signal, pending, elements[0].get("Param").Fs)
 
-            # Signal power is too low
-            if not(checkPower(modulatedSignal, detectionLimit)):
-                return
 
-            recieverSignal = edfa(modulatedSignal, amplifierParameters.get("Ideal"), paramEDFA)
-        else: raise Exception("Unexpected error")
-    else: raise Exception("Unexpected error")
+def applyPending(signal, pending: dict, Fs: float) -> np.ndarray:
+    """
+    Applies accumulated gain, dispersion and ASE noise to the signal. (pending is reset)
 
-    return recieverSignal
+    Parameters
+    -----
+    pending: Gain (amplitude), Dispersion (sum of beta2 * L [s^2]), Noise (power [W])
+
+    Fs: sampling frequency
+    """
+    gain = pending.get("Gain")
+    dispersion = pending.get("Dispersion")
+    noise = pending.get("Noise")
+    pending.update({"Gain": 1.0, "Dispersion": 0.0, "Noise": 0.0})
+
+    # Only scalar gain, noise is added in time domain
+    if dispersion == 0:
+        # Python float keeps precision of the signal
+        signal = signal * float(gain) if gain != 1 else signal
+        if noise > 0:
+            signal = signal + complexNoise(signal.shape, noise, signal.dtype)
+        return signal
+
+    N = signal.shape[-1]
+    spectrum = fft(signal)
+    spectrum *= accumulatedDispersionResponse(dispersion, Fs, N).astype(spectrum.dtype, copy=False)
+    spectrum *= float(gain)
+
+    # FFT of white noise with power p has power N*p in every bin
+    if noise > 0:
+        spectrum += complexNoise(spectrum.shape, noise * N, spectrum.dtype)
+
+    return ifft(spectrum, overwrite=True)
 
 
 def detection(recieverParameters: dict, recieverSignal, referentSignal, generalParameters: dict) -> dict:
@@ -368,68 +667,216 @@ def detection(recieverParameters: dict, recieverSignal, referentSignal, generalP
     -----
     detectedSignal
     """
-    Fs = generalParameters.get("Fs")
+    paramPD = photodiodeParameters(recieverParameters, generalParameters)
 
     if recieverParameters.get("Type") == "Photodiode":
-        # Ideal photodiode
-        if recieverParameters.get("Ideal"):
-            paramPD = parameters
-            paramPD.idel = True
-        else:
-            # Noisy photodiode (thermal noise + shot noise + bandwidth limitation)
-            paramPD = parameters()
-            paramPD.ideal = False
-            paramPD.B = recieverParameters.get("Bandwidth")
-            paramPD.R = recieverParameters.get("Resolution")
-            paramPD.Fs = Fs
+        if recieverSignal.ndim == 2:
+            raise Exception("Dual polarization needs coherent reciever")
 
         return {"detectedSignal":photodiode(recieverSignal, paramPD)}
     
     elif recieverParameters.get("Type") == "Coherent":
-        # Ideal photodiodes
-        if recieverParameters.get("Ideal"):
-            paramPD = parameters
-            paramPD.idel = True
-        else:
-            # Noisy photodiodes (thermal noise + shot noise + bandwidth limitation)
-            paramPD = parameters()
-            paramPD.ideal = False
-            paramPD.B = recieverParameters.get("Bandwidth")
-            paramPD.R = recieverParameters.get("Resolution")
-            paramPD.Fs = Fs
+        # Dual polarization reciever (local oscilator is split into both polarizations, both are detected at once)
+        if recieverSignal.ndim == 2:
+            referentSignal = referentSignal * float(1 / np.sqrt(2))
 
         return {"detectedSignal":coherentReceiver(recieverSignal, referentSignal, paramPD)}
 
     else: raise Exception("Unexpected error")
 
 
-def restoreInformation(detectedSignal, generalParameters: dict) -> dict:
+def photodiodeParameters(recieverParameters: dict, generalParameters: dict):
+    """
+    Parameter object of photodiodes of the reciever (shared by simulation and streaming).
+
+    Returns
+    -----
+    paramPD: ideal photodiode or noisy photodiode (thermal noise + shot noise + bandwidth limitation)
+    """
+    paramPD = parameters()
+
+    # Ideal photodiode
+    if recieverParameters.get("Ideal"):
+        paramPD.ideal = True
+        return paramPD
+
+    # Noisy photodiode (thermal noise + shot noise + bandwidth limitation)
+    paramPD.ideal = False
+    paramPD.B = recieverParameters.get("Bandwidth")
+    paramPD.R = recieverParameters.get("Resolution")
+    paramPD.Fs = generalParameters.get("Fs")
+    # Importance sampling (biased noise)
+    paramPD.bias = generalParameters.get("ImportanceSampling", 1)
+
+    return paramPD
+
+
+def noiseReference(channelParameters: dict, amplifierParameters: dict, recieverParameters: dict, modulatedSignal, carrierSignal, generalParameters: dict,
+                   frequency: float, includeAmplifier: bool, seeds: list) -> dict:
+    """
+    Noise-free detected signal of importance sampling. Channel and detection are simulated without ASE and reciever noise
+    with the same random numbers as the biased stages (e.g. polarization rotation), so difference of the detected signals
+    is the injected noise alone (ISI, laser phase noise and RIN are the same in both signals).
+
+    Parameters
+    -----
+    seeds: seeds of the biased fiber and detection stages
+
+    Returns
+    -----
+    detectedReference (None in case there was a error with detection limit of amplifier and signal power)
+    """
+    Fs = generalParameters.get("Fs")
+
+    setSeed(seeds[0])
+    recieverSignal = fiberTransmition(channelParameters, amplifierParameters, modulatedSignal, Fs, frequency, includeAmplifier, 0).get("recieverSignal")
+    if recieverSignal is None:
+        return {"detectedReference": None}
+
+    setSeed(seeds[1])
+    detectedSignal = detection(recieverParameters, recieverSignal, carrierSignal, {**generalParameters, "ImportanceSampling": 0}).get("detectedSignal")
+
+    return {"detectedReference": detectedSignal}
+
+
+def restoreInformation(detectedSignal, generalParameters: dict, symbolsTx=None, dispersion: float = 0.0, detectedReference=None) -> dict:
     """
     Gets bits information from detected signal.
 
+    Dual polarization signal (2 x N) is equalized with 2x2 MIMO equalizer ("Equalizer" of general parameters, "lms" or "cma").
+
+    Reciever DSP ("DSP" of general parameters, list of stages in order):
+
+        - "cd": chromatic dispersion compensation (coherent reciever)
+        - "matched": filter matched to the transmitted pulse
+        - "timing": sampling phase, all SpS offsets are compared at once ("TimingCriterion" of general parameters,
+          "variance" or "eye" opening on the training symbols of single polarization signal)
+        - "equalizer": block frequency domain equalizer ("Equalizer" of general parameters, "lms" or "cma") instead of sampling
+          (single polarization, dual polarization is always equalized with MIMO equalizer)
+        - "cpr": carrier phase recovery of symbols (Viterbi-Viterbi for PSK, blind phase search for QAM)
+
+    Parameters
+    -----
+    symbolsTx: Optional. Transmitted symbols, start of them is training sequence of LMS equalizer
+
+    dispersion: accumulated dispersion of the link [s^2] (dispersion compensation)
+
+    detectedReference: Optional. Noise-free detected signal (importance sampling), injected noise goes thru the same steps
+    as the signal (single polarization without adaptive equalizer)
+
     Returns
     -----
-    symbolsRx, bitsRx
+    symbolsRx, bitsRx (+ noiseRx, injected noise of symbolsRx with detectedReference)
     """
     SpS = generalParameters.get("SpS")
     modulationFormat = generalParameters.get("Format")
     modulationOrder = generalParameters.get("Order")
 
-    detectedSignal = detectedSignal/np.std(detectedSignal)
-    # Capture samples in the middle of signaling intervals
-    symbolsRx = detectedSignal[0::SpS]
+    # Injected noise (filtering stages are linear)
+    noise = None
+    if detectedReference is not None:
+        noise = recieverDSP(detectedSignal - detectedReference, generalParameters, dispersion)
+
+    # Dispersion compensation and matched filter
+    detectedSignal = recieverDSP(detectedSignal, generalParameters, dispersion)
+
+    # OFDM (one tap equalization of subcarriers)
+    if modulationFormat == "ofdm":
+        return ofdmInformation(detectedSignal, generalParameters)
+
+    # Symbols are moved to samples 0, SpS, 2*SpS, ...
+    if "timing" in generalParameters.get("DSP", []):
+        const = GrayMapping(modulationOrder, modulationFormat)
+        offset = timingOffset(detectedSignal, SpS, generalParameters.get("TimingCriterion", "variance"), const / np.sqrt(signal_power(const)),
+                              None if symbolsTx is None else symbolsTx[:TRAINING])
+        detectedSignal = shiftSamples(detectedSignal, offset)
+        noise = None if noise is None else shiftSamples(noise, offset)
+
+    # Dual polarization
+    if detectedSignal.ndim == 2:
+        return polarizationInformation(detectedSignal, generalParameters, symbolsTx)
+
+    scale = 1 / np.std(detectedSignal)
+    detectedSignal = detectedSignal * scale
+
+    # Adaptive equalizer
+    if "equalizer" in generalParameters.get("DSP", []):
+        const = GrayMapping(modulationOrder, modulationFormat)
+        training = None if symbolsTx is None else symbolsTx[:TRAINING]
+        # Direct detection signal has DC level
+        if not np.iscomplexobj(detectedSignal):
+            detectedSignal = detectedSignal - detectedSignal.mean()
+        symbolsRx = blockEqualizer(detectedSignal, SpS, const / np.sqrt(signal_power(const)), training, generalParameters.get("Equalizer", "lms"))
+        # Real symbols stay real
+        symbolsRx = symbolsRx if np.iscomplexobj(detectedSignal) else symbolsRx.real
+    else:
+        # Capture samples in the middle of signaling intervals
+        symbolsRx = detectedSignal[0::SpS]
+        noise = None if noise is None else noise[0::SpS] * scale
+
+    # Carrier phase recovery (phase ambiguity is resolved with the training symbols)
+    if "cpr" in generalParameters.get("DSP", []):
+        recovered = carrierPhaseRecovery(symbolsRx, modulationFormat, modulationOrder, None if symbolsTx is None else symbolsTx[:TRAINING])
+        # Noise is rotated by the same phase
+        noise = None if noise is None else noise * (recovered / symbolsRx)
+        symbolsRx = recovered
 
     # Subtract DC level and normalize power
     symbolsRx = symbolsRx - symbolsRx.mean()
+    noise = None if noise is None else noise / np.sqrt(signal_power(symbolsRx))
     symbolsRx = pnorm(symbolsRx)
 
-    # Demodulate symbols to bits with minimum Euclidean distance 
+    # Demodulate symbols to bits with minimum Euclidean distance (decision regions)
     const = GrayMapping(modulationOrder, modulationFormat) # get constellation
     Es = signal_power(const) # calculate the average energy per symbol of the constellation
 
     # Demodulated bits
     bitsRx = demodulateGray(np.sqrt(Es)*symbolsRx, modulationOrder, modulationFormat)
 
+    if noise is not None:
+        return {"symbolsRx":symbolsRx, "bitsRx":bitsRx, "noiseRx":noise}
+
+    return {"symbolsRx":symbolsRx, "bitsRx":bitsRx}
+
+
+def polarizationInformation(detectedSignal, generalParameters: dict, symbolsTx=None) -> dict:
+    """
+    Gets bits information from detected dual polarization signal (2 x N).
+
+    Returns
+    -----
+    symbolsRx, bitsRx (2 x length arrays)
+    """
+    SpS = generalParameters.get("SpS")
+    modulationFormat = generalParameters.get("Format")
+    modulationOrder = generalParameters.get("Order")
+    algorithm = generalParameters.get("Equalizer", "lms")
+
+    const = GrayMapping(modulationOrder, modulationFormat)
+    Es = signal_power(const)
+
+    # Transmitted symbols have unit power
+    training = None if symbolsTx is None else symbolsTx[:, :TRAINING]
+    symbolsRx = mimoEqualizer(detectedSignal, SpS, const / np.sqrt(Es), training, algorithm)
+
+    # Order and phase of polarizations after blind equalizer are ambiguous (resolved with the training symbols)
+    if algorithm == "cma" and training is not None:
+        correlation = symbolsRx[:, :TRAINING] @ training.conj().T
+        if np.abs(correlation[0, 1]) + np.abs(correlation[1, 0]) > np.abs(correlation[0, 0]) + np.abs(correlation[1, 1]):
+            symbolsRx = symbolsRx[::-1]
+            correlation = correlation[::-1]
+        symbolsRx = symbolsRx * np.exp(-1j * np.angle(np.diag(correlation)))[:, np.newaxis].astype(symbolsRx.dtype)
+
+    # Carrier phase recovery of each polarization
+    if "cpr" in generalParameters.get("DSP", []):
+        symbolsRx = carrierPhaseRecovery(symbolsRx, modulationFormat, modulationOrder, training)
+
+    # Subtract DC level and normalize power of each polarization
+    symbolsRx = symbolsRx - symbolsRx.mean(axis=1, keepdims=True)
+    symbolsRx = np.stack([pnorm(polarization) for polarization in symbolsRx])
+
+    bitsRx = np.stack([demodulateGray(np.sqrt(Es)*polarization, modulationOrder, modulationFormat) for polarization in symbolsRx])
+
     return {"symbolsRx":symbolsRx, "bitsRx":bitsRx}
 
 
@@ -444,7 +891,12 @@ def getPlot(type: str, title: str, simulationResults: dict, generalParameters: d
     Returns
     ----
     tuple (Figure, Axes)
+
+    Dual polarization signals are shown in X polarization.
     """
+    # X polarization
+    if generalParameters.get("Polarizations", 1) == 2:
+        simulationResults = {key: value[0] if np.ndim(value) == 2 else value for key, value in simulationResults.items()}
 
     Ts = generalParameters.get("Ts")
     SpS = generalParameters.get("SpS")
@@ -501,13 +953,28 @@ def getPlot(type: str, title: str, simulationResults: dict, generalParameters: d
     else: raise Exception("Unexpected error")
 
 
-def getValues(simulationResults: dict, generalParameters: dict) -> dict:
+def getValues(simulationResults: dict, generalParameters: dict, estimator: str = "counting") -> dict:
     """
     Calculates simulation output values from simulation results.
 
+    Parameters
+    -----
+    estimator: BER estimator
+
+        - "counting": counted bit errors
+        - "semianalytic": counted BER and BERSemiAnalytic, gaussian statistics of received symbols integrated in closed form
+          (BER below 1 / number of bits), on ISI limited links it is upper bound style estimate (tails of ISI are lighter than gaussian)
+
+    With ImportanceSampling (general parameters) BER, SER and SNR are counted in the biased simulation, errors reweighted
+    to BER of unbiased noise are BERImportanceSampling (nan without injected noise of the symbols, e.g. WDM).
+
+    Gap to theory (BERTheory, SNRGap) compares counted BER and SNR with theoretical AWGN curve (scripts.theory).
+
     Returns
     -----
-    BER, SER, SNR, powerTxdBm, powerTxW, powerRxdBm, powerRxW, Speed
+    BER, SER, SNR, powerTxdBm, powerTxW, powerRxdBm, powerRxW, Speed (+ BERPostFEC with FEC, BERSemiAnalytic with semianalytic estimator, BERImportanceSampling with importance sampling) + BERTheory, SNRGap
+
+    With FEC BER is pre-FEC (coded bits) and Speed is net bit rate (information bits).
     """
     
     modulationFormat = generalParameters.get("Format")
@@ -521,23 +988,50 @@ def getValues(simulationResults: dict, generalParameters: dict) -> dict:
     modulatedSignal = simulationResults.get("modulatedSignal")
     recieverSignal = simulationResults.get("recieverSignal")
 
+    # OFDM subcarriers are QAM
+    constType = "qam" if modulationFormat == "ofdm" else modulationFormat
+
     # Error values
-    valuesList = fastBERcalc(symbolsRx, symbolsTx, modulationOrder, modulationFormat)
-    # extract the values from arrays
-    ber, ser, snr = [array[0] for array in valuesList]
+    valuesList = fastBERcalc(symbolsRx, symbolsTx, modulationOrder, constType)
+    # extract the values from arrays (average of polarizations)
+    ber, ser, snr = [np.mean(array) for array in valuesList]
     values = {"BER":ber, "SER":ser, "SNR":snr}
 
-    # Transmission speed
-    values.update({"Speed":calculateTransSpeed(Rs, modulationOrder)})
+    # Gap to theory (counted BER and SNR are of the same simulation)
+    values.update(theoryValues(ber, snr, modulationFormat, modulationOrder))
 
-    # Tx power [W]
-    power = signal_power(modulatedSignal)
+    # Importance sampling (counted values are of the biased simulation, noise at the decision is needed)
+    noiseBias = generalParameters.get("ImportanceSampling", 1)
+    if noiseBias != 1:
+        noiseRx = simulationResults.get("noiseRx")
+        values.update({"BERImportanceSampling":np.nan if noiseRx is None else importanceSamplingBER(symbolsRx, symbolsTx, noiseRx, modulationOrder, constType, noiseBias)})
+
+    # Semi-analytic BER (phase corrected and normalized symbols), BER stays counted
+    if estimator == "semianalytic":
+        values.update({"BERSemiAnalytic":semiAnalyticBER(*alignSymbols(symbolsRx, symbolsTx, constType), modulationOrder, constType)})
+    elif estimator != "counting": raise Exception("Unexpected error")
+
+    # Transmission speed
+    values.update({"Speed":calculateTransSpeed(Rs, modulationOrder) * generalParameters.get("Polarizations", 1)})
+    # Cyclic prefix doesn't carry information
+    if modulationFormat == "ofdm":
+        subcarriers, CP, _ = ofdmParameters(generalParameters)
+        values.update({"Speed":values.get("Speed") * subcarriers / (subcarriers + CP)})
+
+    # Post-FEC BER (information bits), parity bits don't carry information
+    if generalParameters.get("FEC"):
+        n, k = fecParameters(generalParameters.get("FEC"))
+        values.update({"BERPostFEC":np.mean(simulationResults.get("bitsDecoded") != simulationResults.get("bitsInfo"))})
+        values.update({"Speed":values.get("Speed") * k / n})
+
+    # Tx power [W] (signal_power sums power of columns = both polarizations)
+    power = signal_power(modulatedSignal.T)
     values.update({"powerTxW":power})
     # Tx power [dBm]
     power = 10*np.log10(power / 1e-3)
     values.update({"powerTxdBm":power})
     # Rx power [W]
-    power = signal_power(recieverSignal)
+    power = signal_power(recieverSignal.T)
     values.update({"powerRxW":power})
     # Rx power [dBm]
     power = 10*np.log10(power / 1e-3)
@@ -546,6 +1040,40 @@ def getValues(simulationResults: dict, generalParameters: dict) -> dict:
     return values
 
 
+def validatePrecision(generalParameters: dict, sourceParameters: dict, modulatorParameters: dict, channelParameters: dict, recieverParameters: dict, amplifierParameters: dict, includeAmplifier: bool, seed: int = 123) -> dict | None:
+    """
+    Runs the simulation in double and single precision and compares output values.
+    (Noise realizations of the two runs are not the same, differences contain also statistical part)
+
+    Returns
+    -----
+    double: values of double precision simulation
+
+    single: values of single precision simulation
+
+    difference: BER, SER, SNR differences (single - double)
+
+    None: in case of error with detection of amplifier and signal power
+    """
+    values = {}
+
+    for precision in ["double", "single"]:
+        simulationResults = simulate(generalParameters, sourceParameters, modulatorParameters, channelParameters, recieverParameters,
+                                     amplifierParameters, includeAmplifier, seed=seed, precision=precision)
+        # Signal power is too low for amplifier detection
+        if simulationResults.get("recieverSignal") is None:
+            return None
+
+        values.update({precision: getValues(simulationResults, generalParameters)})
+        # Free memory before next run
+        del simulationResults
+
+    difference = {key: values.get("single").get(key) - values.get("double").get(key) for key in ["BER", "SER", "SNR"]}
+    values.update({"difference": difference})
+
+    return values
+
+
 def checkPower(signal, limit) -> bool:
         """
         In case of using amplifier checks the signal power and compares it to setted amplifier detection limit.
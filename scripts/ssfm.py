@@ -0,0 +1,127 @@
+import copy
+import numpy as np
+
+from scripts.my_models import dispersionTransferFunction
+from scripts.fft_backend import fft, ifft
+
+
+def ssfmChannel(Ei, param, axis: int = -1, polarizationAxis: int | None = None) -> np.ndarray:
+    """
+    Nonlinear fiber channel (attenuation + chromatic dispersion + Kerr nonlinearity) simulated with symmetric split-step Fourier method.
+
+    Step size is adaptive, every step rotates the phase of the strongest sample by at most maxPhase (nonlinear phase rotation method).
+    Steps are quantized to L / 2^k, so only few dispersion operators are computed and they are reused (also by next runs).
+
+    Parameters
+    -----
+    Ei: signal (1-D or 2-D batch of signals along axis)
+
+    polarizationAxis: Optional. Axis of dual polarization field (2 x N), nonlinearity follows Manakov equation
+    (phase of both polarizations is given by their total power, scaled by 8/9)
+
+    param: parameters object
+
+        - L [km], alpha [dB/km], D [ps/nm/km], Fc [Hz], Fs [Hz]
+        - gamma: nonlinear coefficient [1/W/km]
+        - maxPhase: maximal nonlinear phase rotation in one step [rad] (default 0.01)
+
+    Returns
+    -----
+    signal at the end of the fiber (same precision as the input signal)
+    """
+    L = param.L
+    gamma = param.gamma
+    maxPhase = getattr(param, "maxPhase", 0.01)
+    alpha = param.alpha / (10 * np.log10(np.exp(1)))
+
+    # Without dispersion the nonlinearity only rotates phase (exact solution)
+    if param.D == 0:
+        # Effective length (attenuation decreases nonlinear effects)
+        effectiveLength = (1 - np.exp(-alpha * L)) / alpha if alpha > 0 else L
+        phase = gamma * effectiveLength * nonlinearPower(np.abs(Ei)**2, polarizationAxis)
+        # Python float keeps precision of the signal
+        return Ei * float(np.exp(-alpha * L / 2)) * np.exp(1j * phase)
+
+    # Dispersion operators of used step lengths
+    operators = {}
+    def operator(length: float) -> np.ndarray:
+        if length not in operators:
+            paramStep = copy.copy(param)
+            paramStep.L = length
+            H = dispersionTransferFunction(paramStep, Ei.shape[axis])
+            # Broadcast along the FFT axis of the batch
+            if Ei.ndim > 1:
+                shape = [1] * Ei.ndim
+                shape[axis] = Ei.shape[axis]
+                H = H.reshape(shape)
+            operators.update({length: H.astype(Ei.dtype, copy=False)})
+        return operators.get(length)
+
+    field = np.array(Ei, copy=True)
+    power = nonlinearPower(field.real**2 + field.imag**2, polarizationAxis)
+    position = 0
+    step = stepSize(np.max(power), gamma, maxPhase, L, L)
+
+    # First half of dispersion
+    spectrum = fft(field, axis=axis, overwrite=True)
+    spectrum *= operator(step / 2)
+
+    while True:
+        # Nonlinear step (time domain)
+        field = ifft(spectrum, axis=axis, overwrite=True)
+        power = nonlinearPower(field.real**2 + field.imag**2, polarizationAxis)
+        field *= np.exp(1j * (gamma * step) * power)
+        position += step
+
+        spectrum = fft(field, axis=axis, overwrite=True)
+
+        # Last half of dispersion
+        if position >= L * (1 - 1e-12):
+            spectrum *= operator(step / 2)
+            break
+
+        nextStep = stepSize(np.max(power), gamma, maxPhase, L, L - position)
+        # Second half of this step and first half of the next step at once
+        spectrum *= operator((step + nextStep) / 2)
+        step = nextStep
+
+    return ifft(spectrum, axis=axis, overwrite=True)
+
+
+def nonlinearPower(power, polarizationAxis: int | None) -> np.ndarray:
+    """
+    Power which rotates the phase of the signal.
+
+    Parameters
+    -----
+    power: power of samples
+
+    polarizationAxis: axis of polarizations (Manakov equation) or None (single polarization)
+    """
+    if polarizationAxis is None:
+        return power
+
+    # Python float keeps precision of the signal
+    return np.sum(power, axis=polarizationAxis, keepdims=True) * float(8 / 9)
+
+
+def stepSize(peakPower: float, gamma: float, maxPhase: float, L: float, remaining: float) -> float:
+    """
+    Length of the next step. Nonlinear phase of the strongest sample is at most maxPhase.
+
+    Parameters
+    -----
+    peakPower: maximal power of the signal [W]
+
+    L: length of the whole fiber [km] (steps are L / 2^k)
+
+    remaining: length to the end of the fiber [km]
+    """
+    if gamma * peakPower > 0:
+        bound = maxPhase / (gamma * peakPower)
+        # Largest L / 2^k not longer than the bound
+        step = L / 2**max(0, int(np.ceil(np.log2(L / bound))))
+    else:
+        step = L
+
+    return min(step, remaining)
@@ -0,0 +1,103 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+
+class StageCache:
+    """
+    Cache of simulation stage results with LRU eviction.
+
+    Results are addressed by key created from stage parameters and key of the upstream stage,
+    so change of some parameters invalidates only the stage and stages after it.
+    """
+    def __init__(self, maxBytes: int = 2 * 1024**3):
+        """
+        Parameters
+        -----
+        maxBytes: memory cap for all cached arrays [B]
+        """
+        self.maxBytes = maxBytes
+        self.usedBytes = 0
+        self.entries = OrderedDict()
+
+
+    def get(self, key: str) -> dict | None:
+        """
+        Get cached stage results.
+
+        Returns
+        -----
+        stage results (arrays are read-only, they are shared with the cache)
+
+        None: key is not cached
+        """
+        if key not in self.entries:
+            return None
+
+        # Mark as recently used
+        self.entries.move_to_end(key)
+        return self.entries.get(key)
+
+
+    def put(self, key: str, results: dict):
+        """
+        Store stage results. Least recently used results are evicted when memory cap is exceeded.
+        Stored arrays are made read-only (later stages can't change the cached results).
+        """
+        size = resultsSize(results)
+
+        # Results alone are bigger than the cap
+        if size > self.maxBytes:
+            return
+
+        for value in results.values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+
+        if key in self.entries:
+            self.usedBytes -= resultsSize(self.entries.pop(key))
+
+        self.entries.update({key: results})
+        self.usedBytes += size
+
+        while self.usedBytes > self.maxBytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.usedBytes -= resultsSize(evicted)
+
+
+    def clear(self):
+        """
+        Remove all cached results.
+        """
+        self.entries.clear()
+        self.usedBytes = 0
+
+
+def stageKey(stage: str, stageParameters: dict, upstreamKeys: list | None = None) -> str:
+    """
+    Creates content key of a stage from its parameters and keys of the upstream stages.
+
+    Parameters
+    -----
+    stage: name of the stage
+
+    stageParameters: all parameters the stage result depends on
+
+    upstreamKeys: keys of stages whose results are inputs of this stage
+    """
+    content = f"{stage}|{sorted(stageParameters.items())}|{upstreamKeys}"
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def stageSeed(key: str) -> int:
+    """
+    Random seed of a stage derived from its key. (Same parameters give same random numbers whether results are cached or not)
+    """
+    return int(key[:8], 16)
+
+
+def resultsSize(results: dict) -> int:
+    """
+    Memory size of arrays in stage results [B].
+    """
+    return sum(value.nbytes for value in results.values() if isinstance(value, np.ndarray))
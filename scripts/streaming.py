@@ -0,0 +1,611 @@
+import time
+import numpy as np
+import scipy.constants as const
+from scipy.stats import beta
+from optic.utils import dBm2W
+from optic.models.devices import hybrid_2x4_90deg
+from optic.comm.modulation import modulateGray, GrayMapping
+from optic.dsp.core import pnorm, signal_power
+
+from scripts.my_models import edfa, laserModel, attenuationChannel, dispersionTransferFunction, photodiodeCurrent, photodiodeTaps
+from scripts.simulation import modulate, checkPower, reportProgress, channelElements, photodiodeParameters
+from scripts.other_functions import calculateTransSpeed, setSeed
+from scripts.demapper import fastBERcalc
+from scripts.pulse_shaping import pulseTaps, ROLL_OFF, BT
+from scripts.theory import theoryValues
+from scripts.fft_backend import filterSpectrum, convolveValid
+from scripts.reciever_dsp import gardnerRecovery
+from scripts.ssfm import ssfmChannel
+
+
+def simulateStream(generalParameters: dict, sourceParameters: dict, modulatorParameters: dict, channelParameters: dict, recieverParameters: dict, amplifierParameters: dict, includeAmplifier: bool, bits: int, blockSymbols: int = 2**14, progress=None, seed: int = 123,
+                    targetErrors: int | None = None, maxTime: float | None = None, confidence: float = 0.95) -> dict:
+    """
+    Simulate communication in streaming mode. Symbols are pushed thru the whole chain in blocks of fixed size,
+    so memory use doesn't depend on number of simulated bits.
+
+    Filter, phase noise and dispersion states are carried across the blocks. Error values are accumulated from all blocks.
+
+    Adaptive mode (targetErrors or maxTime is set) stops when enough bit errors were counted or time runs out,
+    blocks start small and grow up to blockSymbols (easy points end quickly).
+
+    Parameters
+    -----
+    bits: total number of bits to simulate (maximum in adaptive mode)
+
+    blockSymbols: number of symbols in one block
+
+    progress: Optional. Function progress(stage, fraction) called before each block. It can stop the simulation by raising SimulationCancelled.
+
+    seed: seed of random numbers
+
+    targetErrors: Optional. Simulation stops after this number of bit errors.
+
+    maxTime: Optional. Time budget of the simulation [s]
+
+    confidence: confidence level of the BER interval
+
+    Returns
+    -----
+    simulationResults: results of the first block (same keys as simulate(), for plots)
+
+    values: BER, SER, SNR, powerTxdBm, powerTxW, powerRxdBm, powerRxW, Speed, Bits (number of compared bits), Errors (bit errors), BERLow, BERHigh (confidence interval)
+
+    ! error with detection of amplifier and signal power => values is None
+    """
+    # Each time random numbers
+    setSeed(seed)
+
+    modulationOrder = generalParameters.get("Order")
+    Fs = generalParameters.get("Fs")
+    # Correct units (THz -> Hz)
+    frequency = sourceParameters.get("Frequency")*10**12
+
+    bitsSymbol = int(np.log2(modulationOrder))
+    totalSymbols = int(np.ceil(bits / bitsSymbol))
+
+    # Stage states carried between blocks
+    state = {
+        "modulation": {},
+        "carrier": {"Offset": 0, "Samples": totalSymbols * generalParameters.get("SpS")},
+        "channel": channelElements(channelParameters, amplifierParameters, Fs, frequency, includeAmplifier),
+        "detection": {},
+        "restore": {"symbolsTx": np.zeros(0, dtype=complex), "detectedSignal": np.zeros(0)},
+    }
+
+    # Accumulated values
+    counters = {"bitErrors": 0, "symbolErrors": 0, "symbols": 0, "noiseToSignal": 0,
+                "powerTx": 0, "samplesTx": 0, "powerRx": 0, "samplesRx": 0}
+    firstResults = None
+
+    # Adaptive mode starts with small blocks
+    adaptive = targetErrors is not None or maxTime is not None
+    nextBlock = min(blockSymbols, 1024) if adaptive else blockSymbols
+    startTime = time.perf_counter()
+
+    symbolsDone = 0
+    while symbolsDone < totalSymbols:
+        # Enough errors were counted
+        if targetErrors is not None and counters.get("bitErrors") >= targetErrors:
+            break
+        # Time budget ran out
+        if maxTime is not None and time.perf_counter() - startTime >= maxTime:
+            break
+
+        fraction = symbolsDone / totalSymbols
+        if targetErrors is not None:
+            fraction = max(fraction, counters.get("bitErrors") / targetErrors)
+        reportProgress(progress, f"Simulated symbols: {symbolsDone} / {totalSymbols}", fraction)
+
+        nSymbols = min(nextBlock, totalSymbols - symbolsDone)
+        symbolsDone += nSymbols
+        nextBlock = min(2 * nextBlock, blockSymbols)
+
+        blockResults = simulateBlock(generalParameters, sourceParameters, modulatorParameters, recieverParameters, nSymbols, state)
+
+        if firstResults is None:
+            firstResults = blockResults
+
+        # Error with amplifier detection (signal is too low)
+        if blockResults.get("recieverSignal") is None:
+            return {"simulationResults": blockResults, "values": None}
+
+        updateCounters(counters, blockResults, generalParameters)
+
+    values = streamValues(counters, generalParameters, confidence)
+    reportProgress(progress, "Done", 1)
+
+    return {"simulationResults": firstResults, "values": values}
+
+
+def simulateBlock(generalParameters: dict, sourceParameters: dict, modulatorParameters: dict, recieverParameters: dict, nSymbols: int, state: dict) -> dict:
+    """
+    Push one block of symbols thru the whole chain.
+
+    Parameters
+    -----
+    nSymbols: number of symbols in the block
+
+    state: states of all stages (updated in place)
+
+    Returns
+    -----
+    blockResults: bitsTx, symbolsTx, modulationSignal, carrierSignal, modulatedSignal, recieverSignal, detectedSignal, symbolsRx, symbolsRef
+    """
+    Fs = generalParameters.get("Fs")
+
+    blockResults = {}
+    # Adds bitsTx, symbolsTx, modulationSignal
+    blockResults.update(modulationBlock(generalParameters, nSymbols, state.get("modulation")))
+    # Adds carrierSignal
+    blockResults.update(carrierBlock(sourceParameters, Fs, len(blockResults.get("modulationSignal")), state.get("carrier")))
+    # Adds modulatedSignal
+    blockResults.update(modulate(modulatorParameters, blockResults.get("modulationSignal"), blockResults.get("carrierSignal"), generalParameters))
+    # Adds recieverSignal
+    blockResults.update(channelBlock(blockResults.get("modulatedSignal"), state.get("channel")))
+
+    if blockResults.get("recieverSignal") is None:
+        return blockResults
+
+    # Local oscilator for coherent detection (delayed same as reciever signal)
+    referentSignal = delayLine(blockResults.get("carrierSignal"), len(blockResults.get("recieverSignal")), state.get("detection"))
+
+    # Adds detectedSignal
+    blockResults.update(detectionBlock(recieverParameters, blockResults.get("recieverSignal"), referentSignal, generalParameters, state.get("detection")))
+    # Adds symbolsRx, symbolsRef
+    blockResults.update(restoreBlock(blockResults.get("detectedSignal"), blockResults.get("symbolsTx"), generalParameters, state.get("restore")))
+
+    return blockResults
+
+
+def modulationBlock(generalParameters: dict, nSymbols: int, state: dict) -> dict:
+    """
+    Generate block of electrical modulation signal (voltage).
+
+    Parameters
+    -----
+    state: pulse shaping filter state
+
+    Returns
+    -----
+        bitsTx, symbolsTx, modulationSignal
+    """
+    SpS = generalParameters.get("SpS")
+    modulationOrder = generalParameters.get("Order")
+    modulationFormat = generalParameters.get("Format")
+
+    if modulationFormat == "ofdm":
+        raise Exception("OFDM is not supported in streaming simulation")
+    if generalParameters.get("Polarizations", 1) != 1:
+        raise Exception("Dual polarization is not supported in streaming simulation")
+    if generalParameters.get("FEC"):
+        raise Exception("FEC is not supported in streaming simulation")
+    if set(generalParameters.get("DSP", [])) - {"timing"}:
+        raise Exception("Only timing recovery of reciever DSP is supported in streaming simulation")
+
+    # Generate pseudo-random bit sequence
+    bitsTx = np.random.randint(2, size=int(np.log2(modulationOrder)*nSymbols))
+
+    # Generate modulated symbol sequence
+    symbolsTx = modulateGray(bitsTx, modulationOrder, modulationFormat)
+    # Power normalization (normalized by constellation power, it is the same for every block)
+    symbolsTx = symbolsTx / np.sqrt(constellationPower(modulationOrder, modulationFormat))
+
+    # Upsampling
+    symbolsUp = np.zeros(nSymbols*SpS, dtype=symbolsTx.dtype)
+    symbolsUp[0::SpS] = symbolsTx
+
+    # Pulse (NRZ by default)
+    if "pulse" not in state:
+        state.update({"pulse": pulseTaps(generalParameters.get("Pulse", "nrz"), SpS, generalParameters.get("RollOff", ROLL_OFF), generalParameters.get("BT", BT))})
+
+    # Pulse shaping
+    signalTx = firFilterBlock(state.get("pulse"), symbolsUp, state)
+
+    return {"bitsTx":bitsTx, "symbolsTx":symbolsTx, "modulationSignal":signalTx}
+
+
+def carrierBlock(sourceParameters: dict, Fs: int, samples: int, state: dict) -> dict:
+    """
+    Generate block of optical carrier signal. Phase of the carrier is carried between blocks.
+
+    Parameters
+    -----
+    Fs: sample frequency
+
+    samples: number of samples in the block
+
+    state: carrier state (Offset, Samples, random walk state of laserModel)
+
+    Returns
+    -----
+    carrierSignal
+    """
+    offset = state.get("Offset")
+    state.update({"Offset": offset + samples})
+
+    # Ideal source (one rotation over the whole signal same as idealLaser)
+    if sourceParameters.get("Ideal"):
+        power = sourceParameters.get("Power")
+        phase = 2 * np.pi * (offset + np.arange(samples)) / state.get("Samples")
+
+        return {"carrierSignal":np.sqrt(dBm2W(power)) * np.exp(1j * phase)}
+
+    else:
+        # Converts rin (dB/Hz to absolute value)
+        rin = 10**(sourceParameters.get("RIN") / 10)
+
+        # Random walk phase noise continuing from the last phase of previous block
+        return {"carrierSignal":laserModel(sourceParameters.get("Power"), sourceParameters.get("Linewidth"), rin, Fs, samples, state=state)}
+
+
+def channelBlock(modulatedSignal, elements: list) -> dict:
+    """
+    Simulates block of signal thru channel elements.
+
+    Returns
+    -----
+    recieverSignal: signal at reciever
+
+    None: in case there was a error with detection limit of amplifier and signal power
+    """
+    signal = modulatedSignal
+
+    for element in elements:
+        if element.get("Type") == "fiber":
+            signal = fiberBlock(signal, element.get("Param"), element.get("State"))
+
+        elif element.get("Type") == "amplifier":
+            # Signal power is too low
+            if element.get("Detection") is not None and not(checkPower(signal, element.get("Detection"))):
+                return {"recieverSignal":None}
+
+            signal = edfa(signal, element.get("Ideal"), element.get("Param"))
+        else: raise Exception("Unexpected error")
+
+    return {"recieverSignal":signal}
+
+
+def fiberBlock(signal, param, state: dict) -> np.ndarray:
+    """
+    Simulates block of signal thru optical fiber. Dispersion is applied with overlap-save method.
+
+    Parameters
+    -----
+    param: parameters() object (L, alpha, D, Fc, Fs)
+
+    state: overlap-save state
+
+    Returns
+    -----
+    signal (output is delayed by half of the dispersion memory, its length can differ from input)
+    """
+    # Channel with only attenuation (nonlinearity without dispersion has no memory)
+    if param.D == 0:
+        if param.gamma > 0:
+            return ssfmChannel(signal, param)
+        return attenuationChannel(signal, param)
+
+    # Prepare transfer function for the block FFT size
+    if "H" not in state:
+        memory = dispersionMemory(param)
+        Nfft = int(2**np.ceil(np.log2(max(8 * memory, 2**12))))
+        state.update({"Nfft": Nfft, "Memory": memory, "H": dispersionTransferFunction(param, Nfft)})
+        # Zeros before the signal (same output timing as the input)
+        state.update({"Buffer": np.zeros(memory // 2, dtype=complex)})
+
+    # Nonlinear fiber, segments are simulated with split-step Fourier method (dispersion memory is the guard interval)
+    if param.gamma > 0:
+        return overlapSave(signal, state, lambda segments: ssfmChannel(segments, param, axis=1))
+
+    return overlapSave(signal, state)
+
+
+def dispersionMemory(param) -> int:
+    """
+    Number of samples the dispersion spreads the signal over (even number).
+
+    Parameters
+    -----
+    param: parameters() object (L, D, Fc, Fs)
+    """
+    c_kms = const.c / 1e3
+    wavelength = c_kms / param.Fc
+    beta2 = -(param.D * wavelength**2) / (2 * np.pi * c_kms)
+
+    # Group delay spread over whole simulated bandwidth (in samples)
+    spread = abs(beta2) * param.L * 2 * np.pi * param.Fs * param.Fs
+    # Margin for side lobes of the impulse response
+    memory = int(np.ceil(1.2 * spread)) + 64
+
+    return memory + memory % 2
+
+
+def overlapSave(signal, state: dict, process=None) -> np.ndarray:
+    """
+    Overlap-save filtering with non-causal impulse response (centered around zero).
+
+    Parameters
+    -----
+    state: Nfft, Memory, H, Buffer
+
+    process: Optional. Function applied to the batch of segments (segments in rows), default is filtering with H
+
+    Returns
+    -----
+    filtered signal (only fully computed samples)
+    """
+    Nfft = state.get("Nfft")
+    memory = state.get("Memory")
+    H = state.get("H")
+
+    buffer = np.concatenate((state.get("Buffer"), signal))
+    # New samples per one FFT
+    step = Nfft - memory
+
+    nSegments = max(0, (len(buffer) - memory) // step)
+
+    # Not enough samples for one segment yet
+    if nSegments == 0:
+        state.update({"Buffer": buffer})
+        return np.empty(0, dtype=buffer.dtype)
+
+    # All segments (overlapping views of the buffer) are filtered with one batched FFT
+    segments = np.lib.stride_tricks.sliding_window_view(buffer, Nfft)[:nSegments*step:step]
+    if process is None:
+        filtered = filterSpectrum(segments, H, axis=1)
+    else:
+        filtered = process(segments)
+    # Samples without circular wrap-around
+    output = filtered[:, memory // 2 : Nfft - memory // 2].reshape(-1)
+
+    state.update({"Buffer": buffer[nSegments*step:]})
+
+    return output
+
+
+def firFilterBlock(h, x, state: dict) -> np.ndarray:
+    """
+    FIR filtering of a block with compensated filter delay (same as firFilter with mode "same").
+    The filter history is carried in the state.
+
+    Returns
+    -----
+    filtered block (first block is shorter by the filter delay)
+    """
+    if "History" not in state:
+        state.update({"History": np.zeros(len(h) - 1, dtype=x.dtype), "Delay": (len(h) - 1) // 2})
+
+    x = np.concatenate((state.get("History"), x))
+    state.update({"History": x[len(x) - (len(h) - 1):]})
+
+    y = convolveValid(x, h)
+
+    # Discard filter delay (only at the start of the signal)
+    delay = state.get("Delay")
+    if delay:
+        discarded = min(delay, len(y))
+        state.update({"Delay": delay - discarded})
+        y = y[discarded:]
+
+    return y
+
+
+def delayLine(signal, length: int, state: dict) -> np.ndarray:
+    """
+    Delays signal to match the length of already outputed reciever signal. (Carrier for local oscilator)
+
+    Parameters
+    -----
+    length: number of samples to output
+
+    state: detection state
+    """
+    buffer = np.concatenate((state.get("LoBuffer", np.zeros(0, dtype=complex)), signal))
+    state.update({"LoBuffer": buffer[length:]})
+
+    return buffer[:length]
+
+
+def detectionBlock(recieverParameters: dict, recieverSignal, referentSignal, generalParameters: dict, state: dict) -> dict:
+    """
+    Convert block of optical signal back to electrical (current). Noise and saturation are the same as photodiode,
+    only the state of the lowpass filter is kept between blocks.
+
+    Parameters
+    ----
+    referentSginal: optical signal as a signal from local oscilator for coherent detection
+
+    state: reciever filter state
+
+    Returns
+    -----
+    detectedSignal
+    """
+    paramPD = photodiodeParameters(recieverParameters, generalParameters)
+
+    if recieverParameters.get("Type") == "Photodiode":
+        signal = photodiodeCurrent(recieverSignal, paramPD)
+
+    elif recieverParameters.get("Type") == "Coherent":
+        # optical 2 x 4 90° hybrid
+        hybridSignal = hybrid_2x4_90deg(recieverSignal, referentSignal)
+
+        # balanced photodetection
+        signalI = photodiodeCurrent(hybridSignal[1, :], paramPD) - photodiodeCurrent(hybridSignal[0, :], paramPD)
+        signalQ = photodiodeCurrent(hybridSignal[2, :], paramPD) - photodiodeCurrent(hybridSignal[3, :], paramPD)
+        signal = signalI + 1j * signalQ
+
+    else: raise Exception("Unexpected error")
+
+    # Ideal photodiodes (no bandwidth limitation)
+    if paramPD.ideal:
+        return {"detectedSignal":signal}
+
+    # Lowpass filtering (filter is linear so balanced currents can be filtered together)
+    if "h" not in state:
+        state.update({"h": photodiodeTaps(paramPD)})
+
+    return {"detectedSignal":firFilterBlock(state.get("h"), signal, state)}
+
+
+def restoreBlock(detectedSignal, symbolsTx, generalParameters: dict, state: dict) -> dict:
+    """
+    Gets symbols from block of detected signal. Samples are buffered to complete symbols and aligned with transmitted symbols.
+
+    With "timing" in general parameter "DSP" symbols are sampled by Gardner timing recovery loop (its state is carried between blocks).
+
+    Parameters
+    -----
+    symbolsTx: transmitted symbols of the block
+
+    state: buffered samples and transmitted symbols
+
+    Returns
+    -----
+    symbolsRx, symbolsRef (transmitted symbols matching symbolsRx)
+    """
+    SpS = generalParameters.get("SpS")
+
+    samples = np.concatenate((state.get("detectedSignal"), detectedSignal))
+    reference = np.concatenate((state.get("symbolsTx"), symbolsTx))
+
+    # Only complete symbols which were also transmitted
+    nSymbols = min(len(samples) // SpS, len(reference))
+
+    state.update({"detectedSignal": samples[nSymbols*SpS:], "symbolsTx": reference[nSymbols:]})
+
+    if nSymbols == 0:
+        return {"symbolsRx": np.zeros(0, dtype=complex), "symbolsRef": reference[:0]}
+
+    samples = samples[:nSymbols*SpS]
+    samples = samples/np.std(samples)
+
+    if "timing" in generalParameters.get("DSP", []):
+        # Timing error detector needs signal without DC level
+        symbolsRx = gardnerRecovery(samples - samples.mean(), SpS, nSymbols, state.setdefault("timing", {}))
+        symbolsRx = symbolsRx if np.iscomplexobj(samples) else symbolsRx.real
+    else:
+        # Capture samples in the middle of signaling intervals
+        symbolsRx = samples[0::SpS]
+
+    # Subtract DC level and normalize power
+    symbolsRx = symbolsRx - symbolsRx.mean()
+    symbolsRx = pnorm(symbolsRx)
+
+    return {"symbolsRx": symbolsRx, "symbolsRef": reference[:nSymbols]}
+
+
+def updateCounters(counters: dict, blockResults: dict, generalParameters: dict):
+    """
+    Accumulate error and power values of one block.
+    """
+    modulationFormat = generalParameters.get("Format")
+    modulationOrder = generalParameters.get("Order")
+    bitsSymbol = int(np.log2(modulationOrder))
+
+    symbolsRx = blockResults.get("symbolsRx")
+    symbolsRef = blockResults.get("symbolsRef")
+    modulatedSignal = blockResults.get("modulatedSignal")
+    recieverSignal = blockResults.get("recieverSignal")
+
+    # Powers
+    counters["powerTx"] += signal_power(modulatedSignal) * len(modulatedSignal)
+    counters["samplesTx"] += len(modulatedSignal)
+    if len(recieverSignal):
+        counters["powerRx"] += signal_power(recieverSignal) * len(recieverSignal)
+        counters["samplesRx"] += len(recieverSignal)
+
+    # Too little samples for error values
+    if len(symbolsRx) < 2:
+        return
+
+    ber, ser, snr = [array[0] for array in fastBERcalc(symbolsRx, symbolsRef, modulationOrder, modulationFormat)]
+
+    nSymbols = len(symbolsRx)
+    counters["bitErrors"] += int(round(ber * nSymbols * bitsSymbol))
+    counters["symbolErrors"] += int(round(ser * nSymbols))
+    counters["noiseToSignal"] += 10**(-snr / 10) * nSymbols
+    counters["symbols"] += nSymbols
+
+
+def streamValues(counters: dict, generalParameters: dict, confidence: float = 0.95) -> dict:
+    """
+    Calculates simulation output values from accumulated counters. (Same values as getValues)
+
+    Parameters
+    -----
+    confidence: confidence level of the BER interval
+
+    Returns
+    -----
+    BER, SER, SNR, powerTxdBm, powerTxW, powerRxdBm, powerRxW, Speed, Bits, Errors, BERLow, BERHigh, BERTheory, SNRGap
+    """
+    modulationFormat = generalParameters.get("Format")
+    modulationOrder = generalParameters.get("Order")
+    Rs = generalParameters.get("Rs")
+    bitsSymbol = int(np.log2(modulationOrder))
+
+    symbols = counters.get("symbols")
+    bits = symbols * bitsSymbol
+
+    # No symbol was compared
+    if symbols == 0:
+        values = {"BER": np.nan, "SER": np.nan, "SNR": np.nan, "Bits": 0, "Errors": 0, "BERLow": 0, "BERHigh": 1, "BERTheory": np.nan, "SNRGap": np.nan}
+    else:
+        values = {"BER": counters.get("bitErrors") / bits, "SER": counters.get("symbolErrors") / symbols,
+                  "SNR": 10*np.log10(symbols / counters.get("noiseToSignal")), "Bits": bits, "Errors": counters.get("bitErrors")}
+
+        berLow, berHigh = berConfidence(counters.get("bitErrors"), bits, confidence)
+        values.update({"BERLow": berLow, "BERHigh": berHigh})
+
+        # Gap to theory
+        values.update(theoryValues(values.get("BER"), values.get("SNR"), modulationFormat, modulationOrder))
+
+    # Transmission speed
+    values.update({"Speed":calculateTransSpeed(Rs, modulationOrder)})
+
+    # Tx power [W]
+    power = counters.get("powerTx") / counters.get("samplesTx")
+    values.update({"powerTxW":power})
+    # Tx power [dBm]
+    values.update({"powerTxdBm":10*np.log10(power / 1e-3)})
+    # Rx power [W]
+    power = counters.get("powerRx") / counters.get("samplesRx")
+    values.update({"powerRxW":power})
+    # Rx power [dBm]
+    values.update({"powerRxdBm":10*np.log10(power / 1e-3)})
+
+    return values
+
+
+def berConfidence(errors: int, bits: int, confidence: float = 0.95) -> tuple[float, float]:
+    """
+    Exact (Clopper-Pearson) confidence interval of BER.
+
+    Parameters
+    -----
+    errors: number of bit errors
+
+    bits: number of compared bits
+
+    confidence: confidence level
+
+    Returns
+    -----
+    tuple (lower bound, upper bound)
+    """
+    alpha = 1 - confidence
+
+    low = beta.ppf(alpha / 2, errors, bits - errors + 1) if errors > 0 else 0.0
+    high = beta.ppf(1 - alpha / 2, errors + 1, bits - errors) if errors < bits else 1.0
+
+    return float(low), float(high)
+
+
+def constellationPower(modulationOrder: int, modulationFormat: str) -> float:
+    """
+    Average energy per symbol of the constellation.
+    """
+    const = GrayMapping(modulationOrder, modulationFormat)
+    return signal_power(const)
@@ -0,0 +1,156 @@
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import numba
+
+from scripts.simulation import simulate, getValues
+from scripts.streaming import simulateStream
+from scripts.fft_backend import setWorkers
+
+# Blocks of the communication chain (same names as in GUI)
+BLOCKS = ["General", "Source", "Modulator", "Channel", "Reciever", "Amplifier"]
+
+
+def sweep(baseParameters: dict, grid: dict, workers: int | None = None, seed: int = 123, bits: int | None = None,
+          targetErrors: int | None = None, maxTime: float | None = None) -> list[dict]:
+    """
+    Runs simulation for every combination of swept parameters in parallel processes.
+
+    Parameters
+    -----
+    baseParameters: General, Source, Modulator, Channel, Reciever, Amplifier (parameter dictionaries) and IncludeAmplifier (bool)
+
+    grid: swept values for "Block.Parameter" keys, e.g. {"Channel.Length": [10, 20, 40], "Source.Power": [0, 5, 10]}
+
+    workers: number of processes (default is number of cores)
+
+    seed: main seed, every point gets its own independent seed derived from it
+
+    bits: Optional. Number of simulated bits per point (streaming simulation), default is the same as simulate()
+
+    targetErrors: Optional. Point stops after this number of bit errors (adaptive streaming simulation, needs bits as maximum)
+
+    maxTime: Optional. Time budget of one point [s] (adaptive streaming simulation, needs bits as maximum)
+
+    Returns
+    -----
+    table: list of rows (swept parameters + Seed + BER, SER, SNR, powerTxdBm, powerTxW, powerRxdBm, powerRxW, Speed, Error)
+    """
+    points = sweepPoints(grid)
+
+    # Independent seeds for each point
+    seeds = np.random.SeedSequence(seed).generate_state(len(points))
+
+    tasks = [(baseParameters, point, int(pointSeed), bits, targetErrors, maxTime) for point, pointSeed in zip(points, seeds)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWorker) as executor:
+        table = list(executor.map(simulatePoint, tasks))
+
+    return table
+
+
+def sweepPoints(grid: dict) -> list[dict]:
+    """
+    All combinations of swept values.
+
+    Returns
+    -----
+    points: list of dictionaries {"Block.Parameter": value}
+    """
+    for key in grid:
+        block = key.split(".")[0]
+        if block not in BLOCKS:
+            raise Exception(f"Unknown block of swept parameter: {key}")
+
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def pointParameters(baseParameters: dict, point: dict) -> dict:
+    """
+    Base parameters updated with values of one sweep point. (Base parameters are not changed)
+
+    Returns
+    -----
+    parameters: General, Source, Modulator, Channel, Reciever, Amplifier, IncludeAmplifier
+    """
+    parameters = {block: dict(baseParameters.get(block)) for block in BLOCKS}
+    parameters.update({"IncludeAmplifier": baseParameters.get("IncludeAmplifier", False)})
+
+    for key, value in point.items():
+        block, name = key.split(".", 1)
+        parameters.get(block).update({name: value})
+
+    # Sampling parameters depends on symbol rate and SpS
+    general = parameters.get("General")
+    general.update({"Fs": general.get("SpS") * general.get("Rs")})
+    general.update({"Ts": 1 / general.get("Fs")})
+
+    return parameters
+
+
+def simulatePoint(task: tuple) -> dict:
+    """
+    Simulates one sweep point. (Runs in worker process)
+
+    Parameters
+    -----
+    task: (baseParameters, point, seed, bits, targetErrors, maxTime)
+
+    Returns
+    -----
+    row of the table
+    """
+    baseParameters, point, seed, bits, targetErrors, maxTime = task
+    parameters = pointParameters(baseParameters, point)
+
+    arguments = [parameters.get(block) for block in BLOCKS] + [parameters.get("IncludeAmplifier")]
+
+    if bits is None:
+        simulationResults = simulate(*arguments, seed=seed)
+        # Signal power is too low for amplifier detection
+        if simulationResults.get("recieverSignal") is None:
+            values = None
+        else:
+            values = getValues(simulationResults, parameters.get("General"))
+    else:
+        values = simulateStream(*arguments, bits=bits, seed=seed, targetErrors=targetErrors, maxTime=maxTime).get("values")
+
+    row = dict(point)
+    row.update({"Seed": seed})
+
+    if values is None:
+        row.update({"Error": "Signal power is too low to be detected by amplifier"})
+    else:
+        row.update({key: float(value) for key, value in values.items()})
+        row.update({"Error": ""})
+
+    return row
+
+
+def initWorker():
+    """
+    Worker process uses single thread. (Parallelism is given by number of processes)
+    """
+    numba.set_num_threads(1)
+    setWorkers(1)
+
+
+def saveTable(table: list[dict], path: str):
+    """
+    Saves sweep table as csv file.
+    """
+    columns = []
+    for row in table:
+        columns.extend(key for key in row if key not in columns)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(table)
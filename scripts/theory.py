@@ -0,0 +1,233 @@
+import os
+from functools import lru_cache
+import numpy as np
+
+from scripts.demapper import decisionTable, bitTable, levelProbabilities
+
+# Modulation formats and orders offered in GUI (OOK is 2-PAM)
+FORMATS = {"pam": [2, 4], "psk": [2, 4, 8, 16], "qam": [4, 16, 64, 256]}
+
+# SNR axis of the cached curves [dB]
+SNR_GRID = np.round(np.arange(-10, 40.01, 0.05), 2)
+# Directory of the cached curves
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "theory")
+# Reference bandwidth of OSNR (0.1 nm) [Hz]
+OSNR_BANDWIDTH = 12.5e9
+# Nodes of Craig's integral (PSK)
+NODES = 256
+
+
+def theoreticalBER(snr, modulationFormat: str, modulationOrder: int) -> np.ndarray:
+    """
+    Theoretical BER of Gray mapped constellation with additive white gaussian noise.
+
+    SNR has the same definition as SNR of getValues (average symbol power / noise power of the received symbols,
+    PAM and OOK noise is real). OOK is evaluated as 2-PAM (DC level is removed at the reciever).
+
+    Values are interpolated from the cached curve (SNR_GRID), SNR outside of the grid is computed directly.
+
+    Parameters
+    -----
+    snr: SNR [dB] (number or array)
+
+    Returns
+    -----
+    BER (same shape as snr)
+    """
+    snr = np.asarray(snr, dtype=np.float64)
+    grid, ber = berCurve(modulationFormat, modulationOrder)
+
+    # Interpolation of log BER (BER under 1e-300 is 0)
+    logBER = np.log10(np.maximum(ber, 1e-300))
+    result = np.atleast_1d(10**np.interp(snr, grid, logBER))
+
+    outside = np.atleast_1d((snr < grid[0]) | (snr > grid[-1]))
+    if np.any(outside):
+        result[outside] = berAWGN(np.atleast_1d(snr)[outside], modulationFormat, modulationOrder)
+    result = result.reshape(snr.shape)
+
+    return np.where(result <= 1e-300, 0, result)
+
+
+def requiredSNR(ber, modulationFormat: str, modulationOrder: int) -> np.ndarray:
+    """
+    SNR needed for BER in theory (inverse of theoreticalBER on SNR_GRID).
+
+    Returns
+    -----
+    SNR [dB] (nan for BER out of the curve, e.g. 0)
+    """
+    ber = np.asarray(ber, dtype=np.float64)
+    grid, curve = berCurve(modulationFormat, modulationOrder)
+
+    # Curve is decreasing, interpolation needs increasing values
+    used = curve > 1e-300
+    logCurve = np.log10(curve[used])[::-1]
+    logBER = np.log10(np.maximum(ber, 1e-300))
+    snr = np.interp(logBER, logCurve, grid[used][::-1])
+
+    return np.where((logBER < logCurve[0]) | (logBER > logCurve[-1]), np.nan, snr)
+
+
+def theoryValues(ber: float, snr: float, modulationFormat: str, modulationOrder: int) -> dict:
+    """
+    Comparison of measured values with theory.
+
+    Returns
+    -----
+    BERTheory: theoretical BER at measured SNR (nan if theoretical curve isn't available for the format and order)
+
+    SNRGap: measured SNR - SNR theoretically needed for measured BER [dB] (implementation penalty, nan without errors or curve)
+    """
+    # OFDM subcarriers are QAM
+    modulationFormat = "qam" if modulationFormat == "ofdm" else modulationFormat
+
+    # Gap to theory is optional (formats and orders out of FORMATS)
+    if not theoryAvailable(modulationFormat, modulationOrder):
+        return {"BERTheory": np.nan, "SNRGap": np.nan}
+
+    return {"BERTheory": float(theoreticalBER(snr, modulationFormat, modulationOrder)),
+            "SNRGap": float(snr - requiredSNR(ber, modulationFormat, modulationOrder))}
+
+
+def theoryAvailable(modulationFormat: str, modulationOrder: int) -> bool:
+    """
+    Theoretical curve exists for the format and order (FORMATS, OOK is 2-PAM).
+    """
+    if modulationFormat == "ook":
+        return True
+
+    return modulationOrder in FORMATS.get(modulationFormat, [])
+
+
+def osnrToSNR(osnr, Rs: float, polarizations: int = 1) -> np.ndarray:
+    """
+    Converts OSNR (reference bandwidth 0.1 nm, noise of both polarizations) to SNR of the received symbols.
+
+    Parameters
+    -----
+    osnr: OSNR [dB]
+
+    Rs: symbol rate [Bd]
+
+    polarizations: number of polarizations of the signal
+
+    Returns
+    -----
+    SNR [dB]
+    """
+    return np.asarray(osnr) + 10*np.log10(2 * OSNR_BANDWIDTH / (polarizations * Rs))
+
+
+@lru_cache(maxsize=None)
+def berCurve(modulationFormat: str, modulationOrder: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Theoretical BER curve on SNR_GRID. Curve is loaded from disk, computed and saved when it isn't cached yet.
+
+    Returns
+    -----
+    tuple (snr, ber)
+    """
+    if modulationFormat == "ook":
+        modulationFormat, modulationOrder = "pam", 2
+
+    if not theoryAvailable(modulationFormat, modulationOrder):
+        raise Exception(f"Theoretical BER is not available for {modulationFormat.upper()} {modulationOrder}")
+
+    path = os.path.join(CACHE_DIRECTORY, f"{modulationFormat}{modulationOrder}.npz")
+
+    # Cached curve (with the same SNR axis)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            if np.array_equal(data["snr"], SNR_GRID):
+                return SNR_GRID, data["ber"]
+
+    ber = berAWGN(SNR_GRID, modulationFormat, modulationOrder)
+
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    # Written under temporary name first (parallel sweep workers)
+    temporary = f"{path}.{os.getpid()}.npz"
+    np.savez(temporary, snr=SNR_GRID, ber=ber)
+    os.replace(temporary, path)
+
+    return SNR_GRID, ber
+
+
+def berAWGN(snr, modulationFormat: str, modulationOrder: int) -> np.ndarray:
+    """
+    Theoretical BER computed for all SNR values at once (exact Gray mapping, all decision regions).
+
+    PAM and QAM: probabilities of decision intervals of levels (erfc), QAM levels of I and Q are independent.
+
+    PSK: probabilities of phase sectors by Craig's integral (P(phase > angle) = 1/2pi * int_0^(pi-angle) exp(-snr*sin^2(angle)/sin^2(phi)) dphi).
+
+    Parameters
+    -----
+    snr: SNR [dB] (array)
+
+    Returns
+    -----
+    BER (same shape as snr)
+    """
+    snr = np.asarray(snr, dtype=np.float64)
+    snrLin = 10**(snr.reshape(-1) / 10)
+
+    M = modulationOrder
+    if modulationFormat == "ook":
+        M = 2
+        modulationFormat = "pam"
+
+    const, grid, step, start = decisionTable(M, modulationFormat)
+    Es = np.mean(np.abs(const)**2)
+    bitsSymbol = int(np.log2(M))
+    bitMap = bitTable(M)
+    # Hamming distances of all pairs of points
+    hamming = np.sum(bitMap[:, np.newaxis, :] != bitMap[np.newaxis, :, :], axis=2)
+
+    if modulationFormat in ["pam", "qam"]:
+        levels = start + step * np.arange(grid.shape[0])
+        L = len(levels)
+        # Noise of one dimension (QAM noise power is split into I and Q)
+        sigma = np.sqrt(Es / snrLin / (1 if modulationFormat == "pam" else 2))
+
+        # Probabilities of decided levels for every sent level (snr x sent x decided)
+        probability = levelProbabilities(np.tile(levels, len(snrLin)), np.repeat(sigma, L), levels).reshape(-1, L, L)
+
+        if modulationFormat == "pam":
+            # Errors of points sorted by level
+            errors = np.einsum("sad,ad->s", probability, hamming[grid][:, grid])
+        else:
+            # Hamming distances of points on the level grid (sent I x sent Q x decided I x decided Q)
+            distances = hamming[grid.reshape(-1)][:, grid.reshape(-1)].reshape(L, L, L, L)
+            errors = np.einsum("sai,sbj,abij->s", probability, probability, distances, optimize=True)
+
+        ber = errors / (M * bitsSymbol)
+
+    elif modulationFormat == "psk":
+        # Boundaries of sectors at phase offsets 1 .. M/2 of the sent phase
+        boundaries = (2 * np.arange(1, M // 2 + 1) - 1) * np.pi / M
+        # Gauss-Legendre nodes on (0, pi - boundary)
+        nodes, weights = np.polynomial.legendre.leggauss(NODES)
+        width = (np.pi - boundaries)[:, np.newaxis] / 2
+        phi = width * (nodes + 1)
+
+        exponent = -snrLin[:, np.newaxis, np.newaxis] * (np.sin(boundaries)**2)[:, np.newaxis] / np.sin(phi)**2
+        # Probability of phase beyond each boundary (snr x boundaries)
+        beyond = np.sum(np.exp(exponent) * weights * width, axis=2) / (2 * np.pi)
+
+        # Probabilities of sectors at offsets 1 .. M/2 (opposite sector is beyond the last boundary on both sides)
+        sectors = np.concatenate((beyond[:, :-1] - beyond[:, 1:], 2 * beyond[:, -1:]), axis=1)
+
+        # Hamming distances of points with phase offsets (averaged over sent points, same for +- offsets)
+        offsets = np.arange(1, M // 2 + 1)
+        distances = np.mean(hamming[grid[:, np.newaxis], grid[(np.arange(M)[:, np.newaxis] + offsets) % M]], axis=0)
+        distancesBack = np.mean(hamming[grid[:, np.newaxis], grid[(np.arange(M)[:, np.newaxis] - offsets) % M]], axis=0)
+        # Sectors at +- offset have the same probability (opposite sector is only one)
+        weights = distances + distancesBack
+        weights[-1] = distances[-1]
+
+        ber = np.sum(sectors * weights, axis=1) / bitsSymbol
+
+    else: raise Exception("Unexpected error")
+
+    return ber.reshape(snr.shape)
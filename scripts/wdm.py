@@ -0,0 +1,217 @@
+import numpy as np
+
+from scripts.simulation import (modulationSignal, carrierSignal, modulate, fiberTransmition, detection, restoreInformation, getValues,
+                                reportProgress, channelElements, linkDispersion)
+from scripts.other_functions import setSeed
+from scripts.fft_backend import fft, ifft, fftfreq
+
+
+def simulateWDM(generalParameters: dict, sourceParameters: dict, modulatorParameters: dict, channelParameters: dict, recieverParameters: dict,
+                amplifierParameters: dict, includeAmplifier: bool, wdmParameters: dict, progress=None, seed: int = 123, precision: str = "double") -> dict:
+    """
+    Simulate WDM communication. All channels have the same parameters (source power is power of each channel).
+
+    Channels are generated as one batch (channels x samples), combined on a common wideband grid,
+    propagated thru the fiber at once and demultiplexed with batched filtering.
+
+    Parameters
+    -----
+    wdmParameters: Channels (number of channels), Spacing (channel spacing [GHz]), Symbols (Optional. number of symbols of each channel)
+
+    progress: Optional. Function progress(stage, fraction) called before each stage.
+
+    seed: seed of random numbers
+
+    precision: "double" / "single" precision of the signals
+
+    Returns
+    -----
+    dictionary
+
+        - channels: list of simulationResults of each channel (same as simulate() results, recieverSignal is signal after demultiplexer)
+        - wdmTx: combined signal at Tx (wideband grid)
+        - wdmRx: combined signal at Rx (wideband grid), None in case there was a error with detection limit of amplifier and signal power
+        - FsWDM: sampling frequency of the wideband grid
+
+    """
+    setSeed(seed)
+
+    channels = wdmParameters.get("Channels")
+    spacing = wdmParameters.get("Spacing") * 10**9
+    symbols = wdmParameters.get("Symbols", 10**6)
+
+    Fs = generalParameters.get("Fs")
+    # Correct units (THz -> Hz)
+    frequency = sourceParameters.get("Frequency")*10**12
+
+    # Batch of channels (channels x samples)
+    reportProgress(progress, "Modulation signal", 0/6)
+    modulationResults = modulationSignal(generalParameters, precision, channels, symbols)
+    batch = {key: np.atleast_2d(value) for key, value in modulationResults.items()}
+
+    reportProgress(progress, "Carrier signal", 1/6)
+    batch.update({key: np.atleast_2d(value) for key, value in carrierSignal(sourceParameters, Fs, batch.get("modulationSignal")).items()})
+
+    reportProgress(progress, "Modulation", 2/6)
+    batch.update(modulate(modulatorParameters, batch.get("modulationSignal"), batch.get("carrierSignal"), generalParameters))
+
+    # Combining channels
+    samples = batch.get("modulatedSignal").shape[1]
+    oversampling = wdmOversampling(channels, spacing, Fs)
+    offsets = channelOffsets(channels, spacing, Fs, samples)
+    wdmTx = multiplex(batch.get("modulatedSignal"), offsets, oversampling)
+
+    reportProgress(progress, "Fiber transmition", 3/6)
+    wdmRx = fiberTransmition(channelParameters, amplifierParameters, wdmTx, Fs * oversampling, frequency, includeAmplifier,
+                             generalParameters.get("ImportanceSampling", 1)).get("recieverSignal")
+
+    results = {"channels": [], "wdmTx": wdmTx, "wdmRx": wdmRx, "FsWDM": Fs * oversampling}
+
+    # Error with amplifier detection (signal is too low)
+    if wdmRx is None:
+        return results
+
+    # Accumulated dispersion of the link (walk-off of channels)
+    elements = channelElements(channelParameters, amplifierParameters, Fs * oversampling, frequency, includeAmplifier)
+    dispersion = linkDispersion(elements)
+
+    recieverSignals = demultiplex(wdmRx, offsets, samples, spacing, Fs, dispersion)
+
+    reportProgress(progress, "Detection", 4/6)
+    for k in range(channels):
+        simulationResults = {key: value[k] for key, value in batch.items()}
+        simulationResults.update({"recieverSignal": recieverSignals[k]})
+        simulationResults.update(detection(recieverParameters, recieverSignals[k], simulationResults.get("carrierSignal"), generalParameters))
+        simulationResults.update(restoreInformation(simulationResults.get("detectedSignal"), generalParameters, simulationResults.get("symbolsTx"), dispersion))
+        results.get("channels").append(simulationResults)
+
+    reportProgress(progress, "Done", 1)
+
+    return results
+
+
+def wdmValues(wdmResults: dict, generalParameters: dict, estimator: str = "counting") -> list[dict]:
+    """
+    Output values of each channel (same as getValues).
+
+    Parameters
+    -----
+    estimator: BER estimator of getValues ("counting" / "semianalytic")
+
+    Returns
+    -----
+    list of values (BER, SER, SNR, powerTxdBm, powerTxW, powerRxdBm, powerRxW, Speed)
+    """
+    return [getValues(simulationResults, generalParameters, estimator) for simulationResults in wdmResults.get("channels")]
+
+
+def wdmOversampling(channels: int, spacing: float, Fs: float) -> int:
+    """
+    Oversampling of the wideband grid (power of 2), grid covers all channels.
+
+    Parameters
+    -----
+    spacing: channel spacing [Hz]
+
+    Fs: sampling frequency of one channel
+    """
+    bandwidth = (channels - 1) * spacing + Fs
+
+    return int(2**np.ceil(np.log2(bandwidth / Fs)))
+
+
+def channelOffsets(channels: int, spacing: float, Fs: float, samples: int) -> np.ndarray:
+    """
+    Frequency offsets of channels from the central frequency in FFT bins (channels are symmetrical around central frequency).
+
+    Parameters
+    -----
+    samples: number of samples of one channel (bin is Fs / samples)
+    """
+    frequencies = (np.arange(channels) - (channels - 1) / 2) * spacing
+
+    return np.rint(frequencies / (Fs / samples)).astype(np.int64)
+
+
+def multiplex(signals, offsets: np.ndarray, oversampling: int) -> np.ndarray:
+    """
+    Combines baseband signals of channels into one wideband signal. Spectra are shifted by whole bins (exact frequency shift).
+
+    Parameters
+    -----
+    signals: channels x samples
+
+    offsets: frequency offsets of channels [bins]
+
+    oversampling: sampling frequency of wideband grid / sampling frequency of channel
+
+    Returns
+    -----
+    wideband signal (samples * oversampling)
+    """
+    channels, samples = signals.shape
+    wideSamples = samples * oversampling
+
+    # Spectra of all channels at once
+    spectra = fft(signals, axis=1)
+
+    # Bins of baseband spectrum (negative frequencies are negative bins)
+    bins = fftfreq(samples, 1 / samples).astype(np.int64)
+
+    wideSpectrum = np.zeros(wideSamples, dtype=spectra.dtype)
+    for k in range(channels):
+        # Neighbouring channels can overlap (spectra are added)
+        wideSpectrum[(bins + offsets[k]) % wideSamples] += spectra[k]
+
+    # Same amplitude as the channel signals (longer inverse FFT)
+    wideSpectrum *= oversampling
+
+    return ifft(wideSpectrum, overwrite=True)
+
+
+def demultiplex(signal, offsets: np.ndarray, samples: int, spacing: float, Fs: float, dispersion: float = 0) -> np.ndarray:
+    """
+    Splits wideband signal into baseband signals of channels. Channels are filtered by rectangular optical filter (width is channel spacing).
+    Group delay of each channel caused by dispersion (walk-off) is removed (ideal clock recovery of each channel).
+
+    Parameters
+    -----
+    signal: wideband signal
+
+    offsets: frequency offsets of channels [bins]
+
+    samples: number of samples of one channel
+
+    spacing: channel spacing [Hz]
+
+    Fs: sampling frequency of one channel
+
+    dispersion: accumulated dispersion of the link, sum of beta2 * L [s^2]
+
+    Returns
+    -----
+    baseband signals (channels x samples)
+    """
+    wideSamples = len(signal)
+    oversampling = wideSamples // samples
+
+    wideSpectrum = fft(signal)
+
+    bins = fftfreq(samples, 1 / samples).astype(np.int64)
+    # Bins of all channels at once (channels x samples)
+    spectra = wideSpectrum[(bins[np.newaxis, :] + offsets[:, np.newaxis]) % wideSamples]
+
+    # Demultiplexer filter
+    frequencies = bins * (Fs / samples)
+    spectra *= (np.abs(frequencies) <= spacing / 2).astype(spectra.real.dtype)
+
+    # Group delay of channel k is dispersion * omega_k (linear phase in its baseband spectrum)
+    if dispersion != 0:
+        omega = 2 * np.pi * frequencies
+        omegaChannels = 2 * np.pi * offsets * (Fs / samples)
+        spectra *= np.exp(-1j * dispersion * omegaChannels[:, np.newaxis] * omega[np.newaxis, :]).astype(spectra.dtype, copy=False)
+
+    # Same amplitude as the channel signals (shorter inverse FFT)
+    spectra /= oversampling
+
+    return ifft(spectra, axis=1, overwrite=True)